@@ -1,26 +1,241 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, simpledialog
-from PIL import Image, ImageTk
+from tkinter import ttk, filedialog, messagebox
+import logging
 import os
+import queue
+import threading
+import time
 from datetime import datetime
-from docx import Document
-from docx.shared import Pt
 import sys
+from app_paths import LOGO_PATH_LEFT, LOGO_PATH_RIGHT
+from job_history import JOB_HISTORY, REPORT_DATE_FORMAT, parse_report_date
+from logo_cache import load_logo
+from tracing import configure_logging, span
+
+log = logging.getLogger(__name__)
+
+# python-docx, NumPy, PIL and the report modules are imported where they are first
+# used, so the main window comes up without paying for them
+
+# Longest a Next/Back step change may take, one frame at 60 Hz
+STEP_TRANSITION_BUDGET_MS = 16
+
+# How often the wizard checks on a report being generated in the background
+REPORT_POLL_MS = 100
+REPORT_PHASE_LABELS = {
+    "load": "Loading template...",
+    "substitute": "Filling in the report...",
+    "save": "Saving report...",
+}
+
+# Longest the VNA may take to recall a setup, in seconds
+VNA_RECALL_TIMEOUT = 15
+
+# Most setups listed by the recall search; narrow the filters to see others
+SETUP_SEARCH_LIMIT = 200
+ANY_CONNECTOR = "Any"
+
+def recall_setup_on_vna(file_name, results):
+    """Load a setup file on the VNA over SCPI, then put ("done", None) or ("error", message) on results.
+
+    Blocks for up to VNA_RECALL_TIMEOUT, so it runs on a worker thread.
+    """
+    from vna_scpi import ScpiError, recall_state_file
+    try:
+        recall_state_file(os.path.abspath(file_name), timeout=VNA_RECALL_TIMEOUT)
+    except (OSError, ScpiError) as e:
+        log.error("Could not recall %s on the VNA: %s", file_name, e)
+        results.put(("error", str(e)))
+        return
+    results.put(("done", None))
 
 # Function to recall VNA Setup File
 def recall_vna_setup_file():
-    """Open a dialog to select a VNA Setup file (.STA or any file)."""
-    filetypes = [("VNA Setup Files", "*.STA"), ("All files", "*.*")]
-    
-    file_name = filedialog.askopenfilename(
-        title="Select your VNA Setup File to load",
-        filetypes=filetypes
-    )
-    
-    if file_name:
-        messagebox.showinfo("File Loaded", f"{file_name} loaded successfully")
-    else:
-        messagebox.showwarning("No File Selected", "No file was selected!")
+    """Open the setup library search to pick a VNA Setup file (.STA) and load it on the VNA over SCPI."""
+    SetupRecallDialog(tk.Toplevel())
+
+class SetupRecallDialog:
+    """Search the indexed setup library by job card, connector and date, and recall the chosen setup.
+
+    The setups already indexed are listed straight away while the index is
+    brought up to date on a background thread; Browse... still opens a file
+    dialog for setups outside the library. The recall itself also runs on a
+    worker thread, so the window stays responsive while the VNA loads.
+    """
+
+    COLUMNS = (("name", "Setup", 230), ("job_card", "Job Card", 90), ("connectors", "Connectors", 80),
+               ("modified", "Modified", 80), ("folder", "Folder", 240))
+
+    def __init__(self, master):
+        from setup_library import SETUP_LIBRARY
+        self.master = master
+        self.library = SETUP_LIBRARY
+        self.refresh_queue = queue.Queue()
+        self.refreshing = False
+        self.recall_queue = queue.Queue()
+        self.recalling = None
+        self.index_status = ""
+        self.results_status = ""
+        master.title("Recall VNA Setup File")
+        master.geometry("760x460")
+
+        filters = tk.Frame(master)
+        filters.pack(fill=tk.X, padx=10, pady=(10, 5))
+        self.search_var = tk.StringVar()
+        self.connector_var = tk.StringVar(value=ANY_CONNECTOR)
+        self.since_var = tk.StringVar()
+        self.until_var = tk.StringVar()
+        tk.Label(filters, text="Job card / name:", font=("Arial", 10)).grid(row=0, column=0, sticky="w")
+        search_entry = tk.Entry(filters, textvariable=self.search_var, width=24)
+        search_entry.grid(row=0, column=1, sticky="w", padx=5)
+        tk.Label(filters, text="Connector:", font=("Arial", 10)).grid(row=0, column=2, sticky="w", padx=(15, 0))
+        ttk.Combobox(filters, textvariable=self.connector_var, values=[ANY_CONNECTOR] + JOB_HISTORY.connectors(),
+                     state="readonly", width=8).grid(row=0, column=3, sticky="w", padx=5)
+        tk.Label(filters, text="Modified from (DD/MM/YYYY):", font=("Arial", 10)).grid(row=1, column=0, sticky="w",
+                                                                                     pady=(5, 0))
+        tk.Entry(filters, textvariable=self.since_var, width=12).grid(row=1, column=1, sticky="w", padx=5, pady=(5, 0))
+        tk.Label(filters, text="to:", font=("Arial", 10)).grid(row=1, column=2, sticky="w", padx=(15, 0), pady=(5, 0))
+        tk.Entry(filters, textvariable=self.until_var, width=12).grid(row=1, column=3, sticky="w", padx=5, pady=(5, 0))
+        for var in (self.search_var, self.connector_var, self.since_var, self.until_var):
+            var.trace_add("write", self.update_results)
+
+        results = tk.Frame(master)
+        results.pack(fill=tk.BOTH, expand=True, padx=10)
+        self.tree = ttk.Treeview(results, columns=[column for column, _, _ in self.COLUMNS], show="headings",
+                                 selectmode="browse")
+        for column, heading, width in self.COLUMNS:
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, anchor="w")
+        scrollbar = ttk.Scrollbar(results, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.bind("<Double-1>", self.recall_selected)
+
+        self.status_label = tk.Label(master, anchor="w", font=("Arial", 9))
+        self.status_label.pack(fill=tk.X, padx=10, pady=(5, 0))
+        buttons = tk.Frame(master)
+        buttons.pack(pady=10)
+        self.recall_button = tk.Button(buttons, text="Recall", command=self.recall_selected)
+        self.recall_button.pack(side=tk.LEFT, padx=5)
+        self.browse_button = tk.Button(buttons, text="Browse...", command=self.browse)
+        self.browse_button.pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Add Folder...", command=self.add_folder).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Rescan", command=self.refresh).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Close", command=master.destroy).pack(side=tk.LEFT, padx=5)
+
+        self.update_results()
+        self.refresh()
+        search_entry.focus_set()
+
+    def show_status(self):
+        self.status_label.config(text="   ".join(filter(None, (self.results_status, self.index_status))))
+
+    def update_results(self, *args):
+        """Run the search for the current filters; dates that do not parse yet are ignored."""
+        connector = self.connector_var.get()
+        start = time.perf_counter()
+        setups = self.library.search(job_card=self.search_var.get().strip() or None,
+                                     connector=None if connector == ANY_CONNECTOR else connector,
+                                     since=parse_report_date(self.since_var.get().strip()),
+                                     until=parse_report_date(self.until_var.get().strip()), limit=SETUP_SEARCH_LIMIT)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.tree.delete(*self.tree.get_children())
+        for setup in setups:
+            self.tree.insert("", tk.END, iid=setup.path,
+                             values=(setup.name, setup.job_card or "", ", ".join(setup.connectors),
+                                     setup.modified.strftime(REPORT_DATE_FORMAT), os.path.dirname(setup.path)))
+        more = " (first shown, narrow the search)" if len(setups) == SETUP_SEARCH_LIMIT else ""
+        self.results_status = f"{len(setups)} setup(s){more} in {elapsed_ms:.0f} ms."
+        self.show_status()
+
+    def refresh(self):
+        """Bring the index up to date on a background thread; only changed files are read."""
+        if self.refreshing:
+            return
+        self.refreshing = True
+        self.index_status = "Updating the setup index..."
+        self.show_status()
+        connectors = JOB_HISTORY.connectors()
+
+        def run():
+            try:
+                self.refresh_queue.put(("done", self.library.refresh(connectors=connectors)))
+            except Exception as e:
+                log.exception("Setup index update failed")
+                self.refresh_queue.put(("error", str(e)))
+
+        threading.Thread(target=run, name="setup-index", daemon=True).start()
+        self.master.after(REPORT_POLL_MS, self.poll_refresh)
+
+    def poll_refresh(self):
+        if not self.master.winfo_exists():
+            return
+        try:
+            kind, value = self.refresh_queue.get_nowait()
+        except queue.Empty:
+            self.master.after(REPORT_POLL_MS, self.poll_refresh)
+            return
+        self.refreshing = False
+        if kind == "done":
+            self.index_status = f"{len(self.library)} setup(s) indexed."
+            if value["unreachable"]:
+                self.index_status += f" {value['unreachable']} folder(s) could not be reached."
+        else:
+            self.index_status = f"Could not update the setup index: {value}"
+        self.update_results()
+
+    def recall_selected(self, event=None):
+        selection = self.tree.selection()
+        if not selection:
+            messagebox.showwarning("No Setup Selected", "Select a setup in the list first.", parent=self.master)
+            return
+        self.recall(selection[0])
+
+    def browse(self):
+        file_name = filedialog.askopenfilename(parent=self.master, title="Select your VNA Setup File to load",
+                                               filetypes=[("VNA Setup Files", "*.STA"), ("All files", "*.*")])
+        if file_name:
+            self.recall(file_name)
+
+    def recall(self, file_name):
+        """Load file_name on the VNA on a worker thread; the dialog closes once it is loaded."""
+        if self.recalling:
+            return
+        self.recalling = file_name
+        self.recall_button.config(state=tk.DISABLED)
+        self.browse_button.config(state=tk.DISABLED)
+        self.results_status = f"Loading {os.path.basename(file_name)} on the VNA..."
+        self.show_status()
+        threading.Thread(target=recall_setup_on_vna, args=(file_name, self.recall_queue), name="setup-recall",
+                         daemon=True).start()
+        self.master.after(REPORT_POLL_MS, self.poll_recall)
+
+    def poll_recall(self):
+        if not self.master.winfo_exists():
+            return
+        try:
+            kind, value = self.recall_queue.get_nowait()
+        except queue.Empty:
+            self.master.after(REPORT_POLL_MS, self.poll_recall)
+            return
+        file_name, self.recalling = self.recalling, None
+        if kind == "done":
+            messagebox.showinfo("File Loaded", f"{file_name} loaded successfully", parent=self.master)
+            self.master.destroy()
+            return
+        messagebox.showerror("Recall Failed", f"Could not load {file_name} on the VNA. "
+                             f"Check that the Network Analyzer software is running with its SCPI socket server enabled.\n\n{value}",
+                             parent=self.master)
+        self.recall_button.config(state=tk.NORMAL)
+        self.browse_button.config(state=tk.NORMAL)
+        self.update_results()
+
+    def add_folder(self):
+        directory = filedialog.askdirectory(parent=self.master, title="Add a folder of VNA setup files")
+        if directory:
+            self.library.add_directory(directory)
+            self.refresh()
 
 # Function to launch the MultiStepWizard
 def launch_report_wizard_wrapper():
@@ -29,30 +244,23 @@ def launch_report_wizard_wrapper():
     wizard_window.title("Report Generator Wizard")
     wizard_window.geometry("500x400")
     wizard = MultiStepWizard(wizard_window, {})
-    wizard_window.mainloop()
 
 # Main GUI window
-def main_gui():
-    root = tk.Tk()
+def build_main_window(root, logo_path_left=None, logo_path_right=None):
+    """Create the main window's widgets on root."""
     root.title("VNA Setup and Report Generator")
     root.configure(bg='white')
 
-    # Load and resize the logos
-    logo_path_left = r"C:/Users/davidf/OneDrive - glenairukltd.onmicrosoft.com/Documents/VNA Report Writer/glenair-logo-new.png"
-    logo_path_right = r"C:/Users/davidf/OneDrive - glenairukltd.onmicrosoft.com/Documents/VNA Report Writer/Keysight P5004B.jpg"
-
-    logo_image_left = Image.open(logo_path_left)
-    logo_image_left = logo_image_left.resize((int(logo_image_left.width / 4), int(logo_image_left.height / 4)), Image.Resampling.LANCZOS)
-    logo_photo_left = ImageTk.PhotoImage(logo_image_left)
-
-    logo_image_right = Image.open(logo_path_right)
-    logo_image_right = logo_image_right.resize((int(logo_image_right.width / 4), int(logo_image_right.height / 4)), Image.Resampling.LANCZOS)
-    logo_photo_right = ImageTk.PhotoImage(logo_image_right)
+    # Load the logos, pre-scaled to 1/4 from the local logo cache
+    logo_photo_left = load_logo(logo_path_left or LOGO_PATH_LEFT)
+    logo_photo_right = load_logo(logo_path_right or LOGO_PATH_RIGHT)
 
     # Create widgets
     title_label = tk.Label(root, text="VNA Setup and Report Generator", font=("Arial", 16, "bold"), bg='blue', fg='white')
-    logo_label_left = tk.Label(root, image=logo_photo_left, bg='white')
-    logo_label_right = tk.Label(root, image=logo_photo_right, bg='white')
+    logo_label_left = tk.Label(root, image=logo_photo_left, bg='white') if logo_photo_left else tk.Label(root, text="Glenair", bg='white')
+    logo_label_right = tk.Label(root, image=logo_photo_right, bg='white') if logo_photo_right else tk.Label(root, text="Keysight P5004B", bg='white')
+    # Tk does not hold a reference to its images
+    root.logo_photos = (logo_photo_left, logo_photo_right)
 
     # Place widgets in grid
     title_label.grid(row=1, column=1, padx=10, pady=10, sticky='n')
@@ -71,7 +279,21 @@ def main_gui():
     recall_vna_button.pack(side='left', padx=20)
     generate_report_button.pack(side='right', padx=20)
 
+def resume_write_back():
+    """Restart copies of reports to the shared folder left pending by the last session."""
+    from shared_folder import WRITE_BACK
+    WRITE_BACK.resume()
+
+def main_gui():
+    configure_logging()
+    root = tk.Tk()
+    build_main_window(root)
+    root.after_idle(resume_write_back)
     root.mainloop()
+    # Give reports still being copied to the shared folder a moment; the rest resume next start
+    from shared_folder import WRITE_BACK
+    if not WRITE_BACK.flush(timeout=10):
+        log.warning("%d report(s) not copied to the shared folder yet", WRITE_BACK.pending())
 
 # MultiStepWizard class definition
 class MultiStepWizard:
@@ -80,6 +302,9 @@ class MultiStepWizard:
         self.master.geometry("500x400")
         self.content_frame = tk.Frame(master)
         self.content_frame.pack(pady=20, padx=20, expand=True, fill=tk.BOTH)
+        # Every step frame sits in the same cell; the current one is raised to the top
+        self.content_frame.grid_rowconfigure(0, weight=1)
+        self.content_frame.grid_columnconfigure(0, weight=1)
 
         self.stored_values = stored_values
         self.selected_options = stored_values.get("selected_options", set())
@@ -91,18 +316,34 @@ class MultiStepWizard:
         self.single_port_measurement = stored_values.get("single_port_measurement", False)
         self.tickbox_selected = stored_values.get("tickbox_selected", set())  # Tickbox state
 
-        # Initialize calibration_data and set default values
+        # Initialize calibration_data with the calibrations used last
         if "calibration_data" not in self.stored_values:
-            self.stored_values["calibration_data"] = {"data1": "XNA34 Jun23-Jun25", "data2": "XRA11 Jun23-Jun25"}
+            self.stored_values["calibration_data"] = {"data1": self.default_calibration("vna"),
+                                                      "data2": self.default_calibration("ecal")}
         self.report_date = stored_values.get("report_date", datetime.today().strftime('%d/%m/%Y'))
 
-        self.current_step = "step_1"
+        self.current_step = None
         self.job_card_entry = None
 
         # Updated steps order
         self.steps_order = ["step_1", "step_2", "job_card", "vna_connectors", "calibration_data", "report_date", "review"]
         self.step_index = 0
 
+        # Each screen: (build widgets once, copy stored_values into the widgets, copy the widgets back)
+        self.screens = {
+            "step_1": (self.create_user_selection_step, self.bind_user_selection_step, self.unbind_user_selection_step),
+            "step_2": (self.create_option_selection_step, self.bind_option_selection_step, None),
+            "job_card": (self.create_job_card_step, self.bind_job_card_step, self.capture_job_card_number),
+            "vna_connectors": (self.create_vna_connector_step, self.bind_vna_connector_step, self.unbind_vna_connector_step),
+            "calibration_data": (self.create_calibration_data_step, self.bind_calibration_data_step, self.unbind_calibration_data_step),
+            "report_date": (self.create_report_date_step, self.bind_report_date_step, self.unbind_report_date_step),
+            "review": (self.create_review_step, self.bind_review_step, None),
+            "generating": (self.create_generating_step, self.bind_generating_step, None),
+            "final_message": (self.create_final_step_message, self.start_export_watcher, None),
+        }
+        self.step_frames = {}  # Built lazily on the first visit, then kept
+        self.transition_times = []  # (step, milliseconds) for every step change
+
         # Button frame to keep buttons at the bottom
         self.button_frame = tk.Frame(master)
         self.button_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=10)
@@ -115,157 +356,227 @@ class MultiStepWizard:
 
         self.template_path = None  # Track the selected template path
 
-        self.create_user_selection_step()
+        # Measurements collected from the VNA export folder, journalled per serial number
+        self.export_watcher = None
+        self.incremental_report = None
+        self.measurement_store = None  # Compact copy of every trace collected, for the whole job card
+        self.history_report_id = None  # Row of the generated report in the job history
+        self.report_job = None  # Report being generated in the background
+        self.open_job = None  # Measurement session being set up
+        self.close_job = None  # Measurement session being wound up when the wizard closes
+        self.master.protocol("WM_DELETE_WINDOW", self.close_wizard)
+
+        self.show_step("step_1")
+
+    def show_step(self, step):
+        """Raise the frame of a step, building it on its first visit.
+
+        The step being left writes its widgets back into stored_values and the new
+        one reads stored_values into its widgets, so no widget is rebuilt.
+        """
+        start = time.perf_counter()
+        if self.current_step in self.screens:
+            unbind = self.screens[self.current_step][2]
+            if unbind is not None:
+                unbind()
+
+        create, bind, _ = self.screens[step]
+        frame = self.step_frames.get(step)
+        if frame is None:
+            log.debug("Building step frame: %s", step)
+            frame = tk.Frame(self.content_frame)
+            frame.grid(row=0, column=0, sticky="nsew")
+            with span("build_step", step=step):
+                create(frame)
+            self.step_frames[step] = frame
+        self.current_step = step
+        bind()
+        frame.tkraise()
+        self.configure_step_buttons(step)
+        self.master.update_idletasks()
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.transition_times.append((step, elapsed_ms))
+        if elapsed_ms > STEP_TRANSITION_BUDGET_MS:
+            log.warning("Showed step %s in %.1f ms (over the %d ms budget)", step, elapsed_ms, STEP_TRANSITION_BUDGET_MS)
+        else:
+            log.debug("Showed step %s in %.1f ms", step, elapsed_ms)
 
-    def create_user_selection_step(self):
-        print("[DEBUG] Creating Step 1: User Selection")
-        self.clear_content_frame()
-        self.current_step = "step_1"
+    def configure_step_buttons(self, step):
+        """Set up the Back and Next buttons for a step."""
+        if step == "step_1":
+            self.configure_buttons(back_disabled=True, next_text="Next", next_command=self.next)
+        elif step == "review":
+            self.configure_buttons(back_disabled=False, next_text="Finish", next_command=self.finish)
+        elif step == "generating":
+            self.configure_buttons(back_disabled=True, next_text="Cancel", next_command=self.cancel_report)
+        elif step == "final_message":
+            self.configure_buttons(back_disabled=True, next_text="Finish", next_command=self.close_wizard)
+        else:
+            self.configure_buttons(back_disabled=False, next_text="Next", next_command=self.next)
 
-        label = tk.Label(self.content_frame, text="Select User Template", font=("Arial", 14))
+    def create_user_selection_step(self, frame):
+        label = tk.Label(frame, text="Select User Template", font=("Arial", 14))
         label.pack(pady=10)
 
         # User options: Alexander Peet, Mark Grogan, David Feltbower
-        self.user_var = tk.StringVar(value=self.stored_values.get("user_name", "Alexander Peet"))
+        self.user_var = tk.StringVar()
         user_options = ["Alexander Peet", "Mark Grogan", "David Feltbower"]
 
         for user in user_options:
-            rb = tk.Radiobutton(self.content_frame, text=user, variable=self.user_var, value=user)
+            rb = tk.Radiobutton(frame, text=user, variable=self.user_var, value=user)
             rb.pack(anchor='w')
 
-        self.configure_buttons(back_disabled=True, next_text="Next", next_command=self.next)
+    def bind_user_selection_step(self):
+        self.user_var.set(self.stored_values.get("user_name", "Alexander Peet"))
+
+    def unbind_user_selection_step(self):
+        self.user_name = self.user_var.get()
+        self.stored_values["user_name"] = self.user_name
+        self.load_user_template(self.user_name)
 
     def load_user_template(self, user_name):
-        template_map = {
-            "Alexander Peet": "Template_AP.docx",
-            "Mark Grogan": "Template_MG.docx",
-            "David Feltbower": "Template_DF.docx"
-        }
-        template_directory = r"C:\Users\davidf\OneDrive - glenairukltd.onmicrosoft.com\Documents\VNA Report Writer"
-        self.template_path = os.path.join(template_directory, template_map[user_name])
-        if os.path.exists(self.template_path):
-            print(f"[DEBUG] Loading template for {user_name}: {self.template_path}")
-        else:
-            print(f"[ERROR] Template file not found for {user_name}: {self.template_path}")
+        """Pick the user's template and start mirroring it locally in the background."""
+        from report_engine import template_path_for_user
+        from shared_folder import TEMPLATE_MIRROR
+        self.template_path = template_path_for_user(user_name)
+        log.debug("Loading template for %s: %s", user_name, self.template_path)
+        TEMPLATE_MIRROR.watch(self.template_path)
 
     def insert_job_card_to_template(self):
         """Insert the job card number and other selections into the Word template."""
-        if self.template_path and os.path.exists(self.template_path):
-            try:
-                doc = Document(self.template_path)
-                # Replace <Job Card p/n> in the header
-                for section in doc.sections:
-                    header = section.header
-                    for paragraph in header.paragraphs:
-                        if '<Job Card p/n>' in paragraph.text:
-                            paragraph.text = paragraph.text.replace('<Job Card p/n>', self.job_card_number)
-                            print(f"[DEBUG] Replaced <Job Card p/n> with {self.job_card_number}")
-
-                # Replace placeholders in the main document body
-                self.replace_placeholders_in_body(doc)
-
-                # Save the modified document
-                output_path = os.path.join(os.path.dirname(self.template_path), f"Report_{self.job_card_number}.docx")
-                print(f"[DEBUG] Saving document to: {output_path}")
-                doc.save(output_path)
-                print(f"[DEBUG] Saved modified document as {output_path}")
-            except Exception as e:
-                print(f"[ERROR] Failed to modify the template or save the document: {e}")
-        else:
-            print(f"[ERROR] No valid template loaded or template not found at {self.template_path}")
+        from report_engine import generate_report
+        from shared_folder import TEMPLATE_MIRROR, WRITE_BACK
+        try:
+            output_path = generate_report(TEMPLATE_MIRROR.local_path(self.template_path), self.stored_values,
+                                          WRITE_BACK.outbox())
+            WRITE_BACK.enqueue(output_path, os.path.dirname(self.template_path))
+        except FileNotFoundError as e:
+            log.error("%s", e)
+        except Exception as e:
+            log.error("Failed to modify the template or save the document: %s", e)
 
     def replace_placeholders_in_body(self, doc):
-        """Replace the placeholders in the main body of the document and set font size to 11."""
-        # Ensure all values are strings or 'n/a' if None
-        port_1_connector = self.stored_values.get("port_1_connector", "n/a")
-        port_2_connector = self.stored_values.get("port_2_connector", "n/a")
-        vna_cal = self.stored_values["calibration_data"].get("data1", "n/a")
-        ecal_cal = self.stored_values["calibration_data"].get("data2", "n/a")
-        report_date = self.stored_values.get("report_date", "n/a")
-
-        # Replace placeholders in paragraphs and set font size
-        for paragraph in doc.paragraphs:
-            if '<Port 1>' in paragraph.text:
-                paragraph.text = paragraph.text.replace('<Port 1>', port_1_connector)
-                self.set_paragraph_font_size(paragraph, 11)
-                print(f"[DEBUG] Replaced <Port 1> with {port_1_connector}")
-            if '<Port 2>' in paragraph.text:
-                paragraph.text = paragraph.text.replace('<Port 2>', port_2_connector)
-                self.set_paragraph_font_size(paragraph, 11)
-                print(f"[DEBUG] Replaced <Port 2> with {port_2_connector}")
-            if '<VNA_Cal>' in paragraph.text:
-                paragraph.text = paragraph.text.replace('<VNA_Cal>', vna_cal)
-                self.set_paragraph_font_size(paragraph, 11)
-                print(f"[DEBUG] Replaced <VNA_Cal> with {vna_cal}")
-            if '<E-Cal_Cal>' in paragraph.text:
-                paragraph.text = paragraph.text.replace('<E-Cal_Cal>', ecal_cal)
-                self.set_paragraph_font_size(paragraph, 11)
-                print(f"[DEBUG] Replaced <E-Cal_Cal> with {ecal_cal}")
-            if '<Date>' in paragraph.text:
-                paragraph.text = paragraph.text.replace('<Date>', report_date)
-                self.set_paragraph_font_size(paragraph, 11)
-                print(f"[DEBUG] Replaced <Date> with {report_date}")
-
-    def set_paragraph_font_size(self, paragraph, font_size):
-        """Set the font size of all runs in the paragraph to a specified value."""
-        for run in paragraph.runs:
-            run.font.size = Pt(font_size)
-
-    def create_final_step_message(self):
-        """Display the final message after the wizard is complete."""
-        print("[DEBUG] Displaying final message after completion")
-        self.clear_content_frame()
-        self.current_step = "final_message"
-
-        label = tk.Label(self.content_frame, text="Now we are ready to start recording data from the VNA.", font=("Arial", 16, "bold"), wraplength=450)
+        """Replace the placeholders everywhere in the document, keeping the template's formatting."""
+        from report_engine import build_replacements, replace_placeholders
+        replace_placeholders(doc, build_replacements(self.stored_values))
+
+    def create_final_step_message(self, frame):
+        """Build the final message shown after the report has been generated."""
+        label = tk.Label(frame, text="Now we are ready to start recording data from the VNA.", font=("Arial", 16, "bold"), wraplength=450)
         label.pack(pady=10)
 
-        subtext = tk.Label(self.content_frame, text="From now on, you need to scan the GUK serial number on the Job Card and choose which derivative to save at.", font=("Arial", 12), wraplength=450)
+        subtext = tk.Label(frame, text="From now on, you need to scan the GUK serial number on the Job Card and choose which derivative to save at.", font=("Arial", 12), wraplength=450)
         subtext.pack(pady=10)
 
-        self.configure_buttons(back_disabled=True, next_text="Finish", next_command=self.master.destroy)
-
-    def finish(self):
-        """Finalize the wizard, insert data into the Word template, and save the document."""
-        self.insert_job_card_to_template()  # Insert the job card number into the Word template
-        
-        # Show final confirmation
-        messagebox.showinfo("Wizard Completed", "The report has been generated and saved successfully.")
-        
-        # Keep the Tkinter window alive
-        self.master.mainloop()
-
-    def create_option_selection_step(self):
-        print("[DEBUG] Creating Step 2: Option Selection with Tickboxes")
-        self.clear_content_frame()
-        self.current_step = "step_2"
-
+    def start_export_watcher(self):
+        """Watch the VNA export folder and collect each serial's measurement for this job card.
+
+        The session is set up by a SessionOpenJob, as the template's local copy
+        may have to wait on the synced folder.
+        """
+        if self.export_watcher is not None or self.open_job is not None:
+            return
+        from report_jobs import SessionOpenJob
+        from shared_folder import TEMPLATE_MIRROR, WRITE_BACK
+        self.open_job = SessionOpenJob(self.template_path, self.stored_values, template_mirror=TEMPLATE_MIRROR,
+                                       write_back=WRITE_BACK).start()
+        self.master.after(REPORT_POLL_MS, self.poll_open_job)
+
+    def poll_open_job(self):
+        """Take over the session from the SessionOpenJob once it is set up (unless the wizard closed first)."""
+        job = self.open_job
+        if job is None or not self.master.winfo_exists():
+            return
+        try:
+            job.queue.get_nowait()
+        except queue.Empty:
+            self.master.after(REPORT_POLL_MS, self.poll_open_job)
+            return
+        self.open_job = None
+        self.export_watcher = job.export_watcher
+        self.incremental_report = job.incremental_report
+        self.measurement_store = job.measurement_store
+
+    def close_wizard(self):
+        """Stop watching for exports, assemble the recorded serials into the report and close the wizard.
+
+        The watcher is drained and the report assembled by a SessionCloseJob on
+        a worker; the window shows its progress and closes when the job ends.
+        """
+        if self.close_job is not None:
+            return
+        if self.report_job is not None:
+            self.report_job.cancel()
+            self.report_job = None
+        if (self.open_job is None and self.export_watcher is None and self.incremental_report is None
+                and self.measurement_store is None):
+            self.master.destroy()
+            return
+        from report_jobs import SessionCloseJob
+        from shared_folder import WRITE_BACK
+        self.close_job = SessionCloseJob(self.template_path, self.export_watcher, self.incremental_report,
+                                         self.measurement_store, write_back=WRITE_BACK, history=JOB_HISTORY,
+                                         history_report_id=self.history_report_id, open_job=self.open_job).start()
+        self.open_job = self.export_watcher = self.incremental_report = self.measurement_store = None
+
+        frame = tk.Frame(self.content_frame)
+        frame.grid(row=0, column=0, sticky="nsew")
+        tk.Label(frame, text="Assembling the report...", font=("Arial", 14)).pack(pady=10)
+        progress_bar = ttk.Progressbar(frame, mode="indeterminate", length=400)
+        progress_bar.pack(pady=5)
+        progress_bar.start()
+        frame.tkraise()
+        self.back_button.config(state=tk.DISABLED)
+        self.next_button.config(state=tk.DISABLED)
+        self.master.after(REPORT_POLL_MS, self.poll_close_job)
+
+    def poll_close_job(self):
+        """Wait on the Tk thread for the SessionCloseJob, then close the wizard."""
+        if not self.master.winfo_exists():
+            return
+        try:
+            kind, value = self.close_job.queue.get_nowait()
+        except queue.Empty:
+            self.master.after(REPORT_POLL_MS, self.poll_close_job)
+            return
+        if kind == "error":
+            messagebox.showerror("Report Not Assembled", f"{value}\n\nThe recorded serials are kept and will be "
+                                 "included the next time this job card is run.", parent=self.master)
+        self.master.destroy()
+
+    def create_option_selection_step(self, frame):
         # Main heading with text wrapping
-        options_label = tk.Label(self.content_frame, text="Choose which options to place into the Report.", font=("Arial", 16, "bold"), wraplength=450)
+        options_label = tk.Label(frame, text="Choose which options to place into the Report.", font=("Arial", 16, "bold"), wraplength=450)
         options_label.pack(pady=10)
 
         # Subtext note with wrapping
-        subtext_label = tk.Label(self.content_frame, text="Note that all options are saved from the VNA, irrespective of what options are chosen here.", font=("Arial", 10), wraplength=450)
+        subtext_label = tk.Label(frame, text="Note that all options are saved from the VNA, irrespective of what options are chosen here.", font=("Arial", 10), wraplength=450)
         subtext_label.pack(pady=5)
 
         # Options for checkboxes
-        options = ["S11", "S12", "S21", "S22", "T11", "T22"]
+        self.options = ["S11", "S12", "S21", "S22", "T11", "T22"]
+        options = self.options
 
         self.option_vars = []
         for option in options:
-            var = tk.IntVar(value=1 if option in self.stored_values.get("selected_options", set()) else 0)
-            cb = tk.Checkbutton(self.content_frame, text=option, variable=var,
+            var = tk.IntVar()
+            cb = tk.Checkbutton(frame, text=option, variable=var,
                                 command=lambda v=var, opt=option: self.toggle_option(v, opt, options))
             cb.pack(anchor='w')
             self.option_vars.append(var)
 
         # "Select All" checkbox
-        self.select_all_var = tk.IntVar(value=1 if len(self.stored_values.get("selected_options", set())) == len(options) else 0)
-        select_all_cb = tk.Checkbutton(self.content_frame, text="Select All", variable=self.select_all_var,
+        self.select_all_var = tk.IntVar()
+        select_all_cb = tk.Checkbutton(frame, text="Select All", variable=self.select_all_var,
                                        command=lambda: self.toggle_select_all(options))
         select_all_cb.pack(anchor='w')
 
-        self.configure_buttons(back_disabled=False, next_text="Next", next_command=self.next)
+    def bind_option_selection_step(self):
+        selected_options = self.stored_values.get("selected_options", set())
+        for option, var in zip(self.options, self.option_vars):
+            var.set(1 if option in selected_options else 0)
+        self.select_all_var.set(1 if len(selected_options) == len(self.options) else 0)
 
     def toggle_option(self, var, option, options):
         """Toggle individual option and manage the selected_options set."""
@@ -292,59 +603,71 @@ class MultiStepWizard:
         for var in self.option_vars:
             var.set(self.select_all_var.get())
 
-    def create_job_card_step(self):
-        print("[DEBUG] Creating Step 3: Job Card Input")
-        self.clear_content_frame()
-        self.current_step = "job_card"
-
-        label = tk.Label(self.content_frame, text="Enter Job Card Part Number:", font=("Arial", 14))
+    def create_job_card_step(self, frame):
+        label = tk.Label(frame, text="Enter Job Card Part Number:", font=("Arial", 14))
         label.pack(pady=10)
 
-        self.job_card_entry = tk.Entry(self.content_frame)
-        self.job_card_entry.insert(0, self.stored_values.get("job_card", ""))
+        # Suggests job cards from earlier reports as the number is typed
+        self.job_card_entry = ttk.Combobox(frame)
+        self.job_card_entry.bind("<KeyRelease>", self.autocomplete_job_card)
         self.job_card_entry.pack(pady=5)
 
-        self.configure_buttons(back_disabled=False, next_text="Next", next_command=self.next)
+    def autocomplete_job_card(self, event):
+        prefix = self.job_card_entry.get()
+        self.job_card_entry["values"] = JOB_HISTORY.job_cards(prefix) if prefix else ()
 
-    def create_vna_connector_step(self):
-        print("[DEBUG] Creating Step 4: VNA Test Port Connectors Selection")
-        self.clear_content_frame()
-        self.current_step = "vna_connectors"
+    def bind_job_card_step(self):
+        self.job_card_entry.delete(0, tk.END)
+        self.job_card_entry.insert(0, self.stored_values.get("job_card", ""))
 
-        label = tk.Label(self.content_frame, text="Choose VNA Test Port Connectors:", font=("Arial", 14))
+    def create_vna_connector_step(self, frame):
+        label = tk.Label(frame, text="Choose VNA Test Port Connectors:", font=("Arial", 14))
         label.pack(pady=10)
 
         # Dropdown for Port 1
-        port_1_label = tk.Label(self.content_frame, text="Port 1:", font=("Arial", 12))
+        port_1_label = tk.Label(frame, text="Port 1:", font=("Arial", 12))
         port_1_label.pack(pady=5)
-        self.port_1_var = tk.StringVar(value=self.stored_values.get("port_1_connector", ""))
-        port_1_options = ["SMA", "N", "SMB", "SMP"]
-        port_1_menu = tk.OptionMenu(self.content_frame, self.port_1_var, *port_1_options)
+        self.port_1_var = tk.StringVar()
+        port_1_options = JOB_HISTORY.connectors()
+        port_1_menu = tk.OptionMenu(frame, self.port_1_var, *port_1_options)
         port_1_menu.pack(pady=5)
 
         # Checkboxes for "Same as Port 1" and "Single Port Measurement"
-        self.same_as_port_1_var = tk.IntVar(value=1 if self.stored_values.get("same_as_port_1", False) else 0)
-        self.single_port_measurement_var = tk.IntVar(value=1 if self.stored_values.get("single_port_measurement", False) else 0)
+        self.same_as_port_1_var = tk.IntVar()
+        self.single_port_measurement_var = tk.IntVar()
 
-        same_as_port_1_cb = tk.Checkbutton(self.content_frame, text="Same as Port 1", variable=self.same_as_port_1_var,
+        same_as_port_1_cb = tk.Checkbutton(frame, text="Same as Port 1", variable=self.same_as_port_1_var,
                                            command=self.toggle_same_as_port_1)
         same_as_port_1_cb.pack(pady=5)
 
-        single_port_cb = tk.Checkbutton(self.content_frame, text="Single Port Measurement", variable=self.single_port_measurement_var,
+        single_port_cb = tk.Checkbutton(frame, text="Single Port Measurement", variable=self.single_port_measurement_var,
                                         command=self.toggle_single_port_measurement)
         single_port_cb.pack(pady=5)
 
         # Dropdown for Port 2
-        self.port_2_label = tk.Label(self.content_frame, text="Port 2:", font=("Arial", 12))
+        self.port_2_label = tk.Label(frame, text="Port 2:", font=("Arial", 12))
         self.port_2_label.pack(pady=5)
-        self.port_2_var = tk.StringVar(value=self.stored_values.get("port_2_connector", ""))
-        self.port_2_menu = tk.OptionMenu(self.content_frame, self.port_2_var, *port_1_options)
+        self.port_2_var = tk.StringVar()
+        self.port_2_menu = tk.OptionMenu(frame, self.port_2_var, *port_1_options)
         self.port_2_menu.pack(pady=5)
 
-        # Initially check the state of checkboxes
+    def bind_vna_connector_step(self):
+        self.port_1_var.set(self.stored_values.get("port_1_connector", ""))
+        self.port_2_var.set(self.stored_values.get("port_2_connector", ""))
+        self.same_as_port_1_var.set(1 if self.stored_values.get("same_as_port_1", False) else 0)
+        self.single_port_measurement_var.set(1 if self.stored_values.get("single_port_measurement", False) else 0)
+
+        # Check the state of checkboxes
         self.update_port_2_visibility()
 
-        self.configure_buttons(back_disabled=False, next_text="Next", next_command=self.next)
+    def unbind_vna_connector_step(self):
+        # Ensure Port 1 and Port 2 values are captured correctly
+        self.port_1_connector = self.port_1_var.get()
+        self.port_2_connector = self.port_2_var.get()
+        self.stored_values["port_1_connector"] = self.port_1_connector
+        self.stored_values["port_2_connector"] = self.port_2_connector
+        self.stored_values["same_as_port_1"] = self.same_as_port_1_var.get()
+        self.stored_values["single_port_measurement"] = self.single_port_measurement_var.get()
 
     def toggle_same_as_port_1(self):
         """If Same as Port 1 is selected, disable Single Port Measurement and update Port 2 behavior."""
@@ -376,63 +699,101 @@ class MultiStepWizard:
             self.port_2_label.pack(pady=5)
             self.port_2_menu.pack(pady=5)
 
-    def create_calibration_data_step(self):
-        print("[DEBUG] Creating Step 5: Select Calibration Data")
-        self.clear_content_frame()
-        self.current_step = "calibration_data"
-
+    def default_calibration(self, kind):
+        """Return the calibration used in the last report, else the latest one in the dropdown."""
+        labels = [label for label, _ in self.calibration_options(kind) if label != "Add New"]
+        label = JOB_HISTORY.last_calibration(kind)
+        if label not in labels:
+            label = labels[0] if labels else ""
+        return label
+
+    def calibration_options(self, kind):
+        """(label, menu text) of every calibration, latest first, expired ones marked, then "Add New"."""
+        today = datetime.today().date()
+        options = [(calibration.label, f"{calibration.label} (expired)" if calibration.expired_on(today)
+                    else calibration.label) for calibration in JOB_HISTORY.calibrations(kind)]
+        return options + [("Add New", "Add New")]
+
+    def refresh_calibration_menu(self, dropdown, var, kind, command):
+        """Refill a calibration dropdown from the job history."""
+        menu = dropdown["menu"]
+        menu.delete(0, tk.END)
+        for label, text in self.calibration_options(kind):
+            menu.add_command(label=text, command=tk._setit(var, label, command))
+
+    def create_calibration_data_step(self, frame):
         # Calibration Data 1
-        label1 = tk.Label(self.content_frame, text="VNA Calibration:", font=("Arial", 14))
+        label1 = tk.Label(frame, text="VNA Calibration:", font=("Arial", 14))
         label1.pack(pady=5)
-        self.calibration_data_var1 = tk.StringVar(value=self.stored_values["calibration_data"].get("data1", "XNA34 Jun23-Jun25"))
-        options1 = ["XNA34 Jun23-Jun25", "Add New"]
-        dropdown1 = tk.OptionMenu(self.content_frame, self.calibration_data_var1, *options1, command=self.handle_add_new_vna)
-        dropdown1.pack(pady=5)
+        self.calibration_data_var1 = tk.StringVar()
+        self.calibration_dropdown1 = tk.OptionMenu(frame, self.calibration_data_var1, "Add New", command=self.handle_add_new_vna)
+        self.refresh_calibration_menu(self.calibration_dropdown1, self.calibration_data_var1, "vna", self.handle_add_new_vna)
+        self.calibration_dropdown1.pack(pady=5)
 
         # Calibration Data 2
-        label2 = tk.Label(self.content_frame, text="E-Cal Calibration:", font=("Arial", 14))
+        label2 = tk.Label(frame, text="E-Cal Calibration:", font=("Arial", 14))
         label2.pack(pady=5)
-        self.calibration_data_var2 = tk.StringVar(value=self.stored_values["calibration_data"].get("data2", "XRA11 Jun23-Jun25"))
-        options2 = ["XRA11 Jun23-Jun25", "Add New"]
-        dropdown2 = tk.OptionMenu(self.content_frame, self.calibration_data_var2, *options2, command=self.handle_add_new_ecal)
-        dropdown2.pack(pady=5)
+        self.calibration_data_var2 = tk.StringVar()
+        self.calibration_dropdown2 = tk.OptionMenu(frame, self.calibration_data_var2, "Add New", command=self.handle_add_new_ecal)
+        self.refresh_calibration_menu(self.calibration_dropdown2, self.calibration_data_var2, "ecal", self.handle_add_new_ecal)
+        self.calibration_dropdown2.pack(pady=5)
+
+    def bind_calibration_data_step(self):
+        self.calibration_data_var1.set(self.stored_values["calibration_data"].get("data1", ""))
+        self.calibration_data_var2.set(self.stored_values["calibration_data"].get("data2", ""))
 
-        self.configure_buttons(back_disabled=False, next_text="Next", next_command=self.next)
+    def unbind_calibration_data_step(self):
+        self.stored_values["calibration_data"]["data1"] = self.calibration_data_var1.get()
+        self.stored_values["calibration_data"]["data2"] = self.calibration_data_var2.get()
 
     def handle_add_new_vna(self, selection):
         if selection == "Add New":
-            new_value = simpledialog.askstring("Add New VNA Calibration", "Enter new VNA Calibration value:")
+            from tkinter import simpledialog
+            new_value = simpledialog.askstring("Add New VNA Calibration", "Enter new VNA Calibration value (e.g. XNA35 Jul25-Jul27):")
             if new_value:
+                new_value = JOB_HISTORY.add_calibration("vna", new_value).label
+                self.refresh_calibration_menu(self.calibration_dropdown1, self.calibration_data_var1, "vna", self.handle_add_new_vna)
                 self.calibration_data_var1.set(new_value)
                 self.stored_values["calibration_data"]["data1"] = new_value
+            else:
+                self.calibration_data_var1.set(self.stored_values["calibration_data"].get("data1", ""))
 
     def handle_add_new_ecal(self, selection):
         if selection == "Add New":
-            new_value = simpledialog.askstring("Add New E-Cal Calibration", "Enter new E-Cal Calibration value:")
+            from tkinter import simpledialog
+            new_value = simpledialog.askstring("Add New E-Cal Calibration", "Enter new E-Cal Calibration value (e.g. XRA12 Jul25-Jul27):")
             if new_value:
+                new_value = JOB_HISTORY.add_calibration("ecal", new_value).label
+                self.refresh_calibration_menu(self.calibration_dropdown2, self.calibration_data_var2, "ecal", self.handle_add_new_ecal)
                 self.calibration_data_var2.set(new_value)
                 self.stored_values["calibration_data"]["data2"] = new_value
+            else:
+                self.calibration_data_var2.set(self.stored_values["calibration_data"].get("data2", ""))
 
-    def create_report_date_step(self):
-        print("[DEBUG] Creating Step 6: Report Date")
-        self.clear_content_frame()
-        self.current_step = "report_date"
-
+    def create_report_date_step(self, frame):
         # Instruction with the date format DD/MM/YYYY
-        label = tk.Label(self.content_frame, text="Enter or Confirm Report Date (format: DD/MM/YYYY):", font=("Arial", 14))
+        label = tk.Label(frame, text="Enter or Confirm Report Date (format: DD/MM/YYYY):", font=("Arial", 14))
         label.pack(pady=10)
 
-        self.date_entry = tk.Entry(self.content_frame)
-        self.date_entry.insert(0, self.stored_values.get("report_date", datetime.today().strftime('%d/%m/%Y')))
+        self.date_entry = tk.Entry(frame)
         self.date_entry.pack(pady=5)
 
-        self.configure_buttons(back_disabled=False, next_text="Next", next_command=self.next)
+    def bind_report_date_step(self):
+        self.date_entry.delete(0, tk.END)
+        self.date_entry.insert(0, self.stored_values.get("report_date", datetime.today().strftime('%d/%m/%Y')))
+
+    def unbind_report_date_step(self):
+        self.stored_values["report_date"] = self.date_entry.get()
+
+    def create_review_step(self, frame):
+        # Add review page title
+        title = tk.Label(frame, text="Check before submitting choices for Report", font=("Arial", 16, "bold"))
+        title.pack(pady=10)
 
-    def create_review_step(self):
-        print("[DEBUG] Creating Review Step")
-        self.clear_content_frame()
-        self.current_step = "review"
+        self.summary_label = tk.Label(frame, font=("Arial", 14))
+        self.summary_label.pack(pady=10)
 
+    def bind_review_step(self):
         selected_options_summary = ', '.join(self.stored_values.get("selected_options", [])) if self.selected_options else 'None'
         job_card_number = self.job_card_number if self.job_card_number else 'None'
         port_1_connector = self.stored_values.get("port_1_connector", "None")
@@ -441,10 +802,6 @@ class MultiStepWizard:
         calibration_data2 = self.stored_values["calibration_data"].get("data2", "None")
         report_date = self.stored_values.get("report_date", "None")
 
-        # Add review page title
-        title = tk.Label(self.content_frame, text="Check before submitting choices for Report", font=("Arial", 16, "bold"))
-        title.pack(pady=10)
-
         # Display final summary
         summary = (
             f"User: {self.user_name}\n"
@@ -456,89 +813,104 @@ class MultiStepWizard:
             f"E-Cal Calibration: {calibration_data2}\n"
             f"Report Date: {report_date}"
         )
-        print(f"[DEBUG] Final Summary: \n{summary}")
-
-        label = tk.Label(self.content_frame, text=summary, font=("Arial", 14))
-        label.pack(pady=10)
-
-        self.configure_buttons(back_disabled=False, next_text="Finish", next_command=self.finish)
+        warnings = JOB_HISTORY.expired_calibrations(self.stored_values)
+        if warnings:
+            summary += "\n\nWarning: " + "\nWarning: ".join(warnings)
+        log.debug("Final Summary: \n%s", summary)
+        self.summary_label.config(text=summary, fg="red" if warnings else "black")
 
     def next(self):
-        # Capture data before moving forward
-        if self.current_step == "step_1":
-            self.user_name = self.user_var.get()
-            self.stored_values["user_name"] = self.user_name
-            self.load_user_template(self.user_name)
-        elif self.current_step == "job_card":
-            self.capture_job_card_number()
-        elif self.current_step == "vna_connectors":
-            # Ensure Port 1 and Port 2 values are captured correctly
-            self.port_1_connector = self.port_1_var.get()
-            self.port_2_connector = self.port_2_var.get()
-            self.stored_values["port_1_connector"] = self.port_1_connector
-            self.stored_values["port_2_connector"] = self.port_2_connector
-            self.stored_values["same_as_port_1"] = self.same_as_port_1_var.get()
-            self.stored_values["single_port_measurement"] = self.single_port_measurement_var.get()
-        elif self.current_step == "calibration_data":
-            self.stored_values["calibration_data"]["data1"] = self.calibration_data_var1.get()
-            self.stored_values["calibration_data"]["data2"] = self.calibration_data_var2.get()
-        elif self.current_step == "report_date":
-            self.stored_values["report_date"] = self.date_entry.get()
-
-        # Move to the next step
+        # The step being left writes its widgets back into stored_values in show_step
         self.step_index = (self.step_index + 1) % len(self.steps_order)
-        self.navigate_to_step(self.steps_order[self.step_index])
+        self.show_step(self.steps_order[self.step_index])
 
     def back(self):
-        # Capture data before moving back
-        if self.current_step == "job_card":
-            self.capture_job_card_number()
-        elif self.current_step == "vna_connectors":
-            self.stored_values["port_1_connector"] = self.port_1_var.get()
-            self.stored_values["port_2_connector"] = self.port_2_var.get()
-            self.stored_values["same_as_port_1"] = self.same_as_port_1_var.get()
-            self.stored_values["single_port_measurement"] = self.single_port_measurement_var.get()
-        elif self.current_step == "calibration_data":
-            self.stored_values["calibration_data"]["data1"] = self.calibration_data_var1.get()
-            self.stored_values["calibration_data"]["data2"] = self.calibration_data_var2.get()
-        elif self.current_step == "report_date":
-            self.stored_values["report_date"] = self.date_entry.get()
-
-        # Move to the previous step
         self.step_index = (self.step_index - 1) % len(self.steps_order)
-        self.navigate_to_step(self.steps_order[self.step_index])
+        self.show_step(self.steps_order[self.step_index])
 
     def navigate_to_step(self, step):
-        if step == "step_1":
-            self.create_user_selection_step()
-        elif step == "step_2":
-            self.create_option_selection_step()
-        elif step == "job_card":
-            self.create_job_card_step()
-        elif step == "vna_connectors":
-            self.create_vna_connector_step()
-        elif step == "calibration_data":
-            self.create_calibration_data_step()
-        elif step == "report_date":
-            self.create_report_date_step()
-        elif step == "review":
-            self.create_review_step()
+        if step in self.steps_order:
+            self.step_index = self.steps_order.index(step)
+        self.show_step(step)
 
     def finish(self):
-        """Finalize the wizard, insert data into the Word template, and save the document."""
-        self.insert_job_card_to_template()  # Insert the job card number into the Word template
-        
-        # Show final confirmation
-        messagebox.showinfo("Wizard Completed", "The report has been generated and saved successfully.")
-        
-        # Keep the Tkinter window alive
-        self.master.mainloop()
-
-    def clear_content_frame(self):
-        print(f"[DEBUG] Clearing content frame. Current step: {self.current_step}")
-        for widget in self.content_frame.winfo_children():
-            print(f"[DEBUG] Destroying widget: {widget}")
-            widget.destroy()
+        """Generate the report on a worker thread, showing its progress with a Cancel button."""
+        from report_jobs import ReportJob
+        from shared_folder import TEMPLATE_MIRROR, WRITE_BACK
+        warnings = JOB_HISTORY.expired_calibrations(self.stored_values)
+        if warnings and not messagebox.askyesno("Calibration Expired", "\n".join(warnings) + "\n\nGenerate the report anyway?"):
+            return
+        log.debug("Generating report in the background")
+        self.show_step("generating")
+        self.report_job = ReportJob(self.template_path, self.stored_values, template_mirror=TEMPLATE_MIRROR,
+                                    write_back=WRITE_BACK).start()
+        self.master.after(REPORT_POLL_MS, self.poll_report_job)
+
+    def create_generating_step(self, frame):
+        label = tk.Label(frame, text="Generating Report", font=("Arial", 16, "bold"))
+        label.pack(pady=10)
+
+        self.progress_label = tk.Label(frame, font=("Arial", 12))
+        self.progress_label.pack(pady=5)
+        self.progress_bar = ttk.Progressbar(frame, mode="determinate", maximum=1.0, length=400)
+        self.progress_bar.pack(pady=5)
+
+    def bind_generating_step(self):
+        self.progress_label.config(text="Waiting for a free worker...")
+        self.progress_bar["value"] = 0
+
+    def cancel_report(self):
+        """Ask the running report to stop at its next phase."""
+        if self.report_job is not None:
+            self.report_job.cancel()
+            self.next_button.config(state=tk.DISABLED)
+            self.progress_label.config(text="Cancelling...")
+
+    def poll_report_job(self):
+        """Drain the report job's queue on the Tk thread and reschedule until it ends."""
+        job = self.report_job
+        if job is None or not self.master.winfo_exists():
+            return
+        try:
+            while True:
+                kind, value = job.queue.get_nowait()
+                if kind == "progress":
+                    phase, fraction = value
+                    self.progress_bar["value"] = fraction
+                    self.progress_label.config(text=REPORT_PHASE_LABELS[phase])
+                else:
+                    self.report_job = None
+                    self.report_finished(kind, value)
+                    return
+        except queue.Empty:
+            pass
+        self.master.after(REPORT_POLL_MS, self.poll_report_job)
+
+    def report_finished(self, kind, value):
+        """Show the outcome of the background report."""
+        if kind == "done":
+            self.progress_bar["value"] = 1.0
+            log.debug("Report job finished: %s", value)
+            self.record_history(value)
+            # Show final confirmation
+            messagebox.showinfo("Wizard Completed", "The report has been generated and saved successfully.")
+            # Move on to recording data from the VNA
+            self.navigate_to_step("final_message")
+            return
+        if kind == "error":
+            log.error("%s", value)
+            messagebox.showerror("Report Failed", value)
+        else:
+            log.info("Report generation cancelled")
+        self.navigate_to_step("review")
+
+    def record_history(self, output_path):
+        """Add the generated report to the job history."""
+        import sqlite3
+        try:
+            self.history_report_id = JOB_HISTORY.record_report(self.stored_values, output_path)
+        except sqlite3.Error as e:
+            log.error("Could not record the report in the job history: %s", e)
 
     def configure_buttons(self, back_disabled, next_text, next_command):
         """Helper method to configure back and next buttons."""
@@ -548,9 +920,25 @@ class MultiStepWizard:
     def capture_job_card_number(self):
         """Capture job card number before leaving job card step."""
         if self.job_card_entry is not None and self.job_card_entry.winfo_exists():
-            self.job_card_number = self.job_card_entry.get()
+            job_card_number = self.job_card_entry.get()
+            if job_card_number and job_card_number != self.job_card_number:
+                self.prefill_from_history(job_card_number)
+            self.job_card_number = job_card_number
             self.stored_values["job_card"] = self.job_card_number
-            print(f"[DEBUG] Captured job card number: {self.job_card_number}")
+            log.debug("Captured job card number: %s", self.job_card_number)
+
+    def prefill_from_history(self, job_card_number):
+        """Fill the later steps not visited yet with the values of the job card's last report."""
+        previous = JOB_HISTORY.last_report(job_card_number)
+        if previous is None:
+            return
+        log.debug("Prefilling from the last report of job card %s", job_card_number)
+        if "vna_connectors" not in self.step_frames:
+            for key in ("port_1_connector", "port_2_connector"):
+                if previous[key]:
+                    self.stored_values[key] = previous[key]
+        if "calibration_data" not in self.step_frames:
+            self.stored_values["calibration_data"].update(previous["calibration_data"])
 
 # Call the main GUI function
 if __name__ == "__main__":
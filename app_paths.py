@@ -0,0 +1,30 @@
+"""Folders and files the application reads from and writes to.
+
+Kept free of heavy imports so the main window can use it before python-docx,
+NumPy or PIL are loaded.
+"""
+import os
+
+# Shared (OneDrive-synced) folder with the templates, logos and generated reports
+TEMPLATE_DIRECTORY = r"C:\Users\davidf\OneDrive - glenairukltd.onmicrosoft.com\Documents\VNA Report Writer"
+
+# Return-loss and insertion-loss masks per connector (JSON, see limits.py); no pass/fail without it
+CONNECTOR_LIMITS_FILE = os.path.join(TEMPLATE_DIRECTORY, "connector_limits.json")
+
+# Local, per-machine data, kept out of the synced folder
+APP_DATA_DIRECTORY = os.path.join(os.environ.get("LOCALAPPDATA", os.path.expanduser("~")), "VNA Report Writer")
+
+# Rendered plots and the like, safe to delete
+CACHE_DIRECTORY = os.path.join(APP_DATA_DIRECTORY, "cache")
+
+# Calibrations, connectors and every report generated on this PC (SQLite)
+HISTORY_DATABASE = os.path.join(APP_DATA_DIRECTORY, "history.sqlite3")
+
+# Folder of VNA setup (.STA) files indexed for the recall search; more can be added from the dialog
+SETUP_DIRECTORY = os.path.join(TEMPLATE_DIRECTORY, "VNA Setups")
+
+# Index of the setup library (SQLite), rebuilt incrementally from the folders
+SETUP_INDEX_DATABASE = os.path.join(APP_DATA_DIRECTORY, "setups.sqlite3")
+
+LOGO_PATH_LEFT = os.path.join(TEMPLATE_DIRECTORY, "glenair-logo-new.png")
+LOGO_PATH_RIGHT = os.path.join(TEMPLATE_DIRECTORY, "Keysight P5004B.jpg")
@@ -0,0 +1,183 @@
+"""Headless batch report generation.
+
+Renders one Report_<job>.docx per row of a CSV or JSON manifest across a pool of
+worker processes, using the same substitution rules as the wizard.
+
+Manifest columns / keys:
+    job_card, user_name (or template), port_1_connector, port_2_connector,
+    vna_cal, ecal_cal, report_date, selected_options (separated by ';'),
+    measurement_file (optional Touchstone export, tabulated at <Measurements>
+    and plotted at <Plots>)
+
+Usage:
+    python batch_report.py jobs.csv --workers 4 --output-dir C:/Reports
+    python batch_report.py jobs.csv --log-level DEBUG --trace timings.jsonl --chrome-trace timings.json
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from report_engine import TEMPLATE_DIRECTORY, generate_report, template_path_for_user
+from touchstone import load_touchstone
+from tracing import configure_logging, enable_tracing, export_chrome_trace, span
+
+log = logging.getLogger(__name__)
+
+
+def load_manifest(manifest_path):
+    """Read the job rows from a .csv or .json manifest."""
+    if manifest_path.lower().endswith(".json"):
+        with open(manifest_path, encoding="utf-8") as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows.get("jobs", [])
+    else:
+        with open(manifest_path, newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+    return rows
+
+
+def manifest_row_to_stored_values(row):
+    """Convert a manifest row into the stored_values shape used by the wizard."""
+    selected_options = row.get("selected_options") or []
+    if isinstance(selected_options, str):
+        selected_options = [opt.strip() for opt in selected_options.split(";") if opt.strip()]
+
+    stored_values = {
+        "user_name": row.get("user_name"),
+        "job_card": str(row["job_card"]),
+        "selected_options": set(selected_options),
+        "calibration_data": {},
+    }
+    # Only set keys that are present so the "n/a" defaults still apply
+    for key in ("port_1_connector", "port_2_connector", "report_date"):
+        if row.get(key):
+            stored_values[key] = row[key]
+    if row.get("vna_cal"):
+        stored_values["calibration_data"]["data1"] = row["vna_cal"]
+    if row.get("ecal_cal"):
+        stored_values["calibration_data"]["data2"] = row["ecal_cal"]
+    return stored_values
+
+
+def resolve_template(row, template_directory=TEMPLATE_DIRECTORY):
+    """Pick the template for a row: an explicit path wins over the user mapping."""
+    if row.get("template"):
+        return row["template"]
+    return template_path_for_user(row["user_name"], template_directory)
+
+
+def render_job(row, template_directory=TEMPLATE_DIRECTORY, output_dir=None, force=False, streaming=False):
+    """Render a single manifest row. Never raises, so one bad job cannot stop the batch."""
+    start = time.perf_counter()
+    result = {"job_card": row.get("job_card"), "output_path": None, "error": None}
+    try:
+        template_path = resolve_template(row, template_directory)
+        stored_values = manifest_row_to_stored_values(row)
+        measurements = None
+        if row.get("measurement_file"):
+            with span("touchstone_load", job_card=stored_values["job_card"]):
+                measurements = load_touchstone(row["measurement_file"], stored_values["selected_options"] or None)
+        result["output_path"] = generate_report(template_path, stored_values, output_dir, measurements, plot_workers=1,
+                                                force=force, streaming=streaming)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(rows, workers=None, template_directory=TEMPLATE_DIRECTORY, output_dir=None, force=False,
+              streaming=False):
+    """Render every row across a process pool and return the per-job results in manifest order."""
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    results = [None] * len(rows)
+    # Workers take the log level and trace file from the environment set up by main()
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure_logging) as pool:
+        futures = {pool.submit(render_job, row, template_directory, output_dir, force, streaming): index
+                   for index, row in enumerate(rows)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. BrokenProcessPool)
+                results[index] = {"job_card": rows[index].get("job_card"), "output_path": None,
+                                  "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+    return results
+
+
+def record_history(rows, results, history=None):
+    """Add every report that was generated to the job history; returns how many were recorded.
+
+    A history database that is locked or damaged is logged and stops the
+    recording, as the reports themselves have been written.
+    """
+    from job_history import JOB_HISTORY
+    history = history or JOB_HISTORY
+    recorded = 0
+    try:
+        for row, result in zip(rows, results):
+            if not result["error"]:
+                history.record_report(manifest_row_to_stored_values(row), result["output_path"])
+                recorded += 1
+    except sqlite3.Error as e:
+        generated = sum(1 for result in results if not result["error"])
+        log.error("Recorded %d of %d report(s) in the job history: %s", recorded, generated, e)
+    return recorded
+
+
+def print_summary(results, elapsed):
+    """Print failures and the overall throughput of a batch run."""
+    failed = [r for r in results if r["error"]]
+    for r in failed:
+        log.error("Job card %s: %s", r["job_card"], r["error"])
+    done = len(results) - len(failed)
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"Generated {done}/{len(results)} reports in {elapsed:.2f}s ({rate:.1f} reports/s), {len(failed)} failed")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate reports from a job card manifest without the GUI.")
+    parser.add_argument("manifest", help="CSV or JSON manifest of job cards")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--template-dir", default=TEMPLATE_DIRECTORY, help="directory holding Template_*.docx")
+    parser.add_argument("--output-dir", default=None, help="where to write reports (default: next to the template)")
+    parser.add_argument("--force", action="store_true", help="regenerate reports whose inputs have not changed")
+    parser.add_argument("--streaming", action="store_true",
+                        help="stream the template into each report instead of loading it with python-docx")
+    parser.add_argument("--no-history", action="store_true", help="do not record the reports in the job history")
+    parser.add_argument("--log-level", default=None, help="DEBUG, INFO, WARNING or ERROR (default: INFO)")
+    parser.add_argument("--trace", default=None, help="append per-report timings to this JSON-lines file")
+    parser.add_argument("--chrome-trace", default=None, help="also write the timings in Chrome trace format")
+    args = parser.parse_args(argv)
+
+    configure_logging(args.log_level)
+    trace_path = args.trace
+    if args.chrome_trace and not trace_path:
+        trace_path = os.path.splitext(args.chrome_trace)[0] + ".jsonl"
+    if trace_path:
+        enable_tracing(trace_path)
+
+    rows = load_manifest(args.manifest)
+    start = time.perf_counter()
+    with span("batch", jobs=len(rows), workers=args.workers):
+        results = run_batch(rows, args.workers, args.template_dir, args.output_dir, args.force, args.streaming)
+    print_summary(results, time.perf_counter() - start)
+    if not args.no_history:
+        record_history(rows, results)
+    if args.chrome_trace:
+        export_chrome_trace(trace_path, args.chrome_trace)
+        log.info("Wrote Chrome trace to %s", args.chrome_trace)
+    return 1 if any(r["error"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
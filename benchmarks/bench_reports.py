@@ -0,0 +1,336 @@
+"""Report generation benchmark on synthetic templates, checked against a stored baseline.
+
+Templates of 1 to 500 pages are generated with a header and footer per section,
+large tables and placeholders split across runs, then filled through
+generate_report (what the wizard's insert_job_card_to_template calls) without
+Tk. Every template is measured in a fresh interpreter so its peak RSS is its
+own: the first (cold) report, the median of the warm repeats, a repeat with
+nothing changed (which only checks the report's manifest) and the output size. A batch of reports through batch_report.run_batch is measured the same
+way.
+
+Results are compared with the baseline file and any metric more than
+--threshold above it is reported as a regression (exit code 1). Baselines are
+per machine; make one with --save-baseline on the PC the reports run on.
+
+Usage:
+    python benchmarks/bench_reports.py [--pages 1 10 50 200 500] [--repeat 3]
+    python benchmarks/bench_reports.py --save-baseline
+    python benchmarks/bench_reports.py --threshold 0.1 --baseline C:/bench/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from xml.sax.saxutils import escape
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Bump when the synthetic templates change, so old baselines are not compared against them
+GENERATOR_VERSION = 1
+PARAGRAPHS_PER_PAGE = 40
+PAGES_PER_SECTION = 20
+# Every TABLE_EVERY-th page is a table of TABLE_ROWS rows instead of text
+TABLE_EVERY = 5
+TABLE_ROWS = 40
+TABLE_COLUMNS = 4
+
+STORED_VALUES = {
+    "user_name": "Benchmark",
+    "job_card": "JC12345",
+    "port_1_connector": "SMA",
+    "port_2_connector": "N",
+    "calibration_data": {"data1": "XNA34 Jun23-Jun25", "data2": "XRA11 Jun23-Jun25"},
+    "report_date": "01/01/2026",
+    "selected_options": {"S11", "S21"},
+}
+BODY_PLACEHOLDERS = ["<Port 1>", "<Port 2>", "<VNA_Cal>", "<E-Cal_Cal>", "<Date>", "<Job Card p/n>"]
+
+# (metric, allowed absolute slack) compared against the baseline; the slack keeps
+# timer and allocator noise on tiny documents from being reported
+METRICS = (("cold_s", 0.005), ("warm_s", 0.005), ("unchanged_s", 0.005), ("peak_rss_mb", 2.0), ("output_kb", 1.0))
+BATCH_METRICS = (("wall_s", 0.02), ("peak_rss_mb", 2.0), ("output_kb", 1.0))
+
+
+def _run(text, bold=False):
+    properties = "<w:rPr><w:b/></w:rPr>" if bold else ""
+    return f'<w:r>{properties}<w:t xml:space="preserve">{escape(text)}</w:t></w:r>'
+
+
+def _placeholder_paragraph(i):
+    """A paragraph holding one placeholder; every third one is split across runs with different formatting."""
+    placeholder = BODY_PLACEHOLDERS[i % len(BODY_PLACEHOLDERS)]
+    if i % 3 == 0:
+        cut = len(placeholder) // 2
+        runs = _run("Measured with ") + _run(placeholder[:cut]) + _run(placeholder[cut:], bold=True) + _run(" here.")
+    else:
+        runs = _run(f"Measured with {placeholder} on this line.")
+    return f"<w:p>{runs}</w:p>"
+
+
+def _table(page):
+    cells = []
+    for row in range(TABLE_ROWS):
+        cells.append("<w:tr>")
+        for column in range(TABLE_COLUMNS):
+            if row % 10 == 0 and column == 1:
+                text = _run(BODY_PLACEHOLDERS[row // 10 % len(BODY_PLACEHOLDERS)])
+            else:
+                text = _run(f"{page}.{row}.{column}")
+            cells.append(f"<w:tc><w:p>{text}</w:p></w:tc>")
+        cells.append("</w:tr>")
+    borders = "".join(f'<w:{edge} w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+                      for edge in ("top", "left", "bottom", "right", "insideH", "insideV"))
+    return (f"<w:tbl><w:tblPr><w:tblBorders>{borders}</w:tblBorders></w:tblPr>"
+            f"<w:tblGrid>{'<w:gridCol/>' * TABLE_COLUMNS}</w:tblGrid>{''.join(cells)}</w:tbl>")
+
+
+def build_synthetic_template(path, pages):
+    """Write a template of roughly `pages` pages.
+
+    The body XML is generated as one string (adding thousands of paragraphs
+    through python-docx would dominate the run); python-docx then adds the
+    unlinked header and footer of each section.
+    """
+    from docx import Document
+    from docx.oxml import parse_xml
+    from docx.oxml.ns import nsdecls
+    from lxml import etree
+
+    doc = Document()
+    body = doc.element.body
+    final_sect_pr = body.sectPr
+    section_break = etree.tostring(final_sect_pr).decode().replace(f" {nsdecls('w')}", "")
+
+    chunks = []
+    placeholder_count = 0
+    for page in range(pages):
+        if page % TABLE_EVERY == TABLE_EVERY - 1:
+            chunks.append(_table(page))
+        else:
+            for line in range(PARAGRAPHS_PER_PAGE):
+                if line % 8 == 0:
+                    chunks.append(_placeholder_paragraph(placeholder_count))
+                    placeholder_count += 1
+                else:
+                    chunks.append(f"<w:p>{_run(f'Page {page + 1}, line {line + 1}: body text without placeholders.')}</w:p>")
+        if page == pages - 1:
+            break
+        if (page + 1) % PAGES_PER_SECTION == 0:
+            chunks.append(f"<w:p><w:pPr>{section_break}</w:pPr></w:p>")
+        else:
+            chunks.append('<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+
+    fragment = parse_xml(f"<w:body {nsdecls('w')}>{''.join(chunks)}</w:body>")
+    for child in list(fragment):
+        final_sect_pr.addprevious(child)
+
+    for number, section in enumerate(doc.sections, start=1):
+        section.header.is_linked_to_previous = False
+        header = section.header.paragraphs[0]
+        header.add_run(f"Section {number} - Job card ")
+        header.add_run("<Job Card")
+        header.add_run(" p/n>").bold = True
+        section.footer.is_linked_to_previous = False
+        section.footer.paragraphs[0].add_run("Report date <Date>")
+    doc.save(path)
+
+
+def template_for(pages, directory):
+    """Return the synthetic template of `pages` pages, generating it only the first time."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"synthetic_{pages}p_v{GENERATOR_VERSION}.docx")
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        build_synthetic_template(path, pages)
+        print(f"  generated {os.path.basename(path)} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return path
+
+
+def peak_rss_mb(children=False):
+    """Peak resident set size of this process (or the largest child), in MB; None if unknown."""
+    try:
+        import resource
+    except ImportError:
+        if children or sys.platform != "win32":
+            return None
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / 2 ** 20
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return usage / 2 ** 20 if sys.platform == "darwin" else usage / 1024
+
+
+def measure_document(template_path, output_dir, repeat):
+    """Fill one template once cold and `repeat` times warm; runs in its own interpreter."""
+    from report_engine import generate_report
+
+    start = time.perf_counter()
+    output_path = generate_report(template_path, STORED_VALUES, output_dir, force=True)
+    cold = time.perf_counter() - start
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        generate_report(template_path, STORED_VALUES, output_dir, force=True)
+        warm.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    generate_report(template_path, STORED_VALUES, output_dir)
+    unchanged = time.perf_counter() - start
+    return {
+        "cold_s": cold,
+        "warm_s": statistics.median(warm) if warm else cold,
+        "unchanged_s": unchanged,
+        "peak_rss_mb": peak_rss_mb(),
+        "output_kb": os.path.getsize(output_path) / 1024,
+    }
+
+
+def measure_batch(template_path, output_dir, jobs, workers):
+    """Render `jobs` reports of one template through the batch engine; runs in its own interpreter."""
+    from batch_report import run_batch
+
+    rows = [{"job_card": f"BENCH{i:04d}", "template": template_path} for i in range(jobs)]
+    start = time.perf_counter()
+    results = run_batch(rows, workers, output_dir=output_dir, force=True)
+    wall = time.perf_counter() - start
+    failed = [r for r in results if r["error"]]
+    if failed:
+        raise RuntimeError(f"{len(failed)} batch job(s) failed, first: {failed[0]['error']}")
+    rss = [value for value in (peak_rss_mb(), peak_rss_mb(children=True)) if value is not None]
+    return {
+        "wall_s": wall,
+        "reports_per_s": jobs / wall,
+        "peak_rss_mb": max(rss) if rss else None,
+        "output_kb": sum(os.path.getsize(r["output_path"]) for r in results) / 1024,
+    }
+
+
+def _in_child(*args):
+    """Run this script's --child mode in a fresh interpreter and return its JSON result."""
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", *map(str, args)],
+                               capture_output=True, text=True, cwd=REPO)
+    if completed.returncode != 0:
+        raise RuntimeError(f"benchmark child failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def compare(results, baseline, threshold):
+    """Return [(name, metric, baseline value, new value)] for every metric over the threshold."""
+    regressions = []
+    checks = [(f"{pages} pages", METRICS, results["documents"][pages], baseline["documents"].get(pages))
+              for pages in results["documents"]]
+    if results.get("batch") and baseline.get("batch"):
+        checks.append(("batch", BATCH_METRICS, results["batch"], baseline["batch"]))
+    for name, metrics, new, old in checks:
+        if old is None:
+            continue
+        for metric, slack in metrics:
+            if new.get(metric) is None or old.get(metric) is None:
+                continue
+            if new[metric] > old[metric] * (1 + threshold) and new[metric] - old[metric] > slack:
+                regressions.append((name, metric, old[metric], new[metric]))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'document':>12} {'cold':>9} {'warm':>9} {'unchanged':>10} {'peak RSS':>10} {'output':>10}")
+    for pages, row in results["documents"].items():
+        rss = f"{row['peak_rss_mb']:.1f} MB" if row["peak_rss_mb"] is not None else "n/a"
+        print(f"{pages + ' pages':>12} {row['cold_s']:>8.3f}s {row['warm_s']:>8.3f}s {row['unchanged_s']:>9.4f}s {rss:>10} "
+              f"{row['output_kb']:>7.0f} KB")
+    batch = results.get("batch")
+    if batch:
+        rss = f"{batch['peak_rss_mb']:.1f} MB" if batch["peak_rss_mb"] is not None else "n/a"
+        print(f"batch of {batch['jobs']} x {batch['pages']} pages on {batch['workers']} workers: "
+              f"{batch['wall_s']:.2f}s ({batch['reports_per_s']:.1f} reports/s), peak RSS {rss}, "
+              f"{batch['output_kb']:.0f} KB written")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50, 200, 500])
+    parser.add_argument("--repeat", type=int, default=3, help="warm reports per template")
+    parser.add_argument("--batch-jobs", type=int, default=24, help="reports in the batch run (0 to skip it)")
+    parser.add_argument("--batch-pages", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fraction above the baseline that counts as a regression (default 0.2)")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--template-dir", default=os.path.join(tempfile.gettempdir(), "vna_report_bench"),
+                        help="where the synthetic templates are kept between runs")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        mode, template_path, output_dir, *rest = args.child
+        if mode == "document":
+            result = measure_document(template_path, output_dir, int(rest[0]))
+        else:
+            result = measure_batch(template_path, output_dir, int(rest[0]), int(rest[1]))
+        print(json.dumps(result))
+        return 0
+
+    results = {
+        "generator_version": GENERATOR_VERSION,
+        "machine": {"node": platform.node(), "platform": platform.platform(), "python": platform.python_version()},
+        "documents": {},
+        "batch": None,
+    }
+    with tempfile.TemporaryDirectory() as output_dir:
+        for pages in args.pages:
+            path = template_for(pages, args.template_dir)
+            results["documents"][str(pages)] = _in_child("document", path, output_dir, args.repeat)
+        if args.batch_jobs:
+            path = template_for(args.batch_pages, args.template_dir)
+            batch = _in_child("batch", path, output_dir, args.batch_jobs, args.workers)
+            batch.update(jobs=args.batch_jobs, pages=args.batch_pages, workers=args.workers)
+            results["batch"] = batch
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("generator_version") != GENERATOR_VERSION:
+        print("Baseline was made from different synthetic templates; run with --save-baseline again")
+        return 0
+    if baseline["machine"]["node"] != results["machine"]["node"]:
+        print(f"Note: baseline was recorded on {baseline['machine']['node']}, timings may not be comparable")
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, metric, old, new in regressions:
+        print(f"REGRESSION {name} {metric}: {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100:.0f}%)")
+    if regressions:
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%} of the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Measure SCPI trace transfer throughput against the VNA simulator.
+
+Starts vna_simulator.py in a separate process and acquires four S-parameters
+at several sweep sizes three ways: ASCII one query at a time, REAL,64 blocks
+one query at a time, and REAL,64 blocks with every query pipelined. Reports
+points per second (points x parameters / wall time, median of the rounds).
+
+Usage:
+    python benchmarks/bench_scpi.py [--points 201 1601 10001 100001] [--rounds 5]
+    python benchmarks/bench_scpi.py --host 192.168.0.10 --port 5025    # a real VNA
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from vna_scpi import VnaClient
+
+PARAMETERS = ["S11", "S21", "S12", "S22"]
+MODES = (("ascii", False, False), ("binary", True, False), ("binary pipelined", True, True))
+
+
+async def measure(host, port, points_list, rounds):
+    results = []
+    async with await VnaClient.connect(host, port) as client:
+        for points in points_list:
+            await client.write(f"SENS1:SWE:POIN {points}")
+            await client.check_errors()
+            for name, binary, pipelined in MODES:
+                await client.set_binary(binary)
+                await client.acquire(PARAMETERS, sweep=False, pipelined=pipelined)  # warm the simulator's traces
+                times = []
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    data = await client.acquire(PARAMETERS, sweep=False, pipelined=pipelined)
+                    times.append(time.perf_counter() - start)
+                elapsed = statistics.median(times)
+                results.append((points, name, elapsed, len(data.frequency) * len(PARAMETERS) / elapsed))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[201, 1601, 10001, 100001])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="use a running instrument instead of the simulator")
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    simulator = None
+    port = args.port
+    if port is None:
+        simulator = subprocess.Popen([sys.executable, os.path.join(ROOT, "vna_simulator.py"), "--port", "0"],
+                                     stdout=subprocess.PIPE, text=True)
+        port = int(simulator.stdout.readline())
+    try:
+        results = asyncio.run(measure(args.host, port, args.points, args.rounds))
+    finally:
+        if simulator is not None:
+            simulator.terminate()
+            simulator.wait()
+
+    print(f"{'points':>8}  {'mode':<17} {'ms':>9} {'points/s':>12}")
+    for points, name, elapsed, rate in results:
+        print(f"{points:>8}  {name:<17} {elapsed * 1000:>9.2f} {rate:>12,.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Time how long the main window takes to appear, cold (empty logo cache) and warm.
+
+Each launch runs in a fresh interpreter, from the first import until the main
+window has been drawn once. "legacy" repeats what main_gui used to do on every
+launch: import python-docx and PIL and LANCZOS-resize both full-size logos.
+Needs a display.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+LAUNCH = """
+import time
+start = time.perf_counter()
+import tkinter as tk
+import Gen_Report
+root = tk.Tk()
+Gen_Report.build_main_window(root, {left!r}, {right!r})
+root.update()
+print(time.perf_counter() - start)
+root.destroy()
+"""
+
+LEGACY_LAUNCH = """
+import time
+start = time.perf_counter()
+import tkinter as tk
+from PIL import Image, ImageTk
+from docx import Document
+root = tk.Tk()
+photos = []
+for path in ({left!r}, {right!r}):
+    image = Image.open(path)
+    image = image.resize((int(image.width / 4), int(image.height / 4)), Image.Resampling.LANCZOS)
+    photos.append(ImageTk.PhotoImage(image))
+    tk.Label(root, image=photos[-1]).pack()
+root.update()
+print(time.perf_counter() - start)
+root.destroy()
+"""
+
+
+def make_logos(directory):
+    """Write full-resolution stand-ins for the two logos."""
+    from PIL import Image
+
+    left = os.path.join(directory, "logo.png")
+    right = os.path.join(directory, "vna.jpg")
+    Image.new("RGBA", (3000, 1200), (0, 70, 160, 255)).save(left)
+    Image.new("RGB", (4000, 3000), (200, 200, 200)).save(right, quality=95)
+    return left, right
+
+
+def launch(code, cache_directory):
+    env = dict(os.environ, LOCALAPPDATA=cache_directory)
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"Launch failed (is a display available?):\n{result.stderr}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        left, right = make_logos(tmp)
+        code = LAUNCH.format(left=left, right=right)
+
+        cold = []
+        for i in range(args.repeat):
+            # A new cache directory per run so every launch starts cold
+            cold.append(launch(code, os.path.join(tmp, f"cold{i}")))
+        warm_cache = os.path.join(tmp, "warm")
+        launch(code, warm_cache)
+        warm = [launch(code, warm_cache) for _ in range(args.repeat)]
+        legacy = [launch(LEGACY_LAUNCH.format(left=left, right=right), warm_cache) for _ in range(args.repeat)]
+
+    for name, times in (("legacy", legacy), ("cold", cold), ("warm", warm)):
+        print(f"{name:>7}: median {statistics.median(times):.3f}s  min {min(times):.3f}s  max {max(times):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
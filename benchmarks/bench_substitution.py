@@ -0,0 +1,109 @@
+"""Compare the old paragraph.text substitution with the single-pass run-aware engine.
+
+Usage:
+    python benchmarks/bench_substitution.py [--paragraphs 2000 5000 20000] [--repeat 3]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from docx import Document
+from docx.shared import Pt
+
+from report_engine import PLACEHOLDERS, TemplateCache, replace_placeholders
+
+REPLACEMENTS = {
+    "<Job Card p/n>": "JC12345",
+    "<Port 1>": "SMA",
+    "<Port 2>": "N",
+    "<VNA_Cal>": "XNA34 Jun23-Jun25",
+    "<E-Cal_Cal>": "XRA11 Jun23-Jun25",
+    "<Date>": "01/01/2026",
+}
+
+
+def build_template(path, paragraphs):
+    """Write a template with one placeholder paragraph in ten, a third of them split across runs."""
+    doc = Document()
+    doc.sections[0].header.paragraphs[0].text = "Job card <Job Card p/n>"
+    for i in range(paragraphs):
+        p = doc.add_paragraph()
+        if i % 10 == 0:
+            placeholder = PLACEHOLDERS[1 + (i // 10) % (len(PLACEHOLDERS) - 1)]
+            if i % 30 == 0:
+                p.add_run("Measured with ")
+                p.add_run(placeholder[:3])
+                p.add_run(placeholder[3:])
+            else:
+                p.add_run(f"Measured with {placeholder} on this line")
+        else:
+            p.add_run(f"Body text line {i} without any placeholder in it.")
+    doc.save(path)
+
+
+def legacy_substitute(doc):
+    """The substitution as it was before the run-aware engine, kept here as the reference."""
+    for section in doc.sections:
+        for paragraph in section.header.paragraphs:
+            if "<Job Card p/n>" in paragraph.text:
+                paragraph.text = paragraph.text.replace("<Job Card p/n>", REPLACEMENTS["<Job Card p/n>"])
+    for paragraph in doc.paragraphs:
+        for placeholder in PLACEHOLDERS[1:]:
+            if placeholder in paragraph.text:
+                paragraph.text = paragraph.text.replace(placeholder, REPLACEMENTS[placeholder])
+                for run in paragraph.runs:
+                    run.font.size = Pt(11)
+
+
+def best_of(repeat, func):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=[2000, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'paragraphs':>10} {'legacy':>10} {'single-pass':>12} {'cached':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.paragraphs:
+            path = os.path.join(tmp, f"template_{count}.docx")
+            build_template(path, count)
+            cache = TemplateCache()
+
+            def legacy():
+                doc = Document(path)
+                legacy_substitute(doc)
+                doc.save(io.BytesIO())
+
+            def single_pass():
+                doc = Document(path)
+                replace_placeholders(doc, REPLACEMENTS)
+                doc.save(io.BytesIO())
+
+            def cached():
+                template = cache.get(path)
+                doc = template.clone()
+                template.fill(doc, REPLACEMENTS)
+                doc.save(io.BytesIO())
+
+            t_legacy = best_of(args.repeat, legacy)
+            t_single = best_of(args.repeat, single_pass)
+            cached()  # compile once, as the first report of a batch does
+            t_cached = best_of(args.repeat, cached)
+            print(f"{count:>10} {t_legacy:>9.3f}s {t_single:>11.3f}s {t_cached:>9.3f}s {t_legacy / t_cached:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
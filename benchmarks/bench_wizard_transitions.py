@@ -0,0 +1,73 @@
+"""Measure wizard step-transition latency against the 16 ms budget.
+
+Walks the wizard forwards and backwards through every step several times and
+reports the first visit (frame built) separately from later visits (frame
+raised and re-bound). Exits with status 1 when the 95th percentile of later
+visits is over budget. Needs a display.
+
+Usage:
+    python benchmarks/bench_wizard_transitions.py [--rounds 20]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import tkinter as tk
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import job_history
+
+# Keep the production job history out of it; Gen_Report binds JOB_HISTORY at import
+HISTORY_DIRECTORY = tempfile.TemporaryDirectory()
+job_history.JOB_HISTORY = job_history.JobHistory(os.path.join(HISTORY_DIRECTORY.name, "history.sqlite3"))
+
+from Gen_Report import STEP_TRANSITION_BUDGET_MS, MultiStepWizard
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    root = tk.Tk()
+    root.withdraw()
+    window = tk.Toplevel(root)
+    # Leaving step 1 resolves the template path; no template is needed for that
+    logging.disable(logging.WARNING)
+    wizard = MultiStepWizard(window, {})
+
+    steps = len(wizard.steps_order) - 1
+    for _ in range(args.rounds):
+        for _ in range(steps):
+            wizard.next()
+            root.update()
+        for _ in range(steps):
+            wizard.back()
+            root.update()
+
+    seen = set()
+    first, later = [], []
+    for step, ms in wizard.transition_times:
+        (later if step in seen else first).append(ms)
+        seen.add(step)
+    root.destroy()
+    job_history.JOB_HISTORY.close()
+    HISTORY_DIRECTORY.cleanup()
+
+    print(f"first visit : median {statistics.median(first):6.2f} ms  max {max(first):6.2f} ms")
+    p95 = percentile(later, 0.95)
+    print(f"later visits: median {statistics.median(later):6.2f} ms  p95 {p95:6.2f} ms  max {max(later):6.2f} ms")
+    print(f"budget      : {STEP_TRANSITION_BUDGET_MS} ms -> {'OK' if p95 <= STEP_TRANSITION_BUDGET_MS else 'OVER'}")
+    return 0 if p95 <= STEP_TRANSITION_BUDGET_MS else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""Write a report by streaming the template package into the output, zip to zip.
+
+python-docx parses every part of the template and keeps the whole report tree
+in memory until doc.save() serializes it in one go, so a report with hundreds
+of serials needs memory in proportion to its size. write_report() instead
+copies every part it does not need to change straight from the template zip
+to the output zip, and rewrites only document.xml and the headers, footers and
+notes that contain placeholders. Those are read with lxml's iterparse one
+top-level block (paragraph, table) at a time: the block has its placeholders
+substituted, is written out and is then dropped from the tree. Content for the
+<Measurements>, <Plots> and <Summary> paragraphs comes from iterables that are
+consumed as the output is written, so peak memory stays roughly constant
+whatever the number of tables and plots.
+
+Plot images go into the output zip as they are met; document.xml is spooled
+to a temporary file meanwhile and copied in after them. Only the small
+relationship and content-type parts are parsed whole.
+"""
+import logging
+import os
+import posixpath
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import zipfile
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import nsdecls, qn
+from lxml import etree
+
+from report_engine import STORY_CONTENT_TYPES, W_P, W_T, paragraph_has_placeholder, substitute_paragraph
+
+CONTENT_TYPES_PART = "[Content_Types].xml"
+PACKAGE_RELS_PART = "_rels/.rels"
+COPY_BUFFER = 1 << 20
+EMU_PER_INCH = 914400
+XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n'
+# docPr ids of inserted pictures start here, well clear of the template's own drawings
+FIRST_PICTURE_ID = 10000
+
+CT_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+RELS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+W_BODY = qn("w:body")
+W_SECT_PR = qn("w:sectPr")
+
+_PICTURE_XML = (
+    '<w:p {nsdecls}><w:r><w:drawing><wp:inline distT="0" distB="0" distL="0" distR="0">'
+    '<wp:extent cx="{cx}" cy="{cy}"/><wp:docPr id="{id}" name="Picture {id}"/>'
+    '<wp:cNvGraphicFramePr><a:graphicFrameLocks noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+    '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+    '<pic:pic><pic:nvPicPr><pic:cNvPr id="{id}" name="{name}"/><pic:cNvPicPr/></pic:nvPicPr>'
+    '<pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+    '<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr></pic:pic>'
+    '</a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>'
+)
+_NAMESPACE_DECLARATION = re.compile(rb'\sxmlns(?::([\w.-]+))?="([^"]*)"')
+
+log = logging.getLogger(__name__)
+
+
+class Picture:
+    """A PNG to place as its own paragraph: a file path or the image bytes, and a width in inches."""
+
+    __slots__ = ("source", "width_in")
+
+    def __init__(self, source, width_in):
+        self.source = source
+        self.width_in = width_in
+
+
+def bold_paragraph_xml(text):
+    """Return the XML of a paragraph holding one bold run, e.g. a serial heading."""
+    return (f'<w:p {nsdecls("w")}><w:r><w:rPr><w:b/></w:rPr>'
+            f'<w:t xml:space="preserve">{_escape(text)}</w:t></w:r></w:p>')
+
+
+def _escape(text, quote=False):
+    text = str(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return text.replace('"', "&quot;") if quote else text
+
+
+def png_size(head):
+    """Return (width, height) in pixels from the first 24 bytes of a PNG."""
+    if head[:8] != b"\x89PNG\r\n\x1a\n" or head[12:16] != b"IHDR":
+        raise ValueError("Not a PNG image")
+    return struct.unpack(">II", head[16:24])
+
+
+def template_table_style_id(template_path, style_name="Table Grid"):
+    """Return the style id of a named style in a template's styles.xml, without loading the document."""
+    with zipfile.ZipFile(template_path) as package:
+        try:
+            stream = package.open("word/styles.xml")
+        except KeyError:
+            return None
+        with stream:
+            for _, style in etree.iterparse(stream, tag=qn("w:style"), huge_tree=True):
+                name = style.find(qn("w:name"))
+                if name is not None and name.get(qn("w:val")) == style_name:
+                    return style.get(qn("w:styleId"))
+                style.clear()
+    return None
+
+
+def _part_name(base_part, target):
+    """Resolve a relationship target against the part it belongs to, as a zip member name."""
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_part), target)).lstrip("/")
+
+
+def _rels_part(part):
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, "_rels", name + ".rels")
+
+
+def _qualified(name, prefixes):
+    """Return a Clark-notation name as prefix:local using the namespace-to-prefix map."""
+    if name[0] != "{":
+        return name
+    uri, local = name[1:].split("}", 1)
+    if uri == "http://www.w3.org/XML/1998/namespace":
+        return "xml:" + local
+    prefix = prefixes.get(uri)
+    return f"{prefix}:{local}" if prefix else local
+
+
+def _start_tag(element, prefixes, declare=False):
+    parts = [_qualified(element.tag, prefixes)]
+    if declare:
+        for prefix, uri in element.nsmap.items():
+            parts.append(f'xmlns:{prefix}="{_escape(uri, quote=True)}"' if prefix
+                         else f'xmlns="{_escape(uri, quote=True)}"')
+    for name, value in element.attrib.items():
+        parts.append(f'{_qualified(name, prefixes)}="{_escape(value, quote=True)}"')
+    return ("<" + " ".join(parts) + ">").encode("utf-8")
+
+
+def _paragraph_text(p):
+    return "".join(t.text or "" for t in p.iter(W_T))
+
+
+class _PackageWriter:
+    """One template-to-report copy; see write_report."""
+
+    def __init__(self, source, target, replacements, blocks, append_missing):
+        self.source = source
+        self.target = target
+        self.replacements = replacements
+        self.blocks = blocks
+        self.append_missing = append_missing
+        self.used_blocks = set()
+        self.content_types = etree.fromstring(source.read(CONTENT_TYPES_PART))
+        package_rels = etree.fromstring(source.read(PACKAGE_RELS_PART))
+        self.main_part = next(_part_name("/", rel.get("Target")) for rel in package_rels
+                              if rel.get("Type") == RT.OFFICE_DOCUMENT)
+        self.main_rels_part = _rels_part(self.main_part)
+        names = set(source.namelist())
+        self.main_rels = (etree.fromstring(source.read(self.main_rels_part)) if self.main_rels_part in names
+                          else etree.Element(f"{{{RELS_NS}}}Relationships", nsmap={None: RELS_NS}))
+        self.relationship_ids = {rel.get("Id") for rel in self.main_rels}
+        self.member_names = names
+        self.next_picture = FIRST_PICTURE_ID
+
+    def _content_type(self, name):
+        for override in self.content_types.iter(f"{{{CT_NS}}}Override"):
+            if override.get("PartName").lstrip("/") == name:
+                return override.get("ContentType")
+        extension = name.rpartition(".")[2].lower()
+        for default in self.content_types.iter(f"{{{CT_NS}}}Default"):
+            if default.get("Extension").lower() == extension:
+                return default.get("ContentType")
+        return None
+
+    def _has_placeholder(self, info):
+        """Scan a part's bytes for an escaped '<', which every placeholder starts with."""
+        tail = b""
+        with self.source.open(info) as stream:
+            for chunk in iter(lambda: stream.read(COPY_BUFFER), b""):
+                if b"&lt;" in tail + chunk:
+                    return True
+                tail = chunk[-3:]
+        return False
+
+    def _copy(self, info):
+        copied = zipfile.ZipInfo(info.filename, info.date_time)
+        copied.compress_type = info.compress_type
+        copied.external_attr = info.external_attr
+        with self.source.open(info) as source, self.target.open(copied, "w", force_zip64=True) as target:
+            shutil.copyfileobj(source, target, COPY_BUFFER)
+
+    def write(self):
+        spool = None
+        for info in self.source.infolist():
+            name = info.filename
+            if name in (CONTENT_TYPES_PART, self.main_rels_part):
+                continue
+            if name == self.main_part:
+                spool = tempfile.TemporaryFile()
+                with self.source.open(info) as stream:
+                    self._rewrite(stream, spool, self.blocks)
+                spool.seek(0)
+                main_info = info
+            elif self._content_type(name) in STORY_CONTENT_TYPES and self._has_placeholder(info):
+                with self.source.open(info) as stream, self.target.open(self._new_info(info), "w") as target:
+                    self._rewrite(stream, target, {})
+            else:
+                self._copy(info)
+        if spool is None:
+            raise ValueError(f"The template has no {self.main_part}")
+        with spool, self.target.open(self._new_info(main_info), "w", force_zip64=True) as target:
+            shutil.copyfileobj(spool, target, COPY_BUFFER)
+        self.target.writestr(self._new_info(main_info, self.main_rels_part),
+                             XML_DECLARATION + etree.tostring(self.main_rels))
+        self.target.writestr(self._new_info(self.source.getinfo(CONTENT_TYPES_PART)),
+                             XML_DECLARATION + etree.tostring(self.content_types))
+        unused = set(self.blocks) - self.used_blocks
+        if unused:
+            log.debug("No %s paragraph in the template", ", ".join(sorted(unused)))
+
+    @staticmethod
+    def _new_info(info, name=None):
+        new_info = zipfile.ZipInfo(name or info.filename, info.date_time)
+        new_info.compress_type = zipfile.ZIP_DEFLATED
+        return new_info
+
+    def _rewrite(self, stream, out, blocks):
+        """Stream one story part from stream to out, substituting placeholders block by block.
+
+        Blocks are the root's children and, in document.xml, the body's
+        children. A block that is a paragraph reading exactly one of the keys of
+        blocks is replaced by that key's content.
+        """
+        prefixes = {}
+        root = None
+        in_body = False
+        depth = 0
+        pending = [key for key in blocks if key in self.append_missing]
+        for event, element in etree.iterparse(stream, events=("start", "end"), huge_tree=True):
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    root = element
+                    prefixes = {uri: prefix for prefix, uri in element.nsmap.items() if prefix}
+                    out.write(XML_DECLARATION + _start_tag(element, prefixes, declare=True))
+                elif depth == 2 and element.tag == W_BODY:
+                    in_body = True
+                    out.write(_start_tag(element, prefixes))
+                continue
+
+            depth -= 1
+            if depth == 0:
+                out.write(f"</{_qualified(element.tag, prefixes)}>".encode("utf-8"))
+            elif depth == 1 and element.tag == W_BODY:
+                self._write_pending(out, blocks, pending)
+                in_body = False
+                out.write(f"</{_qualified(element.tag, prefixes)}>".encode("utf-8"))
+                element.clear()
+            elif depth == 1 or (depth == 2 and in_body):
+                if in_body and element.tag == W_SECT_PR:
+                    self._write_pending(out, blocks, pending)
+                key = _paragraph_text(element).strip() if element.tag == W_P else None
+                if key in blocks:
+                    self.used_blocks.add(key)
+                    if key in pending:
+                        pending.remove(key)
+                    self._write_content(out, blocks[key])
+                else:
+                    for p in element.iter(W_P):
+                        if paragraph_has_placeholder(p):
+                            substitute_paragraph(p, self.replacements)
+                    out.write(self._serialize(element, root))
+                # Drop what has been written so the tree never holds more than one block
+                element.clear()
+                parent = element.getparent()
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    def _write_pending(self, out, blocks, pending):
+        """Append content whose placeholder the body did not have, before the section properties."""
+        for key in pending:
+            self._write_content(out, blocks[key])
+        pending.clear()
+
+    @staticmethod
+    def _serialize(element, root):
+        """Serialize a block without repeating the namespace declarations the root already makes."""
+        xml = etree.tostring(element, encoding="utf-8", with_tail=False)
+        end = xml.index(b">")
+        declared = {(prefix or "").encode("utf-8"): uri.encode("utf-8") for prefix, uri in root.nsmap.items()}
+        head = _NAMESPACE_DECLARATION.sub(
+            lambda match: b"" if declared.get(match.group(1) or b"") == match.group(2) else match.group(0),
+            xml[:end])
+        return head + xml[end:]
+
+    def _write_content(self, out, content):
+        for item in content:
+            if isinstance(item, Picture):
+                item = self._picture_xml(item)
+            out.write(item.encode("utf-8") if isinstance(item, str) else item)
+
+    def _picture_xml(self, picture):
+        """Store the image in the output zip and return the paragraph that shows it."""
+        self.next_picture += 1
+        number = self.next_picture
+        media_name = f"word/media/report{number}.png"
+        while media_name in self.member_names:
+            media_name = f"word/media/report{number}_{len(self.member_names)}.png"
+        self.member_names.add(media_name)
+
+        info = zipfile.ZipInfo(media_name, (1980, 1, 1, 0, 0, 0))
+        info.compress_type = zipfile.ZIP_STORED  # PNG data is already compressed
+        if isinstance(picture.source, (bytes, bytearray, memoryview)):
+            head = bytes(picture.source[:24])
+            self.target.writestr(info, picture.source)
+        else:
+            with open(picture.source, "rb") as image, self.target.open(info, "w", force_zip64=True) as target:
+                head = image.read(24)
+                target.write(head)
+                shutil.copyfileobj(image, target, COPY_BUFFER)
+        width, height = png_size(head)
+
+        rid = f"rIdReport{number}"
+        while rid in self.relationship_ids:
+            rid += "_"
+        self.relationship_ids.add(rid)
+        etree.SubElement(self.main_rels, f"{{{RELS_NS}}}Relationship", Id=rid, Type=RT.IMAGE,
+                         Target=posixpath.relpath(media_name, posixpath.dirname(self.main_part)))
+        if not any(default.get("Extension").lower() == "png"
+                   for default in self.content_types.iter(f"{{{CT_NS}}}Default")):
+            self.content_types.insert(0, etree.Element(f"{{{CT_NS}}}Default", Extension="png",
+                                                       ContentType="image/png"))
+
+        cx = int(picture.width_in * EMU_PER_INCH)
+        cy = int(cx * height / width)
+        return _PICTURE_XML.format(nsdecls=nsdecls("w", "wp", "a", "pic", "r"), cx=cx, cy=cy, id=number,
+                                   name=posixpath.basename(media_name), rid=rid)
+
+
+def write_report(template_path, output_path, replacements, blocks=None, append_missing=()):
+    """Stream template_path into output_path with placeholders substituted.
+
+    blocks maps a placeholder paragraph of the body (e.g. "<Measurements>") to
+    an iterable of XML strings and Picture objects written in its place; the
+    iterable is consumed while the report is written. Keys listed in
+    append_missing are written at the end of the body when the template has no
+    such paragraph, the others are then dropped. The report is written to a
+    temporary file and renamed over output_path, like save_atomically.
+    """
+    temp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with zipfile.ZipFile(template_path) as source, zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as target:
+            _PackageWriter(source, target, replacements, blocks or {}, append_missing).write()
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return output_path
@@ -0,0 +1,389 @@
+"""Calibrations, connectors and report history in a local SQLite database.
+
+Replaces the calibration and connector choices that were hard-coded in the
+wizard, keeps calibrations added with "Add New", and records every report with
+its job card, serials, calibrations and date. Reports are indexed by job card,
+report date and each calibration (with the date), and serials have their own
+index, so lookups such as "all reports using XRA11 last quarter" are index
+range scans that stay in the milliseconds over years of history.
+
+Calibration labels keep the form the templates already use, e.g.
+"XRA11 Jun23-Jun25": the instrument and its validity window, month to month.
+
+Usage:
+    python job_history.py reports --calibration XRA11 --since 2025-07-01 --until 2025-09-30
+    python job_history.py reports --job-card 12345-A
+    python job_history.py calibrations
+    python job_history.py add-calibration ecal "XRA12 Jul25-Jul27"
+"""
+import argparse
+import calendar
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime
+
+from app_paths import HISTORY_DATABASE
+
+CALIBRATION_KINDS = ("vna", "ecal")
+# Offered until the first calibrations are added
+DEFAULT_CALIBRATIONS = (("vna", "XNA34 Jun23-Jun25"), ("ecal", "XRA11 Jun23-Jun25"))
+DEFAULT_CONNECTORS = ("SMA", "N", "SMB", "SMP")
+CALIBRATION_LABEL_PATTERN = re.compile(r"^\s*(\S+)\s+([A-Za-z]{3})(\d{2})\s*-\s*([A-Za-z]{3})(\d{2})\s*$")
+REPORT_DATE_FORMAT = "%d/%m/%Y"
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calibrations (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    label TEXT NOT NULL,
+    instrument TEXT NOT NULL,
+    valid_from TEXT,
+    valid_to TEXT,
+    added TEXT NOT NULL,
+    UNIQUE (kind, label)
+);
+CREATE TABLE IF NOT EXISTS connectors (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    job_card TEXT NOT NULL,
+    user_name TEXT,
+    report_date TEXT,
+    port_1_connector TEXT,
+    port_2_connector TEXT,
+    vna_calibration_id INTEGER REFERENCES calibrations (id),
+    ecal_calibration_id INTEGER REFERENCES calibrations (id),
+    selected_options TEXT,
+    output_path TEXT,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS report_serials (
+    report_id INTEGER NOT NULL REFERENCES reports (id),
+    serial TEXT NOT NULL,
+    PRIMARY KEY (report_id, serial)
+);
+CREATE INDEX IF NOT EXISTS calibrations_instrument ON calibrations (instrument);
+CREATE INDEX IF NOT EXISTS reports_job_card ON reports (job_card, created);
+CREATE INDEX IF NOT EXISTS reports_date ON reports (report_date);
+CREATE INDEX IF NOT EXISTS reports_vna_calibration ON reports (vna_calibration_id, report_date);
+CREATE INDEX IF NOT EXISTS reports_ecal_calibration ON reports (ecal_calibration_id, report_date);
+CREATE INDEX IF NOT EXISTS report_serials_serial ON report_serials (serial);
+"""
+
+log = logging.getLogger(__name__)
+
+
+class Calibration:
+    """One calibration record; valid_from and valid_to are dates or None when unknown."""
+
+    __slots__ = ("id", "kind", "label", "instrument", "valid_from", "valid_to")
+
+    def __init__(self, id, kind, label, instrument, valid_from, valid_to):
+        self.id = id
+        self.kind = kind
+        self.label = label
+        self.instrument = instrument
+        self.valid_from = date.fromisoformat(valid_from) if valid_from else None
+        self.valid_to = date.fromisoformat(valid_to) if valid_to else None
+
+    def expired_on(self, day):
+        """Return True when the validity window is known and day falls after it."""
+        return self.valid_to is not None and day > self.valid_to
+
+    def __repr__(self):
+        return f"Calibration({self.kind}, {self.label!r})"
+
+
+def parse_calibration_label(label):
+    """Split "XRA11 Jun23-Jun25" into ("XRA11", 2023-06-01, 2025-06-30); dates are None if not given."""
+    match = CALIBRATION_LABEL_PATTERN.match(label)
+    if not match:
+        return label.split()[0] if label.split() else label, None, None
+    instrument, from_month, from_year, to_month, to_year = match.groups()
+    try:
+        start = datetime.strptime(f"{from_month.title()}{from_year}", "%b%y").date()
+        end = datetime.strptime(f"{to_month.title()}{to_year}", "%b%y").date()
+    except ValueError:
+        return instrument, None, None
+    return instrument, start, end.replace(day=calendar.monthrange(end.year, end.month)[1])
+
+
+def parse_report_date(text):
+    """Return the wizard's DD/MM/YYYY report date as a date, or None."""
+    try:
+        return datetime.strptime(text or "", REPORT_DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+
+class JobHistory:
+    """The history database. One connection shared by the threads of the process, under a lock."""
+
+    def __init__(self, path=HISTORY_DATABASE):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+        self._calibration_cache = {}  # (kind, label) -> Calibration
+
+    def _db(self):
+        if self._connection is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                connection.executescript(SCHEMA)
+                connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            if connection.execute("SELECT COUNT(*) FROM connectors").fetchone()[0] == 0:
+                connection.executemany("INSERT INTO connectors (name, position) VALUES (?, ?)",
+                                       [(name, position) for position, name in enumerate(DEFAULT_CONNECTORS)])
+            self._connection = connection
+            for kind, label in DEFAULT_CALIBRATIONS:
+                if not self._calibrations(kind):
+                    self._add_calibration(kind, label)
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # Calibrations
+
+    def _calibrations(self, kind):
+        rows = self._connection.execute(
+            "SELECT id, kind, label, instrument, valid_from, valid_to FROM calibrations WHERE kind = ? "
+            "ORDER BY valid_to IS NULL, valid_to DESC, label", (kind,)).fetchall()
+        return [Calibration(*row) for row in rows]
+
+    def _add_calibration(self, kind, label):
+        instrument, valid_from, valid_to = parse_calibration_label(label)
+        self._connection.execute(
+            "INSERT OR IGNORE INTO calibrations (kind, label, instrument, valid_from, valid_to, added) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (kind, label, instrument, valid_from and valid_from.isoformat(), valid_to and valid_to.isoformat(),
+             datetime.now().isoformat(timespec="seconds")))
+
+    def calibrations(self, kind, on_date=None):
+        """Return the calibrations of a kind ("vna" or "ecal"), latest validity first.
+
+        With on_date, calibrations known to have expired by then are left out.
+        """
+        with self._lock:
+            self._db()
+            calibrations = self._calibrations(kind)
+        if on_date is not None:
+            calibrations = [calibration for calibration in calibrations if not calibration.expired_on(on_date)]
+        return calibrations
+
+    def add_calibration(self, kind, label):
+        """Record a calibration (e.g. one entered with "Add New") and return it."""
+        if kind not in CALIBRATION_KINDS:
+            raise ValueError(f"Unknown calibration kind {kind!r}")
+        label = label.strip()
+        with self._lock:
+            self._db()
+            self._add_calibration(kind, label)
+            self._calibration_cache.pop((kind, label), None)
+        log.info("Added %s calibration %s", kind, label)
+        return self.calibration(kind, label)
+
+    def calibration(self, kind, label):
+        """Return the Calibration with this label, or None when it was never recorded."""
+        key = (kind, label)
+        with self._lock:
+            if key not in self._calibration_cache:
+                row = self._db().execute(
+                    "SELECT id, kind, label, instrument, valid_from, valid_to FROM calibrations "
+                    "WHERE kind = ? AND label = ?", key).fetchone()
+                if row is None:
+                    return None
+                self._calibration_cache[key] = Calibration(*row)
+            return self._calibration_cache[key]
+
+    def expired_calibrations(self, stored_values):
+        """Return a warning line for each of the wizard's calibrations expired on the report date."""
+        day = parse_report_date(stored_values.get("report_date")) or date.today()
+        calibration_data = stored_values.get("calibration_data", {})
+        warnings = []
+        for kind, key, title in (("vna", "data1", "VNA calibration"), ("ecal", "data2", "E-Cal calibration")):
+            label = calibration_data.get(key)
+            if not label:
+                continue
+            calibration = self.calibration(kind, label)
+            valid_to = calibration.valid_to if calibration else parse_calibration_label(label)[2]
+            if valid_to is not None and day > valid_to:
+                warnings.append(f"{title} {label} expired on {valid_to.strftime(REPORT_DATE_FORMAT)}")
+        return warnings
+
+    # Connectors
+
+    def connectors(self):
+        with self._lock:
+            return [name for (name,) in self._db().execute("SELECT name FROM connectors ORDER BY position")]
+
+    # Reports
+
+    def record_report(self, stored_values, output_path=None):
+        """Record a generated report and return its id. Unknown calibrations are added as they are."""
+        calibration_data = stored_values.get("calibration_data", {})
+        calibration_ids = []
+        for kind, key in (("vna", "data1"), ("ecal", "data2")):
+            label = calibration_data.get(key)
+            calibration = None
+            if label:
+                calibration = self.calibration(kind, label) or self.add_calibration(kind, label)
+            calibration_ids.append(calibration.id if calibration else None)
+        report_date = parse_report_date(stored_values.get("report_date"))
+        with self._lock:
+            cursor = self._db().execute(
+                "INSERT INTO reports (job_card, user_name, report_date, port_1_connector, port_2_connector, "
+                "vna_calibration_id, ecal_calibration_id, selected_options, output_path, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(stored_values.get("job_card") or ""), stored_values.get("user_name"),
+                 report_date and report_date.isoformat(), stored_values.get("port_1_connector"),
+                 stored_values.get("port_2_connector"), *calibration_ids,
+                 ";".join(sorted(stored_values.get("selected_options") or [])), output_path,
+                 datetime.now().isoformat(timespec="seconds")))
+            return cursor.lastrowid
+
+    def add_serials(self, report_id, serials):
+        """Record the serials measured into a report."""
+        with self._lock:
+            connection = self._db()
+            with connection:
+                connection.execute("BEGIN")
+                connection.executemany("INSERT OR IGNORE INTO report_serials (report_id, serial) VALUES (?, ?)",
+                                       [(report_id, str(serial)) for serial in serials])
+
+    def last_report(self, job_card):
+        """Return the wizard values of the latest report of a job card, for prefilling, or None."""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT r.user_name, r.port_1_connector, r.port_2_connector, v.label, e.label, r.selected_options "
+                "FROM reports r LEFT JOIN calibrations v ON v.id = r.vna_calibration_id "
+                "LEFT JOIN calibrations e ON e.id = r.ecal_calibration_id "
+                "WHERE r.job_card = ? ORDER BY r.created DESC, r.id DESC LIMIT 1", (str(job_card),)).fetchone()
+        if row is None:
+            return None
+        user_name, port_1, port_2, vna_label, ecal_label, options = row
+        return {"user_name": user_name, "port_1_connector": port_1, "port_2_connector": port_2,
+                "calibration_data": {key: label for key, label in (("data1", vna_label), ("data2", ecal_label))
+                                     if label},
+                "selected_options": set(filter(None, (options or "").split(";")))}
+
+    def last_calibration(self, kind):
+        """Return the label of the calibration of a kind used in the latest report, or None."""
+        column = "vna_calibration_id" if kind == "vna" else "ecal_calibration_id"
+        with self._lock:
+            row = self._db().execute(
+                f"SELECT c.label FROM reports r JOIN calibrations c ON c.id = r.{column} "
+                "ORDER BY r.id DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def job_cards(self, prefix, limit=20):
+        """Return up to limit distinct job cards starting with prefix, for autocompletion."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT DISTINCT job_card FROM reports WHERE job_card >= ? AND job_card < ? ORDER BY job_card LIMIT ?",
+                (prefix, prefix + "\U0010ffff", limit)).fetchall()
+        return [job_card for (job_card,) in rows]
+
+    def reports(self, job_card=None, serial=None, calibration=None, since=None, until=None, limit=None):
+        """Return reports as dicts, newest report date first.
+
+        calibration matches an instrument ("XRA11") or a full label, of either
+        kind; since and until are inclusive dates on the report date.
+        """
+        conditions, parameters = [], []
+        if job_card is not None:
+            conditions.append("r.job_card = ?")
+            parameters.append(str(job_card))
+        if serial is not None:
+            conditions.append("r.id IN (SELECT report_id FROM report_serials WHERE serial = ?)")
+            parameters.append(str(serial))
+        if calibration is not None:
+            conditions.append("(r.vna_calibration_id IN (SELECT id FROM calibrations WHERE instrument = ? OR label = ?)"
+                              " OR r.ecal_calibration_id IN (SELECT id FROM calibrations WHERE instrument = ? OR label = ?))")
+            parameters += [calibration] * 4
+        if since is not None:
+            conditions.append("r.report_date >= ?")
+            parameters.append(since.isoformat())
+        if until is not None:
+            conditions.append("r.report_date <= ?")
+            parameters.append(until.isoformat())
+        query = ("SELECT r.id, r.job_card, r.user_name, r.report_date, r.port_1_connector, r.port_2_connector, "
+                 "v.label, e.label, r.selected_options, r.output_path, r.created "
+                 "FROM reports r LEFT JOIN calibrations v ON v.id = r.vna_calibration_id "
+                 "LEFT JOIN calibrations e ON e.id = r.ecal_calibration_id")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY r.report_date DESC, r.id DESC"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        columns = ("id", "job_card", "user_name", "report_date", "port_1_connector", "port_2_connector",
+                   "vna_calibration", "ecal_calibration", "selected_options", "output_path", "created")
+        with self._lock:
+            rows = self._db().execute(query, parameters).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+
+# Shared by every wizard in the process
+JOB_HISTORY = JobHistory()
+
+
+def _date_argument(text):
+    return date.fromisoformat(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the report and calibration history.")
+    parser.add_argument("--database", default=HISTORY_DATABASE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    reports = commands.add_parser("reports", help="list reports")
+    reports.add_argument("--job-card")
+    reports.add_argument("--serial")
+    reports.add_argument("--calibration", help="instrument (e.g. XRA11) or full calibration label")
+    reports.add_argument("--since", type=_date_argument, help="YYYY-MM-DD")
+    reports.add_argument("--until", type=_date_argument, help="YYYY-MM-DD")
+    reports.add_argument("--limit", type=int)
+    commands.add_parser("calibrations", help="list calibrations and their validity")
+    add = commands.add_parser("add-calibration", help='record a calibration, e.g. vna "XNA35 Jul25-Jul27"')
+    add.add_argument("kind", choices=CALIBRATION_KINDS)
+    add.add_argument("label")
+    args = parser.parse_args(argv)
+
+    history = JobHistory(args.database)
+    if args.command == "reports":
+        start = time.perf_counter()
+        rows = history.reports(args.job_card, args.serial, args.calibration, args.since, args.until, args.limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for row in rows:
+            print(f"{row['report_date'] or '?':<10}  {row['job_card']:<16} {row['vna_calibration'] or '-':<20} "
+                  f"{row['ecal_calibration'] or '-':<20} {row['output_path'] or ''}")
+        print(f"{len(rows)} report(s) in {elapsed_ms:.1f} ms")
+    elif args.command == "calibrations":
+        today = date.today()
+        for kind in CALIBRATION_KINDS:
+            for calibration in history.calibrations(kind):
+                state = "expired" if calibration.expired_on(today) else "valid"
+                print(f"{kind:<5} {calibration.label:<24} {calibration.valid_from or '?'} .. "
+                      f"{calibration.valid_to or '?'}  {state}")
+    else:
+        history.add_calibration(args.kind, args.label)
+    history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""Pass/fail of return loss and insertion loss against per-connector limit masks.
+
+A mask is a list of (start_hz, stop_hz, limit_db) segments, the same form as
+the plots' limit lines. Reflections (S11, S22) must stay at or below the
+return-loss line of their port's connector. Transmissions (S21, S12) must stay
+at or above the insertion-loss line, taken as the looser of the two ports'
+masks and only where both connectors are specified.
+
+Every serial of a parameter is evaluated at once: the mask is expanded onto
+the frequency axis a single time and compared with a (serials x points) block
+of magnitudes, so the cost is a few NumPy passes whatever the serial count.
+
+The masks come from the connector limits file next to the templates
+(CONNECTOR_LIMITS_FILE), return loss and insertion loss in dB (positive):
+
+    {"SMA": {"return_loss": [[0, 6e9, 20.0], [6e9, 18e9, 14.0]],
+             "insertion_loss": [[0, 18e9, 1.0]]}}
+
+A connector that is not in the file, or a missing file, gets no limit lines and
+no summary rows; there are no built-in figures.
+"""
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from app_paths import CONNECTOR_LIMITS_FILE
+from tracing import span
+
+LIMIT_KINDS = ("return_loss", "insertion_loss")
+# Serials evaluated per block, so the (serials x points) arrays stay a few tens of MB
+BLOCK_SERIALS = 64
+
+log = logging.getLogger(__name__)
+
+# path -> ((mtime_ns, size), limits), so the shared file is only re-read when it changes
+_limits_cache = {}
+_limits_lock = threading.Lock()
+
+
+class LimitResult:
+    """Outcome of one trace against its mask. Margins are in dB, positive when inside the limit."""
+
+    __slots__ = ("serial", "parameter", "connector", "passed", "worst_margin_db", "worst_frequency_hz",
+                 "failing_points", "failing_ranges")
+
+    def __init__(self, serial, parameter, connector, passed, worst_margin_db, worst_frequency_hz, failing_points,
+                 failing_ranges):
+        self.serial = serial
+        self.parameter = parameter
+        self.connector = connector
+        self.passed = passed
+        self.worst_margin_db = worst_margin_db
+        self.worst_frequency_hz = worst_frequency_hz
+        self.failing_points = failing_points
+        self.failing_ranges = failing_ranges  # [(start_hz, stop_hz)] of consecutive failing points
+
+    def __repr__(self):
+        return (f"LimitResult({self.serial!r}, {self.parameter}, {'PASS' if self.passed else 'FAIL'}, "
+                f"worst {self.worst_margin_db:.2f} dB at {self.worst_frequency_hz / 1e9:.4g} GHz)")
+
+
+def _looser_lower(first, second):
+    """Combine two lower-bound masks: the lower line where both are defined."""
+    edges = sorted({edge for segments in (first, second) for start, stop, _ in segments for edge in (start, stop)})
+    combined = []
+    for start, stop in zip(edges, edges[1:]):
+        middle = (start + stop) / 2
+        limits = [[limit for s, e, limit in segments if s <= middle <= e] for segments in (first, second)]
+        if not limits[0] or not limits[1]:
+            continue
+        limit = min(max(limits[0]), max(limits[1]))
+        if combined and combined[-1][1] == start and combined[-1][2] == limit:
+            combined[-1] = (combined[-1][0], stop, limit)
+        else:
+            combined.append((start, stop, limit))
+    return combined
+
+
+def _parse_connector_limits(raw):
+    """Check a decoded limits file and return {connector: {kind: [(start_hz, stop_hz, dB)]}}."""
+    if not isinstance(raw, dict):
+        raise ValueError("the file must hold an object keyed by connector")
+    limits = {}
+    for connector, kinds in raw.items():
+        if not isinstance(kinds, dict) or not set(kinds) <= set(LIMIT_KINDS):
+            raise ValueError(f"{connector}: expected only {', '.join(LIMIT_KINDS)}")
+        limits[connector] = {}
+        for kind, segments in kinds.items():
+            parsed = []
+            for segment in segments:
+                start, stop, loss = (float(value) for value in segment)
+                if not 0 <= start < stop:
+                    raise ValueError(f"{connector} {kind}: segment {segment} does not run upwards from >= 0 Hz")
+                parsed.append((start, stop, loss))
+            limits[connector][kind] = parsed
+    return limits
+
+
+def load_connector_limits(path=CONNECTOR_LIMITS_FILE):
+    """Return the masks of the connector limits file, {} when it is missing or not valid."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _limits_lock:
+        cached = _limits_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            with open(path, encoding="utf-8") as f:
+                limits = _parse_connector_limits(json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            log.error("Ignoring the connector limits in %s: %s", path, e)
+            limits = {}
+        else:
+            log.info("Loaded limits for %d connector(s) from %s", len(limits), path)
+        _limits_cache[path] = (key, limits)
+        return limits
+
+
+def limit_masks(stored_values, parameters, connector_limits=None):
+    """Return {parameter: (kind, segments, connector label)} for the S-parameters that have limits.
+
+    kind is "max" for reflections and "min" for transmissions. connector_limits
+    defaults to the connector limits file. Parameters on a port whose connector
+    has no limits of that kind are left out.
+    """
+    if connector_limits is None:
+        connector_limits = load_connector_limits()
+    connectors = {1: stored_values.get("port_1_connector"), 2: stored_values.get("port_2_connector")}
+    masks = {}
+    for parameter in parameters:
+        if len(parameter) != 3 or parameter[0] != "S" or not parameter[1:].isdigit():
+            continue
+        i, j = int(parameter[1]), int(parameter[2])
+        if i == j:
+            segments = connector_limits.get(connectors.get(i), {}).get("return_loss")
+            if segments:
+                masks[parameter] = ("max", [(start, stop, -loss) for start, stop, loss in segments], connectors[i])
+        else:
+            both = [connector_limits.get(connectors.get(port), {}).get("insertion_loss") for port in (i, j)]
+            if all(both):
+                first, second = ([(start, stop, -loss) for start, stop, loss in segments] for segments in both)
+                segments = _looser_lower(first, second)
+                if segments:
+                    masks[parameter] = ("min", segments, f"{connectors[i]}/{connectors[j]}")
+    return masks
+
+
+def plot_limit_lines(masks):
+    """Return the masks as render_plots' {parameter: [(start_hz, stop_hz, limit_db)]}."""
+    return {parameter: segments for parameter, (_, segments, _) in masks.items()}
+
+
+def limit_on_axis(frequency, segments, kind):
+    """Expand a mask onto a frequency axis: float32 limit per point, NaN where nothing applies.
+
+    Where segments overlap (at a shared edge) the stricter limit is used.
+    """
+    limit = np.full(len(frequency), np.nan, dtype=np.float32)
+    strictest = np.fmin if kind == "max" else np.fmax
+    for start, stop, limit_db in segments:
+        first = np.searchsorted(frequency, start, side="left")
+        last = np.searchsorted(frequency, stop, side="right")
+        limit[first:last] = strictest(limit[first:last], limit_db)
+    return limit
+
+
+def _failing_ranges(frequency, failing):
+    """Return [(start_hz, stop_hz)] of each run of consecutive True values in a 1-D mask."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], failing, [False])).astype(np.int8)))
+    return [(float(frequency[start]), float(frequency[stop - 1])) for start, stop in zip(edges[0::2], edges[1::2])]
+
+
+def evaluate_block(frequency, serials, traces, parameter, kind, segments, connector=None):
+    """Evaluate a block of traces on one frequency axis and return a LimitResult per serial.
+
+    traces is a sequence of complex arrays (or a 2-D array) with one row per serial.
+    """
+    limit = limit_on_axis(frequency, segments, kind)
+    checked = ~np.isnan(limit)
+    if not checked.any():
+        return []
+    columns = np.flatnonzero(checked)
+    frequency_checked = np.asarray(frequency)[columns]
+    magnitude = np.empty((len(serials), len(columns)), dtype=np.float32)
+    for row, values in enumerate(traces):
+        magnitude[row] = np.abs(np.asarray(values)[columns])
+    np.maximum(magnitude, 1e-15, out=magnitude)
+    np.log10(magnitude, out=magnitude)
+    magnitude *= 20.0
+    # Positive margin is inside the limit
+    margin = (limit[columns] - magnitude) if kind == "max" else (magnitude - limit[columns])
+    worst = margin.argmin(axis=1)
+    worst_margin = margin[np.arange(len(serials)), worst]
+    failing = margin < 0
+    failing_points = failing.sum(axis=1)
+
+    results = []
+    for row, serial in enumerate(serials):
+        ranges = _failing_ranges(frequency_checked, failing[row]) if failing_points[row] else []
+        results.append(LimitResult(serial, parameter, connector, bool(failing_points[row] == 0), float(worst_margin[row]),
+                                   float(frequency_checked[worst[row]]), int(failing_points[row]), ranges))
+    return results
+
+
+def evaluate_measurement(measurement, stored_values, serial):
+    """Evaluate one TouchstoneData (or StoredMeasurement) against the job card's connector masks."""
+    results = []
+    with span("limits", serials=1):
+        for parameter, (kind, segments, connector) in limit_masks(stored_values, measurement.parameters).items():
+            results += evaluate_block(measurement.frequency, [serial], [measurement.parameters[parameter]],
+                                      parameter, kind, segments, connector)
+    return results
+
+
+def evaluate_job_card(store, job_card, stored_values, parameters=None):
+    """Evaluate every serial of a job card in a MeasurementStore, BLOCK_SERIALS at a time per parameter.
+
+    parameters defaults to the options ticked in the wizard. Results are sorted
+    by serial (first-stored order) and parameter.
+    """
+    if parameters is None:
+        parameters = stored_values.get("selected_options") or ()
+    masks = limit_masks(stored_values, sorted(parameters))
+    order = {serial: index for index, serial in enumerate(store.serials(job_card))}
+    results = []
+    with span("limits", job_card=job_card, serials=len(order)):
+        for parameter, (kind, segments, connector) in masks.items():
+            for frequency, serials, traces in store.traces(job_card, parameter):
+                for start in range(0, len(serials), BLOCK_SERIALS):
+                    results += evaluate_block(frequency, serials[start:start + BLOCK_SERIALS],
+                                              traces[start:start + BLOCK_SERIALS], parameter, kind, segments,
+                                              connector)
+    results.sort(key=lambda result: (order.get(result.serial, len(order)), result.parameter))
+    failed = sum(1 for result in results if not result.passed)
+    log.info("Limit check of job card %s: %d trace(s), %d failing", job_card, len(results), failed)
+    return results
@@ -0,0 +1,76 @@
+"""On-disk cache of the pre-scaled logos shown in the main window.
+
+The first launch scales each source image with PIL and stores a PNG under the
+local cache, keyed by the source path, mtime and size. Later launches load that
+PNG straight into a tk.PhotoImage, so neither PIL nor the synced folder is
+needed. When the source is missing the newest cached copy is used instead.
+"""
+import glob
+import hashlib
+import logging
+import os
+import tkinter as tk
+
+from app_paths import CACHE_DIRECTORY
+from tracing import span
+
+LOGO_CACHE_DIRECTORY = os.path.join(CACHE_DIRECTORY, "logos")
+
+log = logging.getLogger(__name__)
+
+
+def _cache_prefix(source_path, scale):
+    """Return the part of the cache file name shared by every version of one source."""
+    digest = hashlib.sha1(os.path.abspath(source_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(LOGO_CACHE_DIRECTORY, f"{digest}_{scale}_")
+
+
+def _scale_into_cache(source_path, cached_path, scale):
+    """Resize the source image to 1/scale with LANCZOS and write it as PNG."""
+    from PIL import Image
+
+    with Image.open(source_path) as image:
+        if image.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            image = image.convert("RGB")
+        image = image.resize((int(image.width / scale), int(image.height / scale)), Image.Resampling.LANCZOS)
+        os.makedirs(LOGO_CACHE_DIRECTORY, exist_ok=True)
+        temp_path = f"{cached_path}.{os.getpid()}.tmp"
+        image.save(temp_path, format="PNG")
+    os.replace(temp_path, cached_path)
+
+
+def load_logo(source_path, scale=4):
+    """Return a tk.PhotoImage of the logo scaled to 1/scale, or None if it cannot be found.
+
+    Must be called after the Tk root exists.
+    """
+    prefix = _cache_prefix(source_path, scale)
+    try:
+        stat = os.stat(source_path)
+    except OSError:
+        stat = None
+
+    if stat is not None:
+        cached_path = f"{prefix}{stat.st_mtime_ns}_{stat.st_size}.png"
+        if not os.path.exists(cached_path):
+            log.debug("Scaling logo into cache: %s", source_path)
+            try:
+                with span("logo_scale", path=os.path.basename(source_path)):
+                    _scale_into_cache(source_path, cached_path, scale)
+            except (OSError, ImportError) as e:
+                log.error("Could not scale logo %s: %s", source_path, e)
+                cached_path = None
+            else:
+                # Drop versions made from older copies of the source
+                for stale in glob.glob(glob.escape(prefix) + "*.png"):
+                    if stale != cached_path:
+                        os.remove(stale)
+    else:
+        previous = sorted(glob.glob(glob.escape(prefix) + "*.png"), key=os.path.getmtime)
+        cached_path = previous[-1] if previous else None
+        log.error("Logo not found: %s%s", source_path, ", using cached copy" if cached_path else "")
+
+    if cached_path is None:
+        return None
+    with span("image_load", path=os.path.basename(source_path)):
+        return tk.PhotoImage(file=cached_path)
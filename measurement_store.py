@@ -0,0 +1,242 @@
+"""Compact storage for every trace of a job card, keyed by (job card, serial, parameter).
+
+Traces are packed into large contiguous chunks: complex64 for S-parameters and
+float32 for real-valued traces, half the size of the complex128/float64 arrays
+the Touchstone reader returns. Frequency axes are stored once in float64 and
+shared by every trace swept on the same axis, which is nearly all of them.
+Each trace is described by a small __slots__ record (chunk, offset, length,
+axis), so there is no Python object per point or per serial beyond that.
+
+Chunks stay in RAM until memory_limit bytes are used; later chunks are
+memory-mapped files in the spill directory, so a job card of hundreds of
+serials does not need gigabytes of RAM. Chunks never grow or move once
+created (Windows cannot resize a file while it is mapped), so a view handed
+out stays valid until close(). Reads return read-only views into the chunks:
+report building slices them without copying.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from app_paths import CACHE_DIRECTORY
+
+SPILL_DIRECTORY = os.path.join(CACHE_DIRECTORY, "measurements")
+# Points per chunk; a longer trace gets a chunk of its own
+CHUNK_POINTS = 1 << 22
+# Bytes of chunks kept in RAM before new chunks are memory-mapped files
+DEFAULT_MEMORY_LIMIT = 256 << 20
+COMPLEX_DTYPE = np.dtype(np.complex64)
+REAL_DTYPE = np.dtype(np.float32)
+
+log = logging.getLogger(__name__)
+
+
+class TraceRecord:
+    """Where one trace lives: a chunk of the store, its offset and length, and its frequency axis."""
+
+    __slots__ = ("chunk", "offset", "length", "axis")
+
+    def __init__(self, chunk, offset, length, axis):
+        self.chunk = chunk
+        self.offset = offset
+        self.length = length
+        self.axis = axis
+
+
+class _Chunk:
+    """A fixed-size block of one dtype, in RAM or memory-mapped, filled from the start."""
+
+    __slots__ = ("index", "array", "used", "path")
+
+    def __init__(self, index, array, path=None):
+        self.index = index
+        self.array = array
+        self.used = 0
+        self.path = path
+
+
+class StoredMeasurement:
+    """Zero-copy view of one serial: .frequency and .parameters like TouchstoneData.
+
+    Can be passed wherever a TouchstoneData is accepted (generate_report, the
+    table and plot builders). The arrays are read-only views into the store.
+    """
+
+    __slots__ = ("job_card", "serial", "frequency", "parameters")
+
+    def __init__(self, job_card, serial, frequency, parameters):
+        self.job_card = job_card
+        self.serial = serial
+        self.frequency = frequency
+        self.parameters = parameters
+
+    def __getitem__(self, name):
+        return self.parameters[name]
+
+    def between(self, start_hz, stop_hz):
+        """Return the points with start_hz <= f <= stop_hz, still as views."""
+        first = int(np.searchsorted(self.frequency, start_hz, side="left"))
+        last = int(np.searchsorted(self.frequency, stop_hz, side="right"))
+        return StoredMeasurement(self.job_card, self.serial, self.frequency[first:last],
+                                 {name: values[first:last] for name, values in self.parameters.items()})
+
+    def __repr__(self):
+        return (f"StoredMeasurement({self.job_card!r}, {self.serial!r}, {len(self.frequency)} points, "
+                f"{sorted(self.parameters)})")
+
+
+class MeasurementStore:
+    """Traces of many serials in contiguous chunks, spilling to memory-mapped files."""
+
+    def __init__(self, spill_directory=SPILL_DIRECTORY, memory_limit=DEFAULT_MEMORY_LIMIT, chunk_points=CHUNK_POINTS):
+        self.spill_directory = spill_directory
+        self.memory_limit = memory_limit
+        self.chunk_points = chunk_points
+        self._records = {}  # job card -> {serial: {parameter: TraceRecord}}, serials in first-stored order
+        self._axes = []  # float64 frequency arrays
+        self._axis_index = {}  # digest of an axis -> its index in _axes
+        self._chunks = []
+        self._open_chunk = {COMPLEX_DTYPE: None, REAL_DTYPE: None}
+        self._memory_bytes = 0
+        self._spill_path = None
+        self._lock = threading.Lock()
+
+    def _axis(self, frequency):
+        frequency = np.ascontiguousarray(frequency, dtype=np.float64)
+        key = hashlib.sha1(frequency.tobytes()).digest()
+        index = self._axis_index.get(key)
+        if index is None:
+            index = len(self._axes)
+            frequency = frequency.copy()
+            frequency.flags.writeable = False
+            self._axes.append(frequency)
+            self._axis_index[key] = index
+        return index
+
+    def _new_chunk(self, dtype, points):
+        size = max(points, self.chunk_points)
+        nbytes = size * dtype.itemsize
+        if self._memory_bytes + nbytes <= self.memory_limit:
+            self._memory_bytes += nbytes
+            chunk = _Chunk(len(self._chunks), np.empty(size, dtype=dtype))
+        else:
+            if self._spill_path is None:
+                os.makedirs(self.spill_directory, exist_ok=True)
+                self._spill_path = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=self.spill_directory)
+                log.info("Spilling measurements to %s", self._spill_path)
+            path = os.path.join(self._spill_path, f"{len(self._chunks)}.{dtype.name}")
+            chunk = _Chunk(len(self._chunks), np.memmap(path, dtype=dtype, mode="w+", shape=(size,)), path)
+        self._chunks.append(chunk)
+        return chunk
+
+    def _place(self, values, dtype):
+        """Copy values into a chunk of dtype and return (chunk index, offset)."""
+        chunk = self._open_chunk[dtype]
+        if chunk is None or chunk.array.shape[0] - chunk.used < len(values):
+            chunk = self._new_chunk(dtype, len(values))
+            # A chunk sized for one long trace is not worth keeping open
+            if chunk.array.shape[0] == self.chunk_points:
+                self._open_chunk[dtype] = chunk
+        offset = chunk.used
+        chunk.array[offset:offset + len(values)] = values
+        chunk.used += len(values)
+        return chunk.index, offset
+
+    def add(self, job_card, serial, frequency, parameters):
+        """Store the traces of one serial; a trace stored again replaces the earlier one.
+
+        parameters maps names to arrays on the frequency axis; complex arrays are
+        kept as complex64 and real ones as float32. The space of a replaced trace
+        is not reused until close().
+        """
+        with self._lock:
+            axis = self._axis(frequency)
+            records = self._records.setdefault(job_card, {}).setdefault(serial, {})
+            for name, values in parameters.items():
+                values = np.asarray(values)
+                if len(values) != len(self._axes[axis]):
+                    raise ValueError(f"{name} has {len(values)} points, the frequency axis {len(self._axes[axis])}")
+                dtype = COMPLEX_DTYPE if np.iscomplexobj(values) else REAL_DTYPE
+                chunk, offset = self._place(values, dtype)
+                records[name] = TraceRecord(chunk, offset, len(values), axis)
+
+    def add_touchstone(self, job_card, serial, data):
+        """Store a TouchstoneData (or anything with .frequency and .parameters) and return its view."""
+        self.add(job_card, serial, data.frequency, data.parameters)
+        return self.measurement(job_card, serial)
+
+    def _view(self, record):
+        view = self._chunks[record.chunk].array[record.offset:record.offset + record.length]
+        if isinstance(view, np.memmap):
+            view = view.view(np.ndarray)
+        view.flags.writeable = False
+        return view
+
+    def trace(self, job_card, serial, parameter):
+        """Return (frequency, values) of one trace as read-only views; KeyError if it is not stored."""
+        with self._lock:
+            record = self._records[job_card][serial][parameter]
+            return self._axes[record.axis], self._view(record)
+
+    def measurement(self, job_card, serial, parameters=None):
+        """Return a StoredMeasurement with every (or the named) trace of a serial.
+
+        Traces of one serial are expected to share a frequency axis, as they do in
+        a Touchstone file; the axis of the first one is used.
+        """
+        with self._lock:
+            stored = self._records.get(job_card, {}).get(serial, {})
+            names = sorted(name for name in stored if parameters is None or name in parameters)
+            if not names:
+                raise KeyError((job_card, serial))
+            return StoredMeasurement(job_card, serial, self._axes[stored[names[0]].axis],
+                                     {name: self._view(stored[name]) for name in names})
+
+    def traces(self, job_card, parameter):
+        """Return [(frequency, serials, views)] of one parameter across a job card, one entry per frequency axis.
+
+        Serials keep their first-stored order within each entry, ready to be
+        evaluated as a block.
+        """
+        with self._lock:
+            groups = {}
+            for serial, stored in self._records.get(job_card, {}).items():
+                record = stored.get(parameter)
+                if record is not None:
+                    serials, views = groups.setdefault(record.axis, ([], []))
+                    serials.append(serial)
+                    views.append(self._view(record))
+            return [(self._axes[axis], serials, views) for axis, (serials, views) in groups.items()]
+
+    def serials(self, job_card):
+        """Return the serials stored for a job card, in the order they were first stored."""
+        with self._lock:
+            return list(self._records.get(job_card, ()))
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(stored) for serials in self._records.values() for stored in serials.values())
+
+    def nbytes(self):
+        """Return (bytes in RAM, bytes in spill files) allocated for traces."""
+        with self._lock:
+            spilled = sum(chunk.array.nbytes for chunk in self._chunks if chunk.path)
+            return self._memory_bytes, spilled
+
+    def close(self):
+        """Drop every trace and delete the spill files; views handed out must no longer be used."""
+        with self._lock:
+            self._records.clear()
+            self._axes.clear()
+            self._axis_index.clear()
+            self._chunks.clear()
+            self._open_chunk = {COMPLEX_DTYPE: None, REAL_DTYPE: None}
+            self._memory_bytes = 0
+            if self._spill_path is not None:
+                shutil.rmtree(self._spill_path, ignore_errors=True)
+                self._spill_path = None
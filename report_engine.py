@@ -0,0 +1,507 @@
+import bisect
+import copy
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.oxml import parse_xml, serialize_part_xml
+from docx.opc.part import XmlPart
+from docx.oxml.ns import qn
+
+from app_paths import CACHE_DIRECTORY, TEMPLATE_DIRECTORY
+from limits import evaluate_measurement, limit_masks, plot_limit_lines
+from report_plots import DEFAULT_SETTINGS, PLOT_STYLE_VERSION, PLOTS_PLACEHOLDER, insert_plots, render_plots
+from report_tables import (DEFAULT_MAX_ROWS, MEASUREMENTS_PLACEHOLDER, SUMMARY_PLACEHOLDER, insert_measurement_table,
+                           insert_summary_table, measurement_table_xml, summary_table_xml)
+from tracing import span
+
+log = logging.getLogger(__name__)
+
+# Templates per user, shared by the wizard and the batch engine
+TEMPLATE_MAP = {
+    "Alexander Peet": "Template_AP.docx",
+    "Mark Grogan": "Template_MG.docx",
+    "David Feltbower": "Template_DF.docx"
+}
+
+# Placeholders replaced anywhere in the document
+PLACEHOLDERS = ["<Job Card p/n>", "<Port 1>", "<Port 2>", "<VNA_Cal>", "<E-Cal_Cal>", "<Date>"]
+PLACEHOLDER_PATTERN = re.compile("|".join(re.escape(placeholder) for placeholder in PLACEHOLDERS))
+
+# Parts whose paragraphs are searched for placeholders. Text boxes live inside these parts.
+STORY_CONTENT_TYPES = {
+    CT.WML_DOCUMENT_MAIN,
+    CT.WML_HEADER,
+    CT.WML_FOOTER,
+    CT.WML_FOOTNOTES,
+    CT.WML_ENDNOTES,
+}
+
+W_P = qn("w:p")
+W_T = qn("w:t")
+XML_SPACE = qn("xml:space")
+
+# Bump when a change to the engine alters the reports it writes, so old manifests stop matching
+REPORT_FORMAT_VERSION = 2
+# Sidecar next to each report recording the digest it was generated from
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def template_path_for_user(user_name, template_directory=TEMPLATE_DIRECTORY):
+    """Return the full path of the Word template belonging to a user."""
+    return os.path.join(template_directory, TEMPLATE_MAP[user_name])
+
+
+def safe_file_name(text):
+    """Replace every character but letters, digits, '.', '-' and '_' so text cannot leave its folder."""
+    return re.sub(r"[^\w.-]", "_", str(text))
+
+
+def report_output_path(template_path, job_card_number, output_dir=None):
+    """Return where Report_<job>.docx is written (next to the template by default).
+
+    Job cards can hold characters like '/', which are replaced in the file name.
+    """
+    if output_dir is None:
+        output_dir = os.path.dirname(template_path)
+    return os.path.join(output_dir, f"Report_{safe_file_name(job_card_number)}.docx")
+
+
+def build_replacements(stored_values):
+    """Map each placeholder to its value from the wizard's stored_values."""
+    calibration_data = stored_values.get("calibration_data", {})
+    return {
+        "<Port 1>": stored_values.get("port_1_connector", "n/a"),
+        "<Port 2>": stored_values.get("port_2_connector", "n/a"),
+        "<VNA_Cal>": calibration_data.get("data1", "n/a"),
+        "<E-Cal_Cal>": calibration_data.get("data2", "n/a"),
+        "<Date>": stored_values.get("report_date", "n/a"),
+        "<Job Card p/n>": stored_values.get("job_card", "n/a"),
+    }
+
+
+def _paragraph_text_nodes(p):
+    """Return the w:t elements owned by a paragraph, in order.
+
+    Paragraphs inside a text box are nested in a run of the outer paragraph, so
+    their text is left for their own w:p to handle.
+    """
+    if p.find(".//" + W_P) is None:
+        return list(p.iter(W_T))
+    return [t for t in p.iter(W_T) if next(t.iterancestors(W_P)) is p]
+
+
+def paragraph_has_placeholder(p):
+    """Return True when the joined run text of a paragraph contains a placeholder."""
+    text = "".join(t.text or "" for t in _paragraph_text_nodes(p))
+    return "<" in text and PLACEHOLDER_PATTERN.search(text) is not None
+
+
+def substitute_paragraph(p, replacements):
+    """Replace every placeholder in a paragraph in one pass, keeping run formatting.
+
+    The run texts are joined once and matched against one pattern, so placeholders
+    split across several runs are found too. The value goes into the run where the
+    placeholder starts and the rest of the placeholder is cut from the following
+    runs, leaving every w:rPr untouched. Returns the number of replacements made.
+    """
+    nodes = _paragraph_text_nodes(p)
+    texts = [t.text or "" for t in nodes]
+    joined = "".join(texts)
+    if "<" not in joined:
+        return 0
+    matches = list(PLACEHOLDER_PATTERN.finditer(joined))
+    if not matches:
+        return 0
+
+    # Start offset of every text node within the joined string
+    offsets = []
+    position = 0
+    for text in texts:
+        offsets.append(position)
+        position += len(text)
+
+    changed = set()
+    # Work backwards so the offsets of earlier matches stay valid
+    for match in reversed(matches):
+        value = str(replacements.get(match.group(), ""))
+        first = _node_at(offsets, match.start())
+        last = _node_at(offsets, match.end() - 1)
+        head = match.start() - offsets[first]
+        tail = match.end() - offsets[last]
+        if first == last:
+            texts[first] = texts[first][:head] + value + texts[first][tail:]
+        else:
+            texts[first] = texts[first][:head] + value
+            for node in range(first + 1, last):
+                texts[node] = ""
+            texts[last] = texts[last][tail:]
+        changed.update(range(first, last + 1))
+        log.debug("Replaced %s with %s", match.group(), value)
+
+    for node in changed:
+        nodes[node].text = texts[node]
+        nodes[node].set(XML_SPACE, "preserve")
+    return len(matches)
+
+
+def _node_at(offsets, index):
+    """Return the text node holding the character at index of the joined text.
+
+    Empty nodes share their offset with the next node, so bisecting to the right
+    always lands on the node that actually holds the character.
+    """
+    return bisect.bisect_right(offsets, index) - 1
+
+
+def _story_parts(doc):
+    """Yield (part, root element) for every story part of a document."""
+    for part in doc.part.package.iter_parts():
+        if part.content_type not in STORY_CONTENT_TYPES:
+            continue
+        if isinstance(part, XmlPart):
+            yield part, part.element
+        else:
+            # Footnotes and endnotes are loaded as plain blobs
+            yield part, parse_xml(part.blob)
+
+
+def _store_story(part, element):
+    """Write an edited root element back to a story part held as a blob."""
+    if not isinstance(part, XmlPart):
+        part._blob = serialize_part_xml(element)
+
+
+def replace_placeholders(doc, replacements):
+    """Replace every placeholder in the body, tables, headers, footers, notes and text boxes."""
+    for part, element in _story_parts(doc):
+        if sum(substitute_paragraph(p, replacements) for p in element.iter(W_P)):
+            _store_story(part, element)
+
+
+def index_placeholders(doc):
+    """Record which paragraphs of which story parts hold placeholders.
+
+    Returns {partname: [paragraph ordinals]} where an ordinal is the position of
+    the w:p element in document order within its part.
+    """
+    index = {}
+    for part, element in _story_parts(doc):
+        ordinals = [ordinal for ordinal, p in enumerate(element.iter(W_P)) if paragraph_has_placeholder(p)]
+        if ordinals:
+            index[str(part.partname)] = ordinals
+    return index
+
+
+class CompiledTemplate:
+    """A template parsed and scanned once, from which each report is stamped as a clone."""
+
+    def __init__(self, path, blob, mtime_ns, size):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = hashlib.sha256(blob).hexdigest()
+        with span("template_parse", path=path, size=size):
+            self.document = Document(io.BytesIO(blob))
+        with span("placeholder_scan", path=path) as scan:
+            self.index = index_placeholders(self.document)
+            scan.set(paragraphs=sum(len(ordinals) for ordinals in self.index.values()))
+        self._lock = threading.Lock()
+
+    def clone(self):
+        """Return a copy of the parsed document that is safe to modify.
+
+        The main document part and the story parts holding placeholders are
+        deep-copied; images, styles and every other part are shared with the
+        compiled form since nothing writes to them.
+        """
+        copied = set(self.index) | {str(self.document.part.partname)}
+        memo = {}
+        for part in self.document.part.package.iter_parts():
+            if str(part.partname) in copied:
+                continue
+            targets = (rel.target_part for rel in part.rels.values() if not rel.is_external)
+            if any(str(target.partname) in copied for target in targets):
+                continue
+            memo[id(part)] = part
+        with self._lock:
+            # Copy the part rather than the Document: lxml does not honour the deepcopy
+            # memo, so copying both would leave Document.element detached from the part
+            part = copy.deepcopy(self.document.part, memo)
+        return part.document
+
+    def fill(self, doc, replacements):
+        """Apply the replacements to a clone, visiting only the indexed paragraphs."""
+        for part, element in _story_parts(doc):
+            ordinals = self.index.get(str(part.partname))
+            if not ordinals:
+                continue
+            paragraphs = list(element.iter(W_P))
+            for ordinal in ordinals:
+                substitute_paragraph(paragraphs[ordinal], replacements)
+            _store_story(part, element)
+
+
+class TemplateCache:
+    """Bounded LRU cache of compiled templates, invalidated by mtime/size and content hash."""
+
+    def __init__(self, max_size=8):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def digest(self, path):
+        """Return the sha256 of the template's bytes, without compiling it."""
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(os.path.abspath(path))
+            if entry is not None and (entry.mtime_ns, entry.size) == (stat.st_mtime_ns, stat.st_size):
+                return entry.digest
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def get(self, path):
+        """Return the compiled form of the template at path, compiling it if needed."""
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.mtime_ns, entry.size) == (stat.st_mtime_ns, stat.st_size):
+                self._entries.move_to_end(key)
+                return entry
+
+        with open(path, "rb") as f:
+            blob = f.read()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.digest == hashlib.sha256(blob).hexdigest():
+                # Touched but unchanged, keep the compiled form
+                entry.mtime_ns, entry.size = stat.st_mtime_ns, stat.st_size
+            else:
+                log.debug("Compiling template: %s", path)
+                entry = CompiledTemplate(path, blob, stat.st_mtime_ns, stat.st_size)
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Process-wide cache, so every report after the first skips the parse and scan
+TEMPLATE_CACHE = TemplateCache()
+
+
+def save_atomically(doc, output_path):
+    """Save to a temporary file beside output_path and rename it over the report.
+
+    Readers (Word, the sync client, the write-back queue) only ever see the old
+    report or the complete new one.
+    """
+    temp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        doc.save(temp_path)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def report_digest(template_path, stored_values, measurements=None, limit_lines=None, streaming=False):
+    """Return the content address of a report: the template bytes plus every input that changes it.
+
+    The output mode is part of it, as docx_stream and python-docx do not write
+    the same file.
+    """
+    digest = hashlib.sha256(TEMPLATE_CACHE.digest(template_path).encode("ascii"))
+    inputs = {
+        "format": [REPORT_FORMAT_VERSION, PLOT_STYLE_VERSION],
+        "user_name": stored_values.get("user_name"),
+        "replacements": build_replacements(stored_values),
+        "selected_options": sorted(stored_values.get("selected_options") or []),
+        "limit_lines": limit_lines,
+        "streaming": bool(streaming),
+    }
+    digest.update(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8"))
+    if measurements is not None:
+        # The parsed traces stand in for the measurement file: same data, same report
+        digest.update(np.ascontiguousarray(measurements.frequency, dtype=np.float64).tobytes())
+        for name in sorted(measurements.parameters):
+            digest.update(name.encode("ascii"))
+            digest.update(np.ascontiguousarray(measurements.parameters[name], dtype=np.complex128).tobytes())
+    return digest.hexdigest()
+
+
+def manifest_path(output_path):
+    return output_path + MANIFEST_SUFFIX
+
+
+def report_is_current(output_path, digest):
+    """Return True when output_path was generated from digest and has not been touched since.
+
+    Only the sidecar manifest is read and the report stat'ed, so the check costs
+    the same whatever the size of the report.
+    """
+    try:
+        with open(manifest_path(output_path), encoding="utf-8") as f:
+            manifest = json.load(f)
+        stat = os.stat(output_path)
+    except (OSError, ValueError):
+        return False
+    return (manifest.get("digest") == digest and manifest.get("size") == stat.st_size
+            and manifest.get("mtime_ns") == stat.st_mtime_ns)
+
+
+def write_manifest(output_path, digest):
+    """Record the digest a report was generated from, alongside the report's size and mtime."""
+    stat = os.stat(output_path)
+    path = manifest_path(output_path)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"digest": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}, f)
+    os.replace(temp_path, path)
+
+
+class ReportCancelled(Exception):
+    """Raised by generate_report when its cancel_event is set between phases."""
+
+
+# Phases reported to the progress callback, in order
+REPORT_PHASES = ("load", "substitute", "save")
+
+
+def _enter_phase(phase, progress, cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise ReportCancelled(f"Report generation cancelled before {phase}")
+    if progress is not None:
+        progress(phase)
+
+
+def _measurement_serial(measurements):
+    return getattr(measurements, "serial", None) or os.path.splitext(os.path.basename(measurements.path))[0]
+
+
+def _streamed_blocks(template_path, stored_values, measurements, limit_lines, plot_workers):
+    """Build the content of the <Measurements>, <Summary> and <Plots> paragraphs for docx_stream."""
+    from docx_stream import Picture, template_table_style_id
+
+    style_id = template_table_style_id(template_path)
+    blocks = {MEASUREMENTS_PLACEHOLDER: [], SUMMARY_PLACEHOLDER: [], PLOTS_PLACEHOLDER: []}
+    if measurements.parameters:
+        with span("measurement_table", points=len(measurements.frequency)):
+            blocks[MEASUREMENTS_PLACEHOLDER].append(measurement_table_xml(
+                measurements.frequency, measurements.parameters, style_id, DEFAULT_MAX_ROWS))
+    with span("summary_table"):
+        results = evaluate_measurement(measurements, stored_values, _measurement_serial(measurements))
+        if results:
+            blocks[SUMMARY_PLACEHOLDER].append(summary_table_xml(results, style_id))
+    with span("plots", traces=len(measurements.parameters)):
+        plots = render_plots(measurements.frequency, measurements.parameters, os.path.join(CACHE_DIRECTORY, "plots"),
+                             limit_lines, workers=plot_workers)
+        blocks[PLOTS_PLACEHOLDER] = [Picture(path, DEFAULT_SETTINGS["width_in"]) for _, path in plots]
+    return blocks
+
+
+def generate_report(template_path, stored_values, output_dir=None, measurements=None,
+                    limit_lines=None, plot_workers=None, progress=None, cancel_event=None, force=False,
+                    streaming=False):
+    """Fill the template with the wizard selections and save Report_<job>.docx.
+
+    measurements is an optional TouchstoneData (or anything with .frequency and
+    .parameters) whose traces replace the <Measurements> paragraph as a table and
+    the <Plots> paragraph as one plot per trace, with optional limit_lines per
+    parameter. plot_workers=1 renders plots in-process (e.g. inside a batch worker).
+    The traces are also checked against the masks of the selected connectors
+    (see limits.py) into the <Summary> table; limit_lines defaults to those masks.
+
+    progress(phase) is called as each of REPORT_PHASES starts, and setting the
+    threading.Event cancel_event stops the report before the next phase with
+    ReportCancelled. The report is only ever written as a whole, so a cancelled
+    run leaves no partial file behind.
+
+    With streaming the report is written by docx_stream instead of python-docx:
+    the template's parts are copied through and only the ones holding
+    placeholders are rewritten, so memory does not grow with the template.
+
+    When the existing report was generated from the same template bytes and
+    inputs (see report_digest and its sidecar manifest) it is left as it is,
+    unless force is set.
+
+    Returns the output path. Errors are raised to the caller so the GUI and the
+    batch engine can each decide how to report them.
+    """
+    if not template_path or not os.path.exists(template_path):
+        raise FileNotFoundError(f"No valid template loaded or template not found at {template_path}")
+
+    job_card_number = stored_values.get("job_card")
+    output_path = report_output_path(template_path, job_card_number, output_dir)
+    if measurements is not None and limit_lines is None:
+        limit_lines = plot_limit_lines(limit_masks(stored_values, measurements.parameters))
+    with span("generate_report", job_card=job_card_number, template=os.path.basename(template_path)) as report:
+        _enter_phase("load", progress, cancel_event)
+        with span("digest"):
+            digest = report_digest(template_path, stored_values, measurements, limit_lines, streaming)
+        if not force and report_is_current(output_path, digest):
+            report.set(skipped=True)
+            log.info("Report %s is up to date, skipping regeneration", output_path)
+            return output_path
+
+        if streaming:
+            from docx_stream import write_report
+
+            _enter_phase("substitute", progress, cancel_event)
+            blocks = {}
+            if measurements is not None:
+                blocks = _streamed_blocks(template_path, stored_values, measurements, limit_lines, plot_workers)
+            _enter_phase("save", progress, cancel_event)
+            with span("save", streaming=True) as save:
+                write_report(template_path, output_path, build_replacements(stored_values), blocks,
+                             (MEASUREMENTS_PLACEHOLDER, PLOTS_PLACEHOLDER))
+                save.set(bytes=os.path.getsize(output_path))
+            write_manifest(output_path, digest)
+            log.info("Saved modified document as %s", output_path)
+            return output_path
+
+        with span("template_load"):
+            template = TEMPLATE_CACHE.get(template_path)
+            doc = template.clone()
+
+        _enter_phase("substitute", progress, cancel_event)
+        with span("substitution"):
+            template.fill(doc, build_replacements(stored_values))
+        if measurements is not None:
+            with span("measurement_table", points=len(measurements.frequency)):
+                insert_measurement_table(doc, measurements.frequency, measurements.parameters)
+            with span("summary_table"):
+                insert_summary_table(doc, evaluate_measurement(measurements, stored_values,
+                                                               _measurement_serial(measurements)))
+            with span("plots", traces=len(measurements.parameters)):
+                plots = render_plots(measurements.frequency, measurements.parameters,
+                                     os.path.join(CACHE_DIRECTORY, "plots"), limit_lines, workers=plot_workers)
+                insert_plots(doc, plots)
+
+        _enter_phase("save", progress, cancel_event)
+        log.debug("Saving document to: %s", output_path)
+        with span("save") as save:
+            save_atomically(doc, output_path)
+            save.set(bytes=os.path.getsize(output_path))
+        write_manifest(output_path, digest)
+        log.info("Saved modified document as %s", output_path)
+    return output_path
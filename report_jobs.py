@@ -0,0 +1,216 @@
+"""Report generation off the Tk thread.
+
+A ReportJob runs generate_report on a shared pool of worker threads and posts
+its progress and result to a queue.Queue that the GUI drains with after(), so
+Tk is never called from a worker and the window stays responsive. Several jobs
+can run at once. A SessionOpenJob and a SessionCloseJob do the same for the
+start and end of a wizard's measurement session.
+"""
+import copy
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from report_engine import REPORT_PHASES, ReportCancelled, generate_report
+
+# Reports generated at the same time, across every open wizard
+MAX_CONCURRENT_REPORTS = 4
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REPORTS, thread_name_prefix="report")
+
+log = logging.getLogger(__name__)
+
+
+class ReportJob:
+    """One background report. Messages on .queue are (kind, value) tuples:
+
+    ("progress", (phase, fraction)), ("done", output path), ("error", message)
+    or ("cancelled", None). Exactly one of the last three ends the job.
+
+    With a template_mirror the template is read from its local copy, and with a
+    write_back queue the report is written to its outbox and queued for copying
+    next to the shared template ("done" then carries the shared path). A
+    measurement_file (Touchstone export) is parsed on the worker as well.
+
+    created, started and finished are time.monotonic() stamps for latency figures.
+    """
+
+    def __init__(self, template_path, stored_values, template_mirror=None, write_back=None, measurement_file=None,
+                 **generate_kwargs):
+        self.template_path = template_path
+        self.template_mirror = template_mirror
+        self.write_back = write_back
+        self.measurement_file = measurement_file
+        # Snapshot, so going Back in the wizard cannot change a report being written
+        self.stored_values = copy.deepcopy(stored_values)
+        self.generate_kwargs = generate_kwargs
+        self.queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.created = time.monotonic()
+        self.started = None
+        self.finished = None
+
+    def start(self, executor=None):
+        """Submit the job to executor (the shared report pool by default) and return it."""
+        self.future = (executor or _EXECUTOR).submit(self._run)
+        return self
+
+    def cancel(self):
+        """Ask the job to stop at the next phase boundary."""
+        self.cancel_event.set()
+
+    def _progress(self, phase):
+        self.queue.put(("progress", (phase, REPORT_PHASES.index(phase) / len(REPORT_PHASES))))
+
+    def _run(self):
+        self.started = time.monotonic()
+        generate_kwargs = dict(self.generate_kwargs)
+        if self.write_back is not None:
+            generate_kwargs.setdefault("output_dir", self.write_back.outbox())
+        try:
+            if self.measurement_file:
+                from touchstone import load_touchstone
+                generate_kwargs["measurements"] = load_touchstone(
+                    self.measurement_file, self.stored_values.get("selected_options") or None)
+            template_path = self.template_path
+            if self.template_mirror is not None:
+                template_path = self.template_mirror.local_path(template_path)
+            output_path = generate_report(template_path, self.stored_values, progress=self._progress,
+                                          cancel_event=self.cancel_event, **generate_kwargs)
+            if self.write_back is not None:
+                output_path = self.write_back.enqueue(output_path, os.path.dirname(self.template_path))
+        except ReportCancelled:
+            self.finished = time.monotonic()
+            self.queue.put(("cancelled", None))
+        except Exception as e:
+            self.finished = time.monotonic()
+            self.queue.put(("error", f"Failed to modify the template or save the document: {e}"))
+        else:
+            self.finished = time.monotonic()
+            self.queue.put(("done", output_path))
+
+
+def record_measurement(incremental_report, measurement_store, job_card, serial, path, data):
+    """Store and journal a parsed export; a VnaExportWatcher callback, bound to its session with functools.partial.
+
+    Runs on the watcher's worker threads, so no Tk calls here.
+    """
+    # The full-precision arrays are dropped once the compact copy is stored
+    incremental_report.add_serial(serial, measurement_store.add_touchstone(job_card, serial, data))
+
+
+class SessionOpenJob:
+    """Starts a wizard's measurement session on the shared report pool.
+
+    Resolving the template's local copy can wait on the synced folder, so the
+    journal, measurement store and export watcher are all set up on a worker.
+    They are left on the job as export_watcher, incremental_report and
+    measurement_store (None for any that could not be set up). Messages on
+    .queue: ("done", None) or ("error", message).
+    """
+
+    def __init__(self, template_path, stored_values, template_mirror=None, write_back=None, **watcher_options):
+        self.template_path = template_path
+        self.stored_values = stored_values
+        self.template_mirror = template_mirror
+        self.write_back = write_back
+        self.watcher_options = watcher_options
+        self.export_watcher = None
+        self.incremental_report = None
+        self.measurement_store = None
+        self.queue = queue.Queue()
+        self.future = None
+
+    def start(self, executor=None):
+        """Submit the job to executor (the shared report pool by default) and return it."""
+        self.future = (executor or _EXECUTOR).submit(self._run)
+        return self
+
+    def _run(self):
+        from measurement_store import MeasurementStore
+        from report_journal import IncrementalReport
+        from vna_watcher import VnaExportWatcher
+        try:
+            template_path = self.template_path
+            if self.template_mirror is not None:
+                template_path = self.template_mirror.local_path(template_path)
+            self.incremental_report = IncrementalReport(
+                template_path, self.stored_values, self.write_back.outbox() if self.write_back is not None else None)
+            self.measurement_store = MeasurementStore()
+            # Bound to this session's report and store, which are handed on at close while exports still drain
+            export_watcher = VnaExportWatcher(
+                self.stored_values, functools.partial(record_measurement, self.incremental_report,
+                                                      self.measurement_store), **self.watcher_options)
+            export_watcher.start()
+            self.export_watcher = export_watcher
+        except Exception as e:
+            log.error("Could not watch the VNA export folder: %s", e)
+            self.queue.put(("error", f"Could not watch the VNA export folder: {e}"))
+        else:
+            self.queue.put(("done", None))
+
+
+class SessionCloseJob:
+    """Ends a wizard's measurement session on the shared report pool.
+
+    Stops the export watcher (letting queued exports finish), assembles the
+    journalled serials into the report, queues it for the shared folder and
+    records the serials in the job history. The journal is deleted once the
+    report is assembled, so the next run of the job card starts empty; after
+    an error it is kept for the next attempt. The measurement store is always
+    closed. With an open_job the session is taken from that SessionOpenJob once
+    it has finished. Messages on .queue: ("done", output path or None when
+    nothing was recorded) or ("error", message).
+    """
+
+    def __init__(self, template_path, export_watcher=None, incremental_report=None, measurement_store=None,
+                 write_back=None, history=None, history_report_id=None, open_job=None):
+        self.template_path = template_path
+        self.open_job = open_job
+        self.export_watcher = export_watcher
+        self.incremental_report = incremental_report
+        self.measurement_store = measurement_store
+        self.write_back = write_back
+        self.history = history
+        self.history_report_id = history_report_id
+        self.queue = queue.Queue()
+        self.future = None
+
+    def start(self, executor=None):
+        """Submit the job to executor (the shared report pool by default) and return it."""
+        self.future = (executor or _EXECUTOR).submit(self._run)
+        return self
+
+    def _run(self):
+        output_path = None
+        if self.open_job is not None:
+            self.open_job.future.result()
+            self.export_watcher = self.open_job.export_watcher
+            self.incremental_report = self.open_job.incremental_report
+            self.measurement_store = self.open_job.measurement_store
+        try:
+            if self.export_watcher is not None:
+                self.export_watcher.stop()
+            if self.incremental_report is not None:
+                serials = self.incremental_report.serials()
+                if serials:
+                    output_path = self.incremental_report.finalize(self.measurement_store)
+                    if self.write_back is not None:
+                        output_path = self.write_back.enqueue(output_path, os.path.dirname(self.template_path))
+                    if self.history is not None and self.history_report_id is not None:
+                        self.history.add_serials(self.history_report_id, serials)
+                self.incremental_report.discard()
+        except Exception as e:
+            log.error("Failed to assemble the measurements into the report: %s", e)
+            self.queue.put(("error", f"Failed to assemble the measurements into the report: {e}"))
+        else:
+            self.queue.put(("done", output_path))
+        finally:
+            if self.incremental_report is not None:
+                self.incremental_report.close()
+            if self.measurement_store is not None:
+                self.measurement_store.close()
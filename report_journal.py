@@ -0,0 +1,224 @@
+"""Incremental report assembly for measurements that arrive one serial at a time.
+
+Each serial's results are rendered into a fragment (a heading, the measurement
+table XML and its plot images) and appended to a per-job-card journal on local
+disk. Appending costs only the size of the fragment, however many serials came
+before it, and every record is flushed and fsynced, so a crash loses at most the
+record being written. finalize() streams the template into Report_<job>.docx
+(see docx_stream), reading the latest fragment of each serial from the journal
+only as it is written, so assembling hundreds of serials needs no more memory
+than assembling one.
+"""
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+from docx_stream import Picture, bold_paragraph_xml, template_table_style_id, write_report
+from limits import evaluate_job_card, limit_masks, plot_limit_lines
+from report_engine import CACHE_DIRECTORY, build_replacements, report_output_path, safe_file_name
+from report_plots import DEFAULT_SETTINGS, PLOTS_PLACEHOLDER, render_plots
+from report_tables import (DEFAULT_MAX_ROWS, MEASUREMENTS_PLACEHOLDER, SUMMARY_PLACEHOLDER, measurement_table_xml,
+                           summary_table_xml)
+from tracing import span
+
+JOURNAL_DIRECTORY = os.path.join(CACHE_DIRECTORY, "journals")
+# Payload length and CRC32 in front of every record
+RECORD_HEADER = struct.Struct("<II")
+
+log = logging.getLogger(__name__)
+
+
+class ReportJournal:
+    """Append-only file of framed records: a JSON header followed by binary blobs.
+
+    A record that was only partly written (power cut, crash) fails its length or
+    CRC check and is cut off the end of the file when the journal is reopened.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        valid_end = 0
+        if os.path.exists(path):
+            for _, _, end in self._scan():
+                valid_end = end
+            if valid_end != os.path.getsize(path):
+                log.warning("Dropping torn record at the end of %s", path)
+                with open(path, "r+b") as f:
+                    f.truncate(valid_end)
+        self._file = open(path, "ab")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _read_record(f):
+        """Read the record at the file position: (header, blobs, size), or None at the end or a torn record."""
+        prefix = f.read(RECORD_HEADER.size)
+        if len(prefix) < RECORD_HEADER.size:
+            return None
+        length, crc = RECORD_HEADER.unpack(prefix)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return None
+        header_line, _, data = payload.partition(b"\n")
+        header = json.loads(header_line)
+        blobs = []
+        position = 0
+        for size in header.pop("blob_sizes"):
+            blobs.append(data[position:position + size])
+            position += size
+        return header, blobs, RECORD_HEADER.size + length
+
+    def _scan(self):
+        """Yield (header, blobs, end offset) for every intact record."""
+        with open(self.path, "rb") as f:
+            offset = 0
+            while True:
+                record = self._read_record(f)
+                if record is None:
+                    return
+                header, blobs, size = record
+                offset += size
+                yield header, blobs, offset
+
+    def append(self, header, blobs=()):
+        """Write one record and make sure it reached the disk before returning."""
+        header = dict(header, blob_sizes=[len(blob) for blob in blobs])
+        payload = json.dumps(header).encode("utf-8") + b"\n" + b"".join(blobs)
+        with self._lock:
+            self._file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def records(self):
+        """Return [(header, blobs)] for every record written so far."""
+        with self._lock:
+            self._file.flush()
+            return [(header, blobs) for header, blobs, _ in self._scan()]
+
+    def headers(self):
+        """Return [(header, offset)] for every record, without keeping any blobs in memory."""
+        with self._lock:
+            self._file.flush()
+        headers = []
+        start = 0
+        for header, _, end in self._scan():
+            headers.append((header, start))
+            start = end
+        return headers
+
+    def read(self, offset):
+        """Return (header, blobs) of the record starting at offset, as found by headers()."""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            record = self._read_record(f)
+        if record is None:
+            raise ValueError(f"No intact record at offset {offset} of {self.path}")
+        return record[0], record[1]
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def journal_path(job_card_number, journal_directory=JOURNAL_DIRECTORY):
+    """Return the journal file of a job card (job cards can hold characters like '/')."""
+    return os.path.join(journal_directory, safe_file_name(job_card_number) + ".journal")
+
+
+class IncrementalReport:
+    """Collects per-serial fragments for one job card and assembles the report at the end.
+
+    Reopening the same job card resumes from its journal, so serials recorded
+    before a crash or a failed assembly are kept. discard() removes the journal
+    once its serials are in a finished report.
+    """
+
+    def __init__(self, template_path, stored_values, output_dir=None, journal_directory=JOURNAL_DIRECTORY,
+                 limit_lines=None):
+        self.template_path = template_path
+        self.stored_values = stored_values
+        self.output_dir = output_dir
+        self.limit_lines = limit_lines
+        self.job_card_number = stored_values.get("job_card")
+        self.journal = ReportJournal(journal_path(self.job_card_number, journal_directory))
+        self.table_style_id = template_table_style_id(template_path)
+
+    def add_serial(self, serial, data):
+        """Render one serial's table and plots and append them to the journal."""
+        with span("add_serial", job_card=self.job_card_number, serial=serial):
+            table_xml = measurement_table_xml(data.frequency, data.parameters, self.table_style_id, DEFAULT_MAX_ROWS)
+            limit_lines = self.limit_lines
+            if limit_lines is None:
+                limit_lines = plot_limit_lines(limit_masks(self.stored_values, data.parameters))
+            plots = render_plots(data.frequency, data.parameters, os.path.join(CACHE_DIRECTORY, "plots"),
+                                 limit_lines, workers=1)
+            images = []
+            for _, path in plots:
+                with open(path, "rb") as f:
+                    images.append(f.read())
+            with span("journal_append"):
+                self.journal.append({"serial": serial, "time": time.time()}, [table_xml.encode("utf-8")] + images)
+        log.debug("Journalled serial %s for job card %s", serial, self.job_card_number)
+
+    def serials(self):
+        """Return {serial: journal offset} of the latest record of each serial, in first-recorded order."""
+        offsets = {}
+        for header, offset in self.journal.headers():
+            offsets[header["serial"]] = offset
+        return offsets
+
+    def _fragment_content(self, offsets):
+        """Yield each serial's heading, table and plots, reading one journal record at a time."""
+        for serial, offset in offsets.items():
+            _, blobs = self.journal.read(offset)
+            yield bold_paragraph_xml(f"Serial {serial}")
+            yield blobs[0]
+            for image in blobs[1:]:
+                yield Picture(image, DEFAULT_SETTINGS["width_in"])
+
+    def finalize(self, measurement_store=None):
+        """Stream the template into the report with every serial's fragment in place of <Measurements>.
+
+        Fragments are appended to the body when the template has no
+        <Measurements> paragraph; <Plots> paragraphs are removed, as the plots
+        follow each serial's table. With the job card's MeasurementStore, every
+        stored serial is checked against the connector limits in one pass into
+        the <Summary> table.
+        """
+        with span("finalize", job_card=self.job_card_number):
+            offsets = self.serials()
+            blocks = {MEASUREMENTS_PLACEHOLDER: self._fragment_content(offsets), PLOTS_PLACEHOLDER: ()}
+            if measurement_store is not None:
+                blocks[SUMMARY_PLACEHOLDER] = ()
+                results = evaluate_job_card(measurement_store, self.job_card_number, self.stored_values)
+                missing = set(offsets) - set(measurement_store.serials(self.job_card_number))
+                if missing:
+                    log.warning("%d serial(s) recorded in an earlier session are not in the limit summary",
+                                len(missing))
+                if results:
+                    with span("summary_table", rows=len(results)):
+                        blocks[SUMMARY_PLACEHOLDER] = [
+                            summary_table_xml(results, self.table_style_id)]
+
+            output_path = report_output_path(self.template_path, self.job_card_number, self.output_dir)
+            with span("save", streaming=True):
+                write_report(self.template_path, output_path, build_replacements(self.stored_values), blocks,
+                             (MEASUREMENTS_PLACEHOLDER,))
+            log.info("Assembled %d serial(s) into %s", len(offsets), output_path)
+            return output_path
+
+    def discard(self):
+        """Close and delete the journal, once its serials are in a finished report."""
+        self.journal.close()
+        try:
+            os.remove(self.journal.path)
+        except FileNotFoundError:
+            pass
+        log.debug("Removed the journal of job card %s", self.job_card_number)
+
+    def close(self):
+        self.journal.close()
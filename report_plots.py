@@ -0,0 +1,250 @@
+"""S-parameter plots for the report, rendered in a process pool and cached by content.
+
+Each PNG is stored under the hash of the trace data plus the plot settings, so
+regenerating a report (or a revision of it) only renders traces that changed.
+A plot's mtime is bumped whenever it is reused, and the least recently used
+plots are removed once the cache grows past PLOT_CACHE_MAX_BYTES.
+"""
+import atexit
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from tracing import span
+
+PLOTS_PLACEHOLDER = "<Plots>"
+# Bump when the look of the plots changes so old cache entries are not reused
+PLOT_STYLE_VERSION = 2
+DEFAULT_SETTINGS = {"width_in": 6.5, "height_in": 3.2, "dpi": 150, "grid": True}
+# Processes of the shared render pool
+PLOT_WORKERS = os.cpu_count() or 1
+# Size the plot cache is pruned back to, least recently used first
+PLOT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Plots used this recently are never pruned, so a report being assembled keeps its images
+PLOT_CACHE_KEEP_S = 3600
+# Least time between two prunes of the same cache directory
+PLOT_CACHE_PRUNE_INTERVAL_S = 600
+
+log = logging.getLogger(__name__)
+
+# One render pool for the whole process, started on first use: spawning
+# processes costs far more on Windows than most renders
+_pool = None
+_pool_lock = threading.Lock()
+_last_prune = {}  # cache directory -> time.monotonic() of its last prune
+_prune_lock = threading.Lock()
+
+
+def _plot_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PLOT_WORKERS)
+        return _pool
+
+
+def shutdown_plot_pool():
+    """Stop the shared render pool; the next render starts a new one."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+atexit.register(shutdown_plot_pool)
+
+
+def plot_key(frequency, values, parameter, settings, limit_lines):
+    """Return the content address of a plot: the data hash plus everything that changes the image."""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(frequency, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(values, dtype=np.complex128).tobytes())
+    digest.update(json.dumps([PLOT_STYLE_VERSION, parameter, settings, limit_lines], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def envelope(x, y, buckets):
+    """Reduce a trace to the min and max of each of at most `buckets` equal slices.
+
+    A plot cannot show more points than it has pixels, so drawing the envelope
+    looks the same as drawing every point but costs a fraction of the time.
+    Every point falls in a slice and the first and last points are kept, so the
+    envelope spans the whole band with its extremes.
+    """
+    if buckets <= 0 or len(x) <= 2 * buckets:
+        return x, y
+    width = -(-len(x) // buckets)
+    count = -(-len(x) // width) * width
+    # The last slice is padded with copies of the last point rather than cut off
+    xs = np.pad(x, (0, count - len(x)), mode="edge").reshape(-1, width)
+    ys = np.pad(y, (0, count - len(y)), mode="edge").reshape(-1, width)
+    lo, hi = ys.argmin(axis=1), ys.argmax(axis=1)
+    rows = np.arange(len(ys))
+    # Keep each bucket's min and max in frequency order so the line does not zig-zag backwards
+    first = np.where(lo < hi, lo, hi)
+    second = np.where(lo < hi, hi, lo)
+    out_x = np.column_stack([xs[rows, first], xs[rows, second]]).ravel()
+    out_y = np.column_stack([ys[rows, first], ys[rows, second]]).ravel()
+    return np.concatenate([x[:1], out_x, x[-1:]]), np.concatenate([y[:1], out_y, y[-1:]])
+
+
+def render_plot(frequency, values, parameter, settings, limit_lines=None):
+    """Render one trace as PNG bytes. Runs in a worker process, so no pyplot or Tk is touched."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(settings["width_in"], settings["height_in"]), dpi=settings["dpi"])
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(1, 1, 1)
+
+    x = np.asarray(frequency, dtype=np.float64) / 1e9
+    y = 20.0 * np.log10(np.maximum(np.abs(values), 1e-15))
+    x, y = envelope(x, y, int(settings["width_in"] * settings["dpi"]))
+    axes.plot(x, y, linewidth=0.8, label=parameter)
+
+    for start_hz, stop_hz, limit_db in limit_lines or []:
+        axes.plot([start_hz / 1e9, stop_hz / 1e9], [limit_db, limit_db], color="red", linewidth=1.0)
+
+    axes.set_xlabel("Frequency (GHz)")
+    axes.set_ylabel(f"{parameter} (dB)")
+    axes.set_title(parameter)
+    axes.grid(settings["grid"])
+    figure.tight_layout()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+def prune_plot_cache(cache_directory, max_bytes=PLOT_CACHE_MAX_BYTES, keep_s=PLOT_CACHE_KEEP_S):
+    """Remove the least recently used plots until the cache holds at most max_bytes; returns how many went.
+
+    Plots used in the last keep_s seconds stay whatever the size, as do files
+    that vanish or cannot be removed (another process may be using them).
+    """
+    entries = []
+    try:
+        with os.scandir(cache_directory) as scan:
+            for entry in scan:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return 0
+    total = sum(size for _, size, _ in entries)
+    cutoff = time.time() - keep_s
+    removed = 0
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes or mtime >= cutoff:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    if removed:
+        log.info("Pruned %d plot(s) from %s, %.0f MB left", removed, cache_directory, total / 1e6)
+    return removed
+
+
+def _maybe_prune(cache_directory):
+    """Prune the cache unless that was done in the last PLOT_CACHE_PRUNE_INTERVAL_S."""
+    now = time.monotonic()
+    with _prune_lock:
+        last = _last_prune.get(cache_directory)
+        if last is not None and now - last < PLOT_CACHE_PRUNE_INTERVAL_S:
+            return
+        _last_prune[cache_directory] = now
+    prune_plot_cache(cache_directory)
+
+
+def _render_to_cache(path, frequency, values, parameter, settings, limit_lines):
+    """Render a plot and move it into the cache atomically, so readers never see half a PNG."""
+    png = render_plot(frequency, values, parameter, settings, limit_lines)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(png)
+    os.replace(temp_path, path)
+    return path
+
+
+def render_plots(frequency, parameters, cache_directory, limit_lines=None, settings=None, workers=None):
+    """Return [(parameter, png path)] for every trace, rendering only the ones not cached yet.
+
+    limit_lines maps a parameter to [(start_hz, stop_hz, limit_db)] segments.
+    workers=1 renders in the calling process (used when already inside a worker);
+    otherwise plots go to the process-wide pool shared by every caller, at most
+    workers of this call's at a time (None: as many as the pool takes).
+    """
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    limit_lines = limit_lines or {}
+    os.makedirs(cache_directory, exist_ok=True)
+
+    plots = []
+    missing = []
+    for parameter, values in parameters.items():
+        lines = [list(line) for line in limit_lines.get(parameter, [])]
+        path = os.path.join(cache_directory, plot_key(frequency, values, parameter, settings, lines) + ".png")
+        plots.append((parameter, path))
+        try:
+            # Mark the plot as used, for pruning
+            os.utime(path)
+        except FileNotFoundError:
+            missing.append((path, frequency, values, parameter, settings, lines))
+
+    if missing:
+        log.debug("Rendering %d plot(s), %d cached", len(missing), len(plots) - len(missing))
+        with span("plot_render", rendered=len(missing), cached=len(plots) - len(missing)):
+            if workers == 1 or len(missing) == 1:
+                for job in missing:
+                    _render_to_cache(*job)
+            else:
+                pool = _plot_pool()
+                pending = set()
+                try:
+                    for job in missing:
+                        if workers and len(pending) >= workers:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                future.result()
+                        pending.add(pool.submit(_render_to_cache, *job))
+                    for future in wait(pending).done:
+                        future.result()
+                except BrokenProcessPool:
+                    # A worker died (killed, out of memory); start afresh next time
+                    shutdown_plot_pool()
+                    raise
+        _maybe_prune(cache_directory)
+    return plots
+
+
+def insert_plots(doc, plots, width=None):
+    """Replace the <Plots> paragraph with one picture per plot (appended to the body if absent)."""
+    from docx.shared import Inches
+
+    width = width or Inches(DEFAULT_SETTINGS["width_in"])
+    placeholder = next((paragraph for paragraph in doc.paragraphs
+                        if paragraph.text.strip() == PLOTS_PLACEHOLDER), None)
+    for parameter, path in plots:
+        if placeholder is not None:
+            paragraph = placeholder.insert_paragraph_before()
+        else:
+            paragraph = doc.add_paragraph()
+        with span("image_load", path=os.path.basename(path)):
+            paragraph.add_run().add_picture(path, width=width)
+    if placeholder is not None:
+        element = placeholder._element
+        element.getparent().remove(element)
+    log.debug("Inserted %d plot(s)", len(plots))
@@ -0,0 +1,371 @@
+"""Local HTTP service that generates reports for the MES and test scripts.
+
+Jobs run as the same ReportJob the wizard's Finish button starts, on a fixed
+pool of worker threads sharing one warm template cache. At most
+workers + max_queue jobs are admitted at a time; beyond that POST /jobs answers
+429 with a Retry-After estimate instead of queueing without limit.
+
+Endpoints (JSON in and out):
+    POST   /jobs          job spec -> 202 {"id", "status", "status_url"}; 400 bad spec; 429 full
+    GET    /jobs/<id>     status, output_path, error, queue and run times
+    DELETE /jobs/<id>     cancel a queued or running job
+    GET    /metrics       queue depth, running jobs, counters and latency percentiles
+    GET    /health        liveness
+
+A job spec uses the batch manifest keys: job_card, user_name or template,
+port_1_connector, port_2_connector, vna_cal, ecal_cal, report_date,
+selected_options (a list or ';'-separated), measurement_file, plus optional
+output_dir and force. Without output_dir the report goes next to the shared
+template through the local mirror and write-back queue, as in the wizard.
+
+The service listens on 127.0.0.1 only; it has no authentication. POST bodies
+must be sent as application/json (415 otherwise), which a web page cannot do
+cross-origin without a preflight the service never answers. A template must
+lie under the template directory, output_dir under --output-root (refused
+unless a root is configured) and measurement_file under either; job cards are
+reduced to a safe file name. A 400 answer says which key was rejected but
+never echoes the paths it was given.
+
+Usage:
+    python report_service.py --port 8765 --workers 4 --max-queue 32
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from batch_report import manifest_row_to_stored_values, resolve_template
+from report_engine import TEMPLATE_CACHE, TEMPLATE_DIRECTORY, TEMPLATE_MAP, template_path_for_user
+from report_jobs import ReportJob
+from shared_folder import TEMPLATE_MIRROR, WRITE_BACK
+from tracing import configure_logging
+
+DEFAULT_PORT = 8765
+# Largest job spec accepted, in bytes
+MAX_SPEC_BYTES = 64 * 1024
+# Finished jobs kept for GET /jobs/<id>, oldest dropped first
+FINISHED_JOBS_KEPT = 1000
+# Completed jobs the latency percentiles are taken over
+LATENCY_WINDOW = 1000
+
+log = logging.getLogger(__name__)
+
+
+class BadJobSpec(ValueError):
+    """Raised by ReportService.submit for a spec it refuses; the message is safe to send back."""
+
+
+class ServiceFull(Exception):
+    """Raised by ReportService.submit when the queue is at capacity."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Report queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ServiceJob:
+    """A ReportJob plus the state the service reports for it."""
+
+    __slots__ = ("id", "job_card", "report_job", "status", "output_path", "error")
+
+    def __init__(self, job_id, job_card, report_job):
+        self.id = job_id
+        self.job_card = job_card
+        self.report_job = report_job
+        self.status = "queued"
+        self.output_path = None
+        self.error = None
+
+    def drain(self):
+        """Apply the messages the ReportJob has posted since the last call."""
+        while True:
+            try:
+                kind, value = self.report_job.queue.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "progress":
+                self.status = "running"
+            elif kind == "done":
+                self.status, self.output_path = "done", value
+            elif kind == "error":
+                self.status, self.error = "error", value
+            else:
+                self.status = "cancelled"
+
+    def as_dict(self):
+        job = self.report_job
+        now = time.monotonic()
+        queued_s = (job.started or now) - job.created
+        run_s = (job.finished or now) - job.started if job.started else None
+        return {"id": self.id, "job_card": self.job_card, "status": self.status, "output_path": self.output_path,
+                "error": self.error, "queued_s": round(queued_s, 4), "run_s": None if run_s is None else round(run_s, 4)}
+
+
+def _inside(path, root):
+    """Return the real path of path when it lies under root (after resolving links and '..'), else None."""
+    try:
+        path = os.path.realpath(os.path.join(root, path))
+        root = os.path.realpath(root)
+        if os.path.commonpath([os.path.normcase(path), os.path.normcase(root)]) == os.path.normcase(root):
+            return path
+    except ValueError:  # different drives, or a NUL in the path
+        pass
+    return None
+
+
+class ReportService:
+    """Bounded job queue in front of a pool of report workers."""
+
+    def __init__(self, workers=4, max_queue=32, template_directory=TEMPLATE_DIRECTORY, output_root=None):
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self.template_directory = template_directory
+        self.output_root = output_root
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="service")
+        self._jobs = OrderedDict()  # id -> ServiceJob, unfinished and recently finished
+        self._active = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0, "cancelled": 0}
+        self.started = time.monotonic()
+
+    def warm_up(self):
+        """Mirror and compile every user's template, so the first job of each skips the parse."""
+        for user_name in TEMPLATE_MAP:
+            try:
+                TEMPLATE_CACHE.get(TEMPLATE_MIRROR.local_path(template_path_for_user(user_name, self.template_directory)))
+            except OSError as e:
+                log.warning("Could not warm the template of %s: %s", user_name, e)
+
+    def _retry_after(self):
+        """Seconds until a slot is likely to free up, from the recent median latency."""
+        if not self._latencies:
+            return 1
+        return max(1, math.ceil(_percentile(self._latencies, 0.5) * (self._active - self.workers + 1) / self.workers))
+
+    def _confine(self, spec, key, *roots):
+        """Return the real path of spec[key] under the first root that holds it, else raise BadJobSpec."""
+        for root in roots:
+            if root:
+                path = _inside(str(spec[key]), root)
+                if path is not None:
+                    return path
+        raise BadJobSpec(f"{key} is outside the directories this service may use")
+
+    def submit(self, spec):
+        """Admit a job spec and return its ServiceJob; raises ServiceFull or BadJobSpec."""
+        if not isinstance(spec, dict) or not spec.get("job_card"):
+            raise BadJobSpec("job spec must be an object with a job_card")
+        if not spec.get("template") and spec.get("user_name") not in TEMPLATE_MAP:
+            raise BadJobSpec("job spec needs a template or a known user_name")
+        try:
+            stored_values = manifest_row_to_stored_values(spec)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            log.info("Refused job spec: %s", e)
+            raise BadJobSpec("job spec values are not valid") from e
+        template_path = self._confine(dict(spec, template=resolve_template(spec, self.template_directory)),
+                                      "template", self.template_directory)
+        generate_kwargs = {"force": bool(spec.get("force"))}
+        measurement_file = None
+        if spec.get("measurement_file"):
+            measurement_file = self._confine(spec, "measurement_file", self.template_directory, self.output_root)
+        if spec.get("output_dir"):
+            if not self.output_root:
+                raise BadJobSpec("output_dir is not allowed: the service has no output root")
+            output_dir = self._confine(spec, "output_dir", self.output_root)
+            try:
+                os.makedirs(output_dir, exist_ok=True)
+            except OSError as e:
+                log.warning("Could not create output_dir %s: %s", output_dir, e)
+                raise BadJobSpec("output_dir could not be created") from e
+            generate_kwargs["output_dir"] = output_dir
+            mirror = write_back = None
+        else:
+            mirror, write_back = TEMPLATE_MIRROR, WRITE_BACK
+
+        with self._lock:
+            if self._active >= self.capacity:
+                self.counters["rejected"] += 1
+                raise ServiceFull(self._retry_after())
+            self._active += 1
+            self.counters["accepted"] += 1
+            job_id = str(next(self._ids))
+            report_job = ReportJob(template_path, stored_values, template_mirror=mirror, write_back=write_back,
+                                   measurement_file=measurement_file, **generate_kwargs)
+            job = ServiceJob(job_id, stored_values["job_card"], report_job)
+            self._jobs[job_id] = job
+        report_job.start(self._executor)
+        report_job.future.add_done_callback(lambda _: self._finished(job))
+        return job
+
+    def _finished(self, job):
+        with self._lock:
+            job.drain()
+            self._active -= 1
+            key = {"done": "completed", "error": "failed"}.get(job.status, "cancelled")
+            self.counters[key] += 1
+            if job.status == "done":
+                self._latencies.append(job.report_job.finished - job.report_job.created)
+            finished = [job_id for job_id, other in self._jobs.items() if other.status in ("done", "error", "cancelled")]
+            for job_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.drain()
+            return job
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.report_job.cancel()
+        return job
+
+    def metrics(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            running = sum(1 for job in self._jobs.values() if job.report_job.started and not job.report_job.finished)
+            return {
+                "queue_depth": self._active - running,
+                "running": running,
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "uptime_s": round(time.monotonic() - self.started, 1),
+                **self.counters,
+                "latency_s": {
+                    "count": len(latencies),
+                    "p50": round(_percentile(latencies, 0.5), 4) if latencies else None,
+                    "p95": round(_percentile(latencies, 0.95), 4) if latencies else None,
+                    "max": round(max(latencies), 4) if latencies else None,
+                },
+                "templates_cached": len(TEMPLATE_CACHE),
+                "write_back_pending": WRITE_BACK.pending(),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Routes requests to the ReportService on the server."""
+
+    server_version = "VNAReportService/1"
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_id(self):
+        parts = self.path.rstrip("/").split("/")
+        return parts[2] if len(parts) == 3 and parts[1] == "jobs" else None
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/health":
+            self._send(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send(200, service.metrics())
+        elif self._job_id():
+            job = service.get(self._job_id())
+            if job is None:
+                self._send(404, {"error": "no such job"})
+            else:
+                self._send(200, job.as_dict())
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            self._send(404, {"error": "not found"})
+            return
+        if self.headers.get_content_type() != "application/json":
+            self._send(415, {"error": "job specs must be sent as application/json"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_SPEC_BYTES:
+            self._send(413, {"error": f"job spec larger than {MAX_SPEC_BYTES} bytes"})
+            return
+        try:
+            spec = json.loads(self.rfile.read(length) or b"null")
+            job = self.server.service.submit(spec)
+        except ServiceFull as e:
+            self._send(429, {"error": str(e)}, {"Retry-After": str(e.retry_after)})
+        except BadJobSpec as e:
+            self._send(400, {"error": f"bad job spec: {e}"})
+        except ValueError:
+            self._send(400, {"error": "bad job spec: not valid JSON"})
+        else:
+            self._send(202, {"id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"},
+                       {"Location": f"/jobs/{job.id}"})
+
+    def do_DELETE(self):
+        job = self.server.service.cancel(self._job_id()) if self._job_id() else None
+        if job is None:
+            self._send(404, {"error": "no such job"})
+        else:
+            self._send(202, job.as_dict())
+
+    def log_message(self, format, *args):
+        log.debug("%s %s", self.address_string(), format % args)
+
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT):
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve report generation over HTTP on this PC.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=4, help="reports generated at the same time")
+    parser.add_argument("--max-queue", type=int, default=32, help="jobs waiting beyond the workers before 429")
+    parser.add_argument("--template-dir", default=TEMPLATE_DIRECTORY, help="directory holding Template_*.docx")
+    parser.add_argument("--output-root", default=None,
+                        help="directory under which a job's output_dir may be (default: output_dir refused)")
+    parser.add_argument("--log-level", default=None, help="DEBUG, INFO, WARNING or ERROR (default: INFO)")
+    args = parser.parse_args(argv)
+
+    configure_logging(args.log_level)
+    service = ReportService(args.workers, args.max_queue, args.template_dir, args.output_root)
+    WRITE_BACK.resume()
+    threading.Thread(target=service.warm_up, name="warm-up", daemon=True).start()
+    server = make_server(service, port=args.port)
+    log.info("Report service listening on http://127.0.0.1:%d", args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        WRITE_BACK.flush(timeout=10)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
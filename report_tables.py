@@ -0,0 +1,186 @@
+"""Measurement tables for the report, generated as one w:tbl element.
+
+Adding thousands of rows through python-docx (add_row, cell.text) re-walks the
+table on every cell access. Here the cell text is formatted column-wise with
+NumPy and the whole table is parsed from a single XML string.
+"""
+import logging
+from xml.sax.saxutils import escape
+
+import numpy as np
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.text.paragraph import Paragraph
+
+MEASUREMENTS_PLACEHOLDER = "<Measurements>"
+SUMMARY_PLACEHOLDER = "<Summary>"
+TABLE_STYLE = "Table Grid"
+# Rows kept per table in the report, enough to read without burying the summary
+DEFAULT_MAX_ROWS = 201
+
+W_P = qn("w:p")
+
+log = logging.getLogger(__name__)
+
+_CELL_START = ('<w:tc><w:p><w:pPr><w:spacing w:before="0" w:after="0"/><w:jc w:val="center"/></w:pPr>'
+               '<w:r><w:t>')
+_CELL_END = "</w:t></w:r></w:p></w:tc>"
+_BORDERS = "".join(f'<w:{edge} w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+                   for edge in ("top", "left", "bottom", "right", "insideH", "insideV"))
+
+
+def decimate(count, max_rows):
+    """Return the row indices to keep so at most max_rows rows remain, always keeping both ends."""
+    if not max_rows or count <= max_rows:
+        return np.arange(count)
+    return np.unique(np.linspace(0, count - 1, max_rows).round().astype(np.intp))
+
+
+def magnitude_db(values):
+    """Return 20*log10(|S|), clipping zeros so they do not become -inf."""
+    return 20.0 * np.log10(np.maximum(np.abs(values), 1e-15))
+
+
+def _cells(strings):
+    """Wrap an array of cell strings in w:tc markup, all at once."""
+    return np.char.add(np.char.add(_CELL_START, strings), _CELL_END)
+
+
+def table_style_id(doc, style_name=TABLE_STYLE):
+    """Return the style id of a table style defined in the template, or None."""
+    try:
+        return doc.styles[style_name].style_id
+    except KeyError:
+        return None
+
+
+def measurement_table_xml(frequency, parameters, style_id=None, max_rows=None, frequency_unit=("GHz", 1e9)):
+    """Return the XML of a w:tbl of frequency against the magnitude in dB of each parameter.
+
+    frequency is in Hz and parameters maps a name (e.g. "S21") to a complex array
+    on that axis.
+    """
+    rows = decimate(len(frequency), max_rows)
+    unit_name, unit_scale = frequency_unit
+    names = list(parameters)
+
+    columns = [_cells(np.char.mod("%.6g", frequency[rows] / unit_scale))]
+    for name in names:
+        columns.append(_cells(np.char.mod("%.2f", magnitude_db(parameters[name][rows]))))
+    body = columns[0]
+    for column in columns[1:]:
+        body = np.char.add(body, column)
+
+    header_cells = "".join(f"{_CELL_START}{escape(title)}{_CELL_END}"
+                           for title in [f"Frequency ({unit_name})"] + [f"{name} (dB)" for name in names])
+    if style_id:
+        table_properties = f'<w:tblStyle w:val="{escape(style_id)}"/>'
+    else:
+        table_properties = f"<w:tblBorders>{_BORDERS}</w:tblBorders>"
+    grid = "<w:gridCol/>" * (len(names) + 1)
+
+    return "".join([
+        f"<w:tbl {nsdecls('w')}><w:tblPr>{table_properties}",
+        '<w:tblW w:w="5000" w:type="pct"/><w:jc w:val="center"/></w:tblPr>',
+        f"<w:tblGrid>{grid}</w:tblGrid>",
+        f"<w:tr><w:trPr><w:tblHeader/></w:trPr>{header_cells}</w:tr>",
+        # A w:tr needs at least one w:tc, so a file with no points gets the header row only
+        f"<w:tr>{'</w:tr><w:tr>'.join(body.tolist())}</w:tr>" if body.size else "",
+        "</w:tbl>",
+    ])
+
+
+def _table_xml(header, rows, style_id):
+    """Return the XML of a w:tbl with a repeating header row; rows are lists of cell strings."""
+    header_cells = "".join(f"{_CELL_START}{escape(title)}{_CELL_END}" for title in header)
+    body = ["".join(f"{_CELL_START}{escape(text)}{_CELL_END}" for text in row) for row in rows]
+    if style_id:
+        table_properties = f'<w:tblStyle w:val="{escape(style_id)}"/>'
+    else:
+        table_properties = f"<w:tblBorders>{_BORDERS}</w:tblBorders>"
+    return "".join([
+        f"<w:tbl {nsdecls('w')}><w:tblPr>{table_properties}",
+        '<w:tblW w:w="5000" w:type="pct"/><w:jc w:val="center"/></w:tblPr>',
+        f"<w:tblGrid>{'<w:gridCol/>' * len(header)}</w:tblGrid>",
+        f"<w:tr><w:trPr><w:tblHeader/></w:trPr>{header_cells}</w:tr>",
+        "".join(f"<w:tr>{cells}</w:tr>" for cells in body),
+        "</w:tbl>",
+    ])
+
+
+def summary_table_xml(results, style_id=None):
+    """Return the XML of a w:tbl with one row per limits.LimitResult: margin, where it is worst, PASS/FAIL."""
+    rows = []
+    for result in results:
+        ranges = ", ".join(f"{start / 1e9:.4g}-{stop / 1e9:.4g}" if start != stop else f"{start / 1e9:.4g}"
+                           for start, stop in result.failing_ranges)
+        rows.append([str(result.serial), result.parameter, result.connector or "", f"{result.worst_margin_db:.2f}",
+                     f"{result.worst_frequency_hz / 1e9:.4g}", ranges or "-", "PASS" if result.passed else "FAIL"])
+    header = ["Serial", "Parameter", "Connector", "Worst margin (dB)", "At (GHz)", "Failing (GHz)", "Result"]
+    return _table_xml(header, rows, style_id)
+
+
+def build_measurement_table(frequency, parameters, style_id=None, max_rows=None, frequency_unit=("GHz", 1e9)):
+    """Build the measurement table as an element ready to be inserted into the document body."""
+    return parse_xml(measurement_table_xml(frequency, parameters, style_id, max_rows, frequency_unit))
+
+
+def find_placeholder_paragraph(doc, placeholder=MEASUREMENTS_PLACEHOLDER):
+    """Return the first body paragraph whose text is exactly the placeholder, or None."""
+    for p in doc.element.body.iter(W_P):
+        if Paragraph(p, None).text.strip() == placeholder:
+            return p
+    return None
+
+
+def insert_summary_table(doc, results):
+    """Replace the <Summary> paragraph with the limit summary table.
+
+    Unlike the measurement table, the summary only goes where the template asks
+    for it. Without results the placeholder paragraph is removed.
+    """
+    p = find_placeholder_paragraph(doc, SUMMARY_PLACEHOLDER)
+    if p is None:
+        return None
+    table = None
+    if results:
+        table = parse_xml(summary_table_xml(results, table_style_id(doc)))
+        p.addprevious(table)
+    _remove_paragraph(p)
+    return table
+
+
+def insert_measurement_table(doc, frequency, parameters, max_rows=DEFAULT_MAX_ROWS):
+    """Replace the <Measurements> paragraph with the measurement table.
+
+    Without a placeholder in the template the table is appended to the end of
+    the body. With no parameters the placeholder paragraph is simply removed.
+    """
+    p = find_placeholder_paragraph(doc)
+    if not parameters:
+        if p is not None:
+            _remove_paragraph(p)
+        return None
+
+    table = build_measurement_table(frequency, parameters, table_style_id(doc), max_rows)
+    if p is None:
+        body = doc.element.body
+        # Keep the section properties as the last child of the body
+        sect_pr = body.find(qn("w:sectPr"))
+        if sect_pr is not None:
+            sect_pr.addprevious(table)
+        else:
+            body.append(table)
+    else:
+        p.addprevious(table)
+        _remove_paragraph(p)
+    log.debug("Inserted measurement table with %d rows", len(table) - 3)
+    return table
+
+
+def _remove_paragraph(p):
+    """Remove a paragraph, leaving an empty one where Word requires a paragraph (end of a cell)."""
+    parent = p.getparent()
+    parent.remove(p)
+    if parent.tag == qn("w:tc") and (len(parent) == 0 or parent[-1].tag != W_P):
+        parent.append(parse_xml(f"<w:p {nsdecls('w')}/>"))
@@ -0,0 +1,416 @@
+"""Index of the VNA setup (.STA) library, searchable by job card, connector and date.
+
+The setup library is thousands of state files spread over shared drives.
+SetupLibrary.refresh() lists the library folders on a thread pool, one task per
+directory, so slow network shares are walked in parallel. Only files whose
+size or modification time changed since the last scan are read again. For
+each file the index keeps the size, mtime, a SHA-1 of the contents and the
+fields that can be read from it:
+
+- job card, connectors and frequency range from the file and folder names,
+  e.g. "Setups/GUK12345/SMA-N 0.1-18GHz.sta";
+- the instrument model from the printable strings in the first 64 KiB. The
+  state files are a binary instrument format; only the strings in them are used.
+
+The index is a local SQLite database. Searching it is an indexed query,
+whatever the size of the library and whether or not the shares are reachable.
+Files on a share that cannot be listed keep their entries until it is back.
+
+Usage:
+    python setup_library.py scan
+    python setup_library.py add-directory "S:/VNA Setups"
+    python setup_library.py search --job-card GUK12345 --connector SMA --since 2025-01-01
+"""
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime
+
+from app_paths import SETUP_DIRECTORY, SETUP_INDEX_DATABASE
+from job_history import DEFAULT_CONNECTORS
+from tracing import configure_logging
+
+SETUP_EXTENSIONS = (".sta", ".csa")
+# Bytes at the start of a file searched for header strings
+HEADER_BYTES = 64 << 10
+HASH_BUFFER = 1 << 20
+# Listing and hashing wait on the network far more than on the CPU
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+DEFAULT_SEARCH_LIMIT = 500
+
+JOB_CARD_PATTERN = re.compile(r"(?<![A-Za-z0-9])([A-Z]{0,4}\d{5,}(?:-[A-Z0-9]{1,3})?)(?![A-Za-z0-9])")
+FREQUENCY_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(?:\s*-\s*(\d+(?:\.\d+)?))?\s*([kMG])Hz", re.IGNORECASE)
+FREQUENCY_SCALE = {"k": 1e3, "m": 1e6, "g": 1e9}
+INSTRUMENT_PATTERN = re.compile(rb"(?<![A-Za-z0-9])([A-Z]\d{4}[A-Z])(?![A-Za-z0-9])")
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS setup_directories (
+    path TEXT PRIMARY KEY,
+    added TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS setups (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    modified TEXT NOT NULL,
+    sha1 TEXT NOT NULL,
+    job_card TEXT,
+    instrument TEXT,
+    start_hz REAL,
+    stop_hz REAL,
+    indexed TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS setup_connectors (
+    setup_id INTEGER NOT NULL REFERENCES setups (id) ON DELETE CASCADE,
+    connector TEXT NOT NULL,
+    PRIMARY KEY (setup_id, connector)
+);
+CREATE INDEX IF NOT EXISTS setups_job_card ON setups (job_card);
+CREATE INDEX IF NOT EXISTS setups_modified ON setups (modified);
+CREATE INDEX IF NOT EXISTS setups_sha1 ON setups (sha1);
+CREATE INDEX IF NOT EXISTS setup_connectors_connector ON setup_connectors (connector, setup_id);
+"""
+
+log = logging.getLogger(__name__)
+
+
+class SetupFile:
+    """One indexed setup file; modified is a date and connectors a tuple of names."""
+
+    __slots__ = ("path", "name", "size", "modified", "sha1", "job_card", "connectors", "instrument", "start_hz",
+                 "stop_hz")
+
+    def __init__(self, path, name, size, modified, sha1, job_card, connectors, instrument, start_hz, stop_hz):
+        self.path = path
+        self.name = name
+        self.size = size
+        self.modified = date.fromisoformat(modified)
+        self.sha1 = sha1
+        self.job_card = job_card
+        self.connectors = tuple(sorted(connectors.split(","))) if connectors else ()
+        self.instrument = instrument
+        self.start_hz = start_hz
+        self.stop_hz = stop_hz
+
+    def __repr__(self):
+        return f"SetupFile({self.path!r})"
+
+
+def _connector_pattern(connectors):
+    names = sorted(connectors, key=len, reverse=True)
+    return re.compile(r"(?<![A-Za-z0-9])(" + "|".join(re.escape(name) for name in names) + r")(?![A-Za-z0-9])",
+                      re.IGNORECASE)
+
+
+def parse_setup_fields(path, header, connectors=DEFAULT_CONNECTORS):
+    """Return the job card, connectors, instrument and frequency range found for a setup file.
+
+    The file name is searched first, then its folder; header is the start of
+    the file's contents.
+    """
+    directory, file_name = os.path.split(path)
+    stem = os.path.splitext(file_name)[0]
+    names = (stem, os.path.basename(directory))
+
+    job_card = next((match.group(1) for name in names for match in [JOB_CARD_PATTERN.search(name)] if match), None)
+    found = set()
+    if connectors:
+        by_upper = {name.upper(): name for name in connectors}
+        pattern = _connector_pattern(connectors)
+        found = {by_upper[match.group(1).upper()] for name in names for match in pattern.finditer(name)}
+
+    start_hz = stop_hz = None
+    match = next((match for name in names for match in [FREQUENCY_PATTERN.search(name)] if match), None)
+    if match:
+        scale = FREQUENCY_SCALE[match.group(3).lower()]
+        if match.group(2):
+            start_hz, stop_hz = float(match.group(1)) * scale, float(match.group(2)) * scale
+        else:
+            stop_hz = float(match.group(1)) * scale
+
+    instrument = INSTRUMENT_PATTERN.search(header)
+    return {"job_card": job_card, "connectors": sorted(found),
+            "instrument": instrument.group(1).decode("ascii") if instrument else None,
+            "start_hz": start_hz, "stop_hz": stop_hz}
+
+
+def _list_directory(path):
+    """Return ([(path, size, mtime_ns)] of the setup files in a directory, [subdirectories])."""
+    files, directories = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.name.lower().endswith(SETUP_EXTENSIONS):
+                    stat = entry.stat()
+                    files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+            except OSError as e:
+                log.debug("Skipping %s: %s", entry.path, e)
+    return files, directories
+
+
+def _read_setup(path, connectors):
+    """Hash a setup file and return (sha1, fields), reading it once."""
+    digest = hashlib.sha1()
+    header = None
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_BUFFER), b""):
+            if header is None:
+                header = chunk[:HEADER_BYTES]
+            digest.update(chunk)
+    return digest.hexdigest(), parse_setup_fields(path, header or b"", connectors)
+
+
+def _within(path, directory):
+    directory = directory.rstrip("\\/")
+    return path == directory or path.startswith(directory + os.sep) or path.startswith(directory + "/")
+
+
+class SetupLibrary:
+    """The setup index. One connection shared by the threads of the process, under a lock."""
+
+    def __init__(self, path=SETUP_INDEX_DATABASE, default_directories=(SETUP_DIRECTORY,)):
+        self.path = path
+        self.default_directories = default_directories
+        self._connection = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _db(self):
+        if self._connection is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                connection.executescript(SCHEMA)
+                connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+                added = datetime.now().isoformat(timespec="seconds")
+                connection.executemany("INSERT OR IGNORE INTO setup_directories (path, added) VALUES (?, ?)",
+                                       [(os.path.normpath(path), added) for path in self.default_directories])
+            self._connection = connection
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # Library folders
+
+    def directories(self):
+        """Return the folders that are scanned, in the order they were added."""
+        with self._lock:
+            rows = self._db().execute("SELECT path FROM setup_directories ORDER BY added, path").fetchall()
+        return [path for (path,) in rows]
+
+    def add_directory(self, path):
+        """Add a folder (and its subfolders) to the library; it is indexed by the next refresh()."""
+        path = os.path.normpath(os.path.abspath(path))
+        with self._lock:
+            self._db().execute("INSERT OR IGNORE INTO setup_directories (path, added) VALUES (?, ?)",
+                               (path, datetime.now().isoformat(timespec="seconds")))
+        log.info("Added setup folder %s", path)
+        return path
+
+    def remove_directory(self, path):
+        """Stop scanning a folder and drop the files indexed under it."""
+        path = os.path.normpath(path)
+        with self._lock:
+            connection = self._db()
+            with connection:
+                connection.execute("BEGIN")
+                connection.execute("DELETE FROM setup_directories WHERE path = ?", (path,))
+                stale = [(setup_id,) for setup_id, setup_path in connection.execute("SELECT id, path FROM setups")
+                         if _within(setup_path, path)]
+                connection.executemany("DELETE FROM setups WHERE id = ?", stale)
+        log.info("Removed setup folder %s and %d indexed file(s)", path, len(stale))
+
+    # Indexing
+
+    def refresh(self, directories=None, connectors=DEFAULT_CONNECTORS, workers=DEFAULT_WORKERS):
+        """Bring the index up to date with the library folders and return counts of what changed.
+
+        Directories are listed and changed files hashed on a pool of workers
+        threads. Files are only read when new or when their size or mtime
+        changed. Files no longer found are dropped, except under folders that
+        could not be listed.
+        """
+        start = time.perf_counter()
+        with self._refresh_lock:
+            roots = [os.path.normpath(path) for path in (directories or self.directories())]
+            with self._lock:
+                known = {path: (size, mtime_ns) for path, size, mtime_ns
+                         in self._db().execute("SELECT path, size, mtime_ns FROM setups")}
+
+            found, unreachable, changed, errors = set(), [], [], 0
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                listing = {pool.submit(_list_directory, root): root for root in roots}
+                reading = {}
+                while listing:
+                    done, _ = wait(listing, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        directory = listing.pop(future)
+                        try:
+                            files, subdirectories = future.result()
+                        except OSError as e:
+                            log.warning("Cannot list setup folder %s: %s", directory, e)
+                            unreachable.append(directory)
+                            continue
+                        for subdirectory in subdirectories:
+                            listing[pool.submit(_list_directory, subdirectory)] = subdirectory
+                        for path, size, mtime_ns in files:
+                            found.add(path)
+                            if known.get(path) != (size, mtime_ns):
+                                reading[pool.submit(_read_setup, path, connectors)] = (path, size, mtime_ns)
+                for future, (path, size, mtime_ns) in reading.items():
+                    try:
+                        sha1, fields = future.result()
+                    except OSError as e:
+                        log.warning("Cannot read setup %s: %s", path, e)
+                        errors += 1
+                        continue
+                    changed.append((path, size, mtime_ns, sha1, fields))
+
+            removed = [path for path in known if path not in found
+                       and any(_within(path, root) for root in roots)
+                       and not any(_within(path, directory) for directory in unreachable)]
+            self._store(changed, removed)
+
+        counts = {"files": len(found), "added": sum(1 for path, *_ in changed if path not in known),
+                  "updated": sum(1 for path, *_ in changed if path in known), "removed": len(removed),
+                  "errors": errors, "unreachable": len(unreachable), "seconds": time.perf_counter() - start}
+        log.info("Indexed %(files)d setup file(s) in %(seconds).2fs: %(added)d new, %(updated)d changed, "
+                 "%(removed)d removed", counts)
+        return counts
+
+    def _store(self, changed, removed):
+        indexed = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            connection = self._db()
+            with connection:
+                connection.execute("BEGIN")
+                connection.executemany("DELETE FROM setups WHERE path = ?",
+                                       [(path,) for path in removed] + [(path,) for path, *_ in changed])
+                for path, size, mtime_ns, sha1, fields in changed:
+                    modified = datetime.fromtimestamp(mtime_ns / 1e9).date().isoformat()
+                    setup_id = connection.execute(
+                        "INSERT INTO setups (path, name, size, mtime_ns, modified, sha1, job_card, instrument, "
+                        "start_hz, stop_hz, indexed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (path, os.path.basename(path), size, mtime_ns, modified, sha1, fields["job_card"],
+                         fields["instrument"], fields["start_hz"], fields["stop_hz"], indexed)).lastrowid
+                    connection.executemany("INSERT INTO setup_connectors (setup_id, connector) VALUES (?, ?)",
+                                           [(setup_id, connector) for connector in fields["connectors"]])
+
+    # Searching
+
+    def search(self, text=None, job_card=None, connector=None, since=None, until=None, limit=DEFAULT_SEARCH_LIMIT):
+        """Return matching SetupFiles, most recently modified first.
+
+        text matches anywhere in the file name or job card, job_card is a
+        prefix of the parsed job card (or anywhere in the name), connector one
+        of the connector names, and since and until are inclusive dates on the
+        file's modification date.
+        """
+        conditions, parameters = [], []
+        if text:
+            pattern = "%" + re.sub(r"([\\%_])", r"\\\1", text.strip()) + "%"
+            conditions.append("(s.name LIKE ? ESCAPE '\\' OR s.job_card LIKE ? ESCAPE '\\')")
+            parameters += [pattern, pattern]
+        if job_card:
+            job_card = job_card.strip()
+            conditions.append("((s.job_card >= ? AND s.job_card < ?) OR s.name LIKE ? ESCAPE '\\')")
+            parameters += [job_card, job_card + "\U0010ffff", "%" + re.sub(r"([\\%_])", r"\\\1", job_card) + "%"]
+        if connector:
+            conditions.append("s.id IN (SELECT setup_id FROM setup_connectors WHERE connector = ?)")
+            parameters.append(connector)
+        if since is not None:
+            conditions.append("s.modified >= ?")
+            parameters.append(since.isoformat())
+        if until is not None:
+            conditions.append("s.modified <= ?")
+            parameters.append(until.isoformat())
+        query = ("SELECT s.path, s.name, s.size, s.modified, s.sha1, s.job_card, "
+                 "(SELECT group_concat(connector) FROM setup_connectors WHERE setup_id = s.id), "
+                 "s.instrument, s.start_hz, s.stop_hz FROM setups s")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY s.modified DESC, s.name"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._db().execute(query, parameters).fetchall()
+        return [SetupFile(*row) for row in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM setups").fetchone()[0]
+
+
+# Shared by the recall dialog and anything else in the process
+SETUP_LIBRARY = SetupLibrary()
+
+
+def _date_argument(text):
+    return date.fromisoformat(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index and search the VNA setup library.")
+    parser.add_argument("--database", default=SETUP_INDEX_DATABASE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    scan = commands.add_parser("scan", help="bring the index up to date")
+    scan.add_argument("--directory", action="append", help="scan only this folder (repeatable)")
+    scan.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    add = commands.add_parser("add-directory", help="add a folder to the library")
+    add.add_argument("path")
+    remove = commands.add_parser("remove-directory", help="remove a folder and its files from the library")
+    remove.add_argument("path")
+    commands.add_parser("directories", help="list the library folders")
+    search = commands.add_parser("search", help="find setup files")
+    search.add_argument("text", nargs="?")
+    search.add_argument("--job-card")
+    search.add_argument("--connector")
+    search.add_argument("--since", type=_date_argument, help="YYYY-MM-DD")
+    search.add_argument("--until", type=_date_argument, help="YYYY-MM-DD")
+    search.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT)
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    library = SetupLibrary(args.database)
+    if args.command == "scan":
+        library.refresh(args.directory, workers=args.workers)
+    elif args.command == "add-directory":
+        library.add_directory(args.path)
+    elif args.command == "remove-directory":
+        library.remove_directory(args.path)
+    elif args.command == "directories":
+        for path in library.directories():
+            print(path)
+    else:
+        start = time.perf_counter()
+        setups = library.search(args.text, args.job_card, args.connector, args.since, args.until, args.limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for setup in setups:
+            print(f"{setup.modified}  {setup.job_card or '-':<14} {','.join(setup.connectors) or '-':<8} "
+                  f"{setup.instrument or '-':<7} {setup.path}")
+        print(f"{len(setups)} setup(s) in {elapsed_ms:.1f} ms")
+    library.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
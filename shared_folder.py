@@ -0,0 +1,344 @@
+"""Keep report generation off the OneDrive-synced folder.
+
+Templates are read from a local mirror. Each copy is checked against its
+SHA-256 before use and refreshed in the background when the shared copy
+changes. If the shared folder cannot be reached, the last good copy is used.
+
+Reports are written to a local outbox. A single writer thread then copies them
+to the shared folder: it writes a temporary file there and renames it over the
+report, so the sync client never uploads half a file. When a copy fails because
+Word or the sync client holds a lock, it is retried with exponential backoff.
+A .pending marker sits next to every report waiting in the outbox, so copies
+cut short by closing the application are resumed on the next start. Delivered
+reports stay in the outbox for OUTBOX_KEEP_SECONDS, so regenerating one soon
+after can still be skipped when nothing changed, and are then pruned.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from app_paths import CACHE_DIRECTORY
+
+MIRROR_DIRECTORY = os.path.join(CACHE_DIRECTORY, "templates")
+OUTBOX_DIRECTORY = os.path.join(CACHE_DIRECTORY, "outbox")
+PENDING_SUFFIX = ".pending"
+# How often the background thread checks the shared templates for changes
+MIRROR_REFRESH_SECONDS = 300
+# Age after which delivered reports (and their sidecar files) are removed from the outbox
+OUTBOX_KEEP_SECONDS = 7 * 24 * 3600
+# Least time between two prunes of the outbox
+OUTBOX_PRUNE_INTERVAL_SECONDS = 3600
+
+log = logging.getLogger(__name__)
+
+
+def _copy_with_digest(source_path, destination_path):
+    """Copy a file and return the SHA-256 of the bytes copied."""
+    digest = hashlib.sha256()
+    with open(source_path, "rb") as source, open(destination_path, "wb") as destination:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+            destination.write(block)
+    return digest.hexdigest()
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TemplateMirror:
+    """Local copies of the shared templates, validated by checksum."""
+
+    def __init__(self, mirror_directory=MIRROR_DIRECTORY, refresh_seconds=MIRROR_REFRESH_SECONDS):
+        self.mirror_directory = mirror_directory
+        self.refresh_seconds = refresh_seconds
+        self._index_path = os.path.join(mirror_directory, "index.json")
+        self._index = None  # source path -> {"file", "size", "mtime_ns", "sha256"}
+        self._verified = {}  # local path -> (size, mtime) whose checksum was checked this run
+        self._lock = threading.Lock()
+        self._watched = set()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _entries(self):
+        if self._index is None:
+            try:
+                with open(self._index_path, encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        temp_path = f"{self._index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(temp_path, self._index_path)
+
+    def _verify(self, local_path, sha256):
+        """Return True when the local copy still has the recorded checksum (hashed once per change)."""
+        try:
+            stat = os.stat(local_path)
+        except OSError:
+            return False
+        key = (stat.st_size, stat.st_mtime_ns)
+        if self._verified.get(local_path) == key:
+            return True
+        if _file_digest(local_path) != sha256:
+            log.warning("Local copy %s does not match its checksum", local_path)
+            return False
+        self._verified[local_path] = key
+        return True
+
+    def _copy(self, source_path, key, stat):
+        os.makedirs(self.mirror_directory, exist_ok=True)
+        folder = hashlib.sha1(os.path.dirname(key).encode("utf-8")).hexdigest()[:8]
+        local_path = os.path.join(self.mirror_directory, f"{folder}_{os.path.basename(key)}")
+        temp_path = f"{local_path}.{os.getpid()}.tmp"
+        try:
+            sha256 = _copy_with_digest(source_path, temp_path)
+            after = os.stat(source_path)
+            if (after.st_size, after.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                raise OSError(f"{source_path} changed while it was being copied")
+            os.replace(temp_path, local_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        local_stat = os.stat(local_path)
+        self._verified[local_path] = (local_stat.st_size, local_stat.st_mtime_ns)
+        self._entries()[key] = {"file": os.path.basename(local_path), "size": stat.st_size,
+                                "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        self._save_index()
+        log.info("Mirrored template %s", source_path)
+        return local_path
+
+    def local_path(self, source_path):
+        """Return a verified local copy of source_path, copying the shared file first if it changed.
+
+        Raises FileNotFoundError when there is neither a shared file nor a good local copy.
+        """
+        key = os.path.abspath(source_path)
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            stat = None
+        with self._lock:
+            entry = self._entries().get(key)
+            local_path = os.path.join(self.mirror_directory, entry["file"]) if entry else None
+            good_copy = local_path is not None and self._verify(local_path, entry["sha256"])
+            if good_copy and (stat is None or (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns)):
+                if stat is None:
+                    log.warning("Template %s cannot be reached, using the local copy", source_path)
+                return local_path
+            if stat is None:
+                raise FileNotFoundError(f"No valid template loaded or template not found at {source_path}")
+            try:
+                return self._copy(source_path, key, stat)
+            except OSError as e:
+                if not good_copy:
+                    raise
+                log.warning("Could not refresh %s (%s), using the previous local copy", source_path, e)
+                return local_path
+
+    def watch(self, source_path):
+        """Keep source_path mirrored from a background thread, starting with a refresh now."""
+        self._watched.add(source_path)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name="template-mirror", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            for source_path in list(self._watched):
+                try:
+                    self.local_path(source_path)
+                except OSError as e:
+                    log.warning("Could not mirror template %s: %s", source_path, e)
+            self._wake.wait(self.refresh_seconds)
+
+
+def _copy_atomically(source_path, destination_path):
+    """Copy to a temporary file beside the destination and rename it over the destination."""
+    temp_path = f"{destination_path}.{os.getpid()}.tmp"
+    try:
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, destination_path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class WriteBackQueue:
+    """Copies reports from the local outbox to the shared folder on a writer thread, with retry."""
+
+    def __init__(self, outbox_directory=OUTBOX_DIRECTORY, max_attempts=8, initial_delay=1.0, max_delay=60.0):
+        self.outbox_directory = outbox_directory
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self._pending = {}  # local path -> [destination path, attempts, due time]
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stop = False
+        self._last_prune = None
+
+    def outbox(self):
+        """Return the outbox directory, creating it on first use."""
+        os.makedirs(self.outbox_directory, exist_ok=True)
+        return self.outbox_directory
+
+    def enqueue(self, local_path, destination_directory):
+        """Queue a copy of local_path into destination_directory and return the destination path.
+
+        Queuing a file again before its copy is done replaces the earlier request.
+        """
+        destination_path = os.path.join(destination_directory, os.path.basename(local_path))
+        with open(local_path + PENDING_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump({"destination": destination_path}, f)
+        self._add(local_path, destination_path)
+        return destination_path
+
+    def resume(self):
+        """Queue again every copy that was still pending when the application last closed."""
+        for marker in glob.glob(os.path.join(glob.escape(self.outbox_directory), "*" + PENDING_SUFFIX)):
+            local_path = marker[:-len(PENDING_SUFFIX)]
+            try:
+                with open(marker, encoding="utf-8") as f:
+                    destination_path = json.load(f)["destination"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if os.path.exists(local_path):
+                log.info("Resuming copy of %s to %s", local_path, destination_path)
+                self._add(local_path, destination_path)
+        self.prune()
+
+    def prune(self, max_age=OUTBOX_KEEP_SECONDS):
+        """Remove outbox files older than max_age that belong to no pending copy; returns how many went.
+
+        A report's sidecar files share its name as a prefix, so they stay or go with it.
+        """
+        self._last_prune = time.monotonic()
+        try:
+            entries = list(os.scandir(self.outbox_directory))
+        except OSError:
+            return 0
+        with self._condition:
+            pending = {os.path.basename(local_path) for local_path in self._pending}
+        pending.update(entry.name[:-len(PENDING_SUFFIX)] for entry in entries if entry.name.endswith(PENDING_SUFFIX))
+        cutoff = time.time() - max_age
+        removed = 0
+        for entry in entries:
+            if entry.name.endswith(PENDING_SUFFIX) or any(entry.name.startswith(name) for name in pending):
+                continue
+            try:
+                if not entry.is_file() or entry.stat().st_mtime >= cutoff:
+                    continue
+                os.remove(entry.path)
+            except OSError:
+                continue
+            removed += 1
+        if removed:
+            log.info("Pruned %d delivered file(s) from the outbox", removed)
+        return removed
+
+    def pending(self):
+        with self._condition:
+            return len(self._pending)
+
+    def flush(self, timeout=None):
+        """Wait until every queued copy is done or has given up; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stop(self):
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+
+    def _add(self, local_path, destination_path):
+        with self._condition:
+            self._pending[local_path] = [destination_path, 0, time.monotonic()]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-back", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def _next_due(self):
+        """Wait for the next copy that is due; returns (local path, entry) or None once stopped."""
+        with self._condition:
+            while not self._stop:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                local_path, entry = min(self._pending.items(), key=lambda item: item[1][2])
+                delay = entry[2] - time.monotonic()
+                if delay <= 0:
+                    return local_path, entry
+                self._condition.wait(delay)
+        return None
+
+    def _run(self):
+        while True:
+            due = self._next_due()
+            if due is None:
+                return
+            local_path, entry = due
+            destination_path = entry[0]
+            try:
+                _copy_atomically(local_path, destination_path)
+            except OSError as e:
+                with self._condition:
+                    if self._pending.get(local_path) is not entry:
+                        continue  # queued again meanwhile; the new request takes over
+                    entry[1] += 1
+                    if entry[1] >= self.max_attempts:
+                        # The marker stays, so the next start tries again
+                        log.error("Giving up copying %s to %s for now: %s", local_path, destination_path, e)
+                        del self._pending[local_path]
+                        self._condition.notify_all()
+                    else:
+                        delay = min(self.initial_delay * 2 ** (entry[1] - 1), self.max_delay)
+                        entry[2] = time.monotonic() + delay
+                        log.warning("Could not copy %s to %s (%s), retrying in %.1fs",
+                                    local_path, destination_path, e, delay)
+                continue
+            with self._condition:
+                if self._pending.get(local_path) is entry:
+                    del self._pending[local_path]
+                    try:
+                        os.remove(local_path + PENDING_SUFFIX)
+                    except OSError:
+                        pass
+                    self._condition.notify_all()
+            log.info("Copied %s to %s", os.path.basename(local_path), destination_path)
+            if self._last_prune is None or time.monotonic() - self._last_prune >= OUTBOX_PRUNE_INTERVAL_SECONDS:
+                self.prune()
+
+
+# Shared by every wizard in the process
+TEMPLATE_MIRROR = TemplateMirror()
+WRITE_BACK = WriteBackQueue()
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Keep caches, journals and databases of the test run out of the user's LOCALAPPDATA
+os.environ["LOCALAPPDATA"] = tempfile.mkdtemp(prefix="vna-report-tests-")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,37 @@
+import sqlite3
+
+import batch_report
+from batch_report import main, record_history
+
+ROWS = [{"job_card": "JC1"}, {"job_card": "JC2"}, {"job_card": "JC3"}]
+RESULTS = [{"job_card": row["job_card"], "output_path": f"Report_{row['job_card']}.docx", "error": None}
+           for row in ROWS]
+
+
+class LockedHistory:
+    def __init__(self, fail_after):
+        self.fail_after = fail_after
+        self.recorded = []
+
+    def record_report(self, stored_values, output_path):
+        if len(self.recorded) == self.fail_after:
+            raise sqlite3.OperationalError("database is locked")
+        self.recorded.append(output_path)
+
+
+def test_locked_history_is_logged_not_raised(caplog):
+    history = LockedHistory(fail_after=1)
+
+    assert record_history(ROWS, RESULTS, history) == 1
+    assert "database is locked" in caplog.text
+
+
+def test_batch_exits_cleanly_when_the_history_is_locked(tmp_path, monkeypatch, capsys):
+    manifest = tmp_path / "jobs.json"
+    manifest.write_text('[{"job_card": "JC1"}]')
+    monkeypatch.setattr(batch_report, "run_batch", lambda rows, *args: RESULTS[:1])
+    monkeypatch.setattr(batch_report, "record_history",
+                        lambda rows, results: record_history(rows, results, LockedHistory(fail_after=0)))
+
+    assert main([str(manifest), "--log-level", "ERROR"]) == 0
+    assert "Generated 1/1 reports" in capsys.readouterr().out
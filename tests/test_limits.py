@@ -0,0 +1,47 @@
+import json
+
+import numpy as np
+import pytest
+
+import limits
+from limits import evaluate_measurement, limit_masks, load_connector_limits
+from touchstone import TouchstoneData
+
+STORED_VALUES = {"port_1_connector": "SMA", "port_2_connector": "N"}
+
+
+def write_limits(path, raw):
+    path.write_text(json.dumps(raw))
+    return str(path)
+
+
+def test_no_limits_file_means_no_masks(tmp_path):
+    assert load_connector_limits(str(tmp_path / "missing.json")) == {}
+    assert limit_masks(STORED_VALUES, ["S11", "S21"], {}) == {}
+
+
+def test_masks_come_from_the_limits_file(tmp_path):
+    path = write_limits(tmp_path / "limits.json", {
+        "SMA": {"return_loss": [[0, 6e9, 20.0]], "insertion_loss": [[0, 6e9, 0.5]]},
+        "N": {"insertion_loss": [[0, 6e9, 0.8]]},
+    })
+    connector_limits = load_connector_limits(path)
+
+    masks = limit_masks(STORED_VALUES, ["S11", "S22", "S21"], connector_limits)
+
+    assert masks["S11"] == ("max", [(0.0, 6e9, -20.0)], "SMA")
+    # N has no return-loss mask, so S22 is not judged
+    assert "S22" not in masks
+    assert masks["S21"] == ("min", [(0.0, 6e9, -0.8)], "N/SMA")
+
+
+@pytest.mark.parametrize("raw", [[1, 2], {"SMA": {"return_loss": [[6e9, 1e9, 20.0]]}}, {"SMA": {"vswr": []}}])
+def test_invalid_limits_file_is_ignored(tmp_path, raw):
+    assert load_connector_limits(write_limits(tmp_path / "limits.json", raw)) == {}
+
+
+def test_unconfigured_connector_has_no_summary(tmp_path, monkeypatch):
+    monkeypatch.setattr(limits, "load_connector_limits", lambda: {})
+    frequency = np.linspace(1e9, 2e9, 5)
+    data = TouchstoneData("a.s2p", 2, frequency, {"S11": np.full(5, 0.9 + 0j)}, 50.0, "RI")
+    assert evaluate_measurement(data, STORED_VALUES, "GUK1") == []
@@ -0,0 +1,86 @@
+import functools
+import os
+import threading
+import time
+
+import numpy as np
+from docx import Document
+
+import vna_watcher
+from measurement_store import MeasurementStore
+from report_jobs import SessionCloseJob, SessionOpenJob, record_measurement
+from report_journal import IncrementalReport
+from shared_folder import WriteBackQueue
+from touchstone import TouchstoneData, save_touchstone
+
+
+def make_template(path):
+    doc = Document()
+    doc.add_paragraph("Job card <Job Card p/n>")
+    doc.add_paragraph("<Measurements>")
+    doc.save(path)
+    return path
+
+
+def test_export_still_queued_at_close_reaches_the_report(tmp_path, monkeypatch):
+    template = make_template(str(tmp_path / "Template.docx"))
+    os.makedirs(tmp_path / "out")
+    stored_values = {"job_card": "JC100", "selected_options": {"S11", "S21"}}
+    report = IncrementalReport(template, stored_values, str(tmp_path / "out"), str(tmp_path / "journals"))
+    store = MeasurementStore(str(tmp_path / "spill"))
+
+    # Hold the export in the parser until the session has been handed to the close job
+    loading, release = threading.Event(), threading.Event()
+    load_touchstone = vna_watcher.load_touchstone
+
+    def slow_load(path, selected_options=None):
+        loading.set()
+        release.wait(10)
+        return load_touchstone(path, selected_options)
+
+    monkeypatch.setattr(vna_watcher, "load_touchstone", slow_load)
+    watcher = vna_watcher.VnaExportWatcher(stored_values, functools.partial(record_measurement, report, store),
+                                           directory=str(tmp_path / "exports"), debounce=0.05, poll_interval=0.05)
+    watcher.start()
+    frequency = np.linspace(1e9, 2e9, 11)
+    save_touchstone(TouchstoneData("GUK001", 2, frequency, {"S11": np.full(11, 0.1 + 0j), "S21": np.full(11, 0.9 + 0j)},
+                                   50.0, "RI"), str(tmp_path / "exports" / "GUK001.s2p"))
+    assert loading.wait(10)
+
+    # What close_wizard does: hand the session to the job, then let go of it
+    job = SessionCloseJob(template, watcher, report, store).start()
+    del watcher, report, store
+    release.set()
+    kind, output_path = job.queue.get(timeout=30)
+
+    assert kind == "done"
+    text = "\n".join(paragraph.text for paragraph in Document(output_path).paragraphs)
+    assert "Serial GUK001" in text
+    assert not os.listdir(tmp_path / "journals")
+
+
+class SlowMirror:
+    """A template mirror whose shared folder answers only once released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def local_path(self, source_path):
+        assert self.release.wait(10)
+        return source_path
+
+
+def test_session_closed_while_it_is_still_opening(tmp_path):
+    template = make_template(str(tmp_path / "Template.docx"))
+    outbox = WriteBackQueue(str(tmp_path / "outbox"))
+    mirror = SlowMirror()
+    open_job = SessionOpenJob(template, {"job_card": "JC200"}, template_mirror=mirror, write_back=outbox,
+                              directory=str(tmp_path / "exports")).start()
+    assert open_job.queue.empty()
+
+    close_job = SessionCloseJob(template, open_job=open_job).start()
+    mirror.release.set()
+
+    assert open_job.queue.get(timeout=30) == ("done", None)
+    assert close_job.queue.get(timeout=30) == ("done", None)
+    assert open_job.export_watcher._stop.is_set()
@@ -0,0 +1,58 @@
+import os
+import time
+
+import numpy as np
+
+from report_plots import envelope, prune_plot_cache, render_plots
+
+
+def test_envelope_keeps_the_end_of_the_trace_and_its_extremes():
+    x = np.linspace(0.3, 8.5, 2924)
+    y = np.sin(np.arange(2924) / 7.0)
+    # Extremes in the last third, which a whole number of equal slices used to cut off
+    y[2500] = -40.0
+    y[2923] = 3.0
+
+    out_x, out_y = envelope(x, y, 975)
+
+    assert len(out_x) <= 2 * 975 + 2
+    assert out_x[0] == x[0] and out_x[-1] == x[-1]
+    assert out_y.min() == y.min() and out_y.max() == y.max()
+    assert np.all(np.diff(out_x) >= 0)
+
+
+def test_envelope_leaves_short_traces_alone():
+    x = np.arange(10.0)
+    out_x, out_y = envelope(x, x * 2, 975)
+    assert out_x is x
+
+
+def test_prune_removes_least_recently_used_plots_first(tmp_path):
+    now = time.time()
+    for index, age_h in enumerate([5, 4, 3, 2, 0]):
+        path = tmp_path / f"{index}.png"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (now - age_h * 3600, now - age_h * 3600))
+
+    removed = prune_plot_cache(str(tmp_path), max_bytes=250, keep_s=3600)
+
+    assert removed == 3
+    assert sorted(os.listdir(tmp_path)) == ["3.png", "4.png"]
+
+
+def test_recently_used_plots_survive_pruning(tmp_path):
+    for index in range(3):
+        (tmp_path / f"{index}.png").write_bytes(b"x" * 100)
+
+    assert prune_plot_cache(str(tmp_path), max_bytes=0, keep_s=3600) == 0
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_render_plots_with_a_worker_limit(tmp_path):
+    frequency = np.linspace(1e9, 2e9, 50)
+    parameters = {name: np.full(50, value) for name, value in (("S11", 0.1), ("S21", 0.9), ("S22", 0.2))}
+
+    plots = render_plots(frequency, parameters, str(tmp_path), workers=2)
+
+    assert [name for name, _ in plots] == ["S11", "S21", "S22"]
+    assert all(os.path.getsize(path) > 0 for _, path in plots)
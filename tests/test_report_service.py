@@ -0,0 +1,63 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+from docx import Document
+
+from report_service import BadJobSpec, ReportService, make_server
+
+
+@pytest.fixture
+def service(tmp_path):
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    doc = Document()
+    doc.add_paragraph("Job card <Job Card p/n>")
+    doc.save(str(templates / "Template.docx"))
+    (tmp_path / "outside.s2p").write_text("# HZ S RI R 50\n")
+    service = ReportService(workers=1, max_queue=2, template_directory=str(templates),
+                            output_root=str(tmp_path / "out"))
+    yield service
+    service.shutdown()
+
+
+def test_job_card_cannot_leave_the_output_root(service, tmp_path):
+    job = service.submit({"job_card": "../../JC/1", "template": "Template.docx", "output_dir": "reports"})
+    job.report_job.future.result(timeout=60)
+    job = service.get(job.id)
+
+    assert job.status == "done", job.error
+    assert os.path.dirname(job.output_path) == os.path.realpath(tmp_path / "out" / "reports")
+    assert os.path.basename(job.output_path) == "Report_.._.._JC_1.docx"
+
+
+@pytest.mark.parametrize("spec", [
+    {"template": "../Template.docx"},
+    {"template": "Template.docx", "output_dir": "../elsewhere"},
+    {"template": "Template.docx", "measurement_file": "../outside.s2p"},
+    {"user_name": "nobody"},
+])
+def test_paths_outside_the_roots_are_refused(service, spec):
+    with pytest.raises(BadJobSpec) as refused:
+        service.submit(dict(spec, job_card="JC2"))
+    assert ".." not in str(refused.value)
+
+
+def test_refusal_does_not_echo_the_path(service):
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_address[1]}/jobs", method="POST",
+            data=json.dumps({"job_card": "JC3", "template": "Template.docx", "output_dir": "/secret/place"}).encode(),
+            headers={"Content-Type": "application/json"})
+        with pytest.raises(urllib.error.HTTPError) as answer:
+            urllib.request.urlopen(request, timeout=10)
+        assert answer.value.code == 400
+        assert "secret" not in answer.value.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,25 @@
+import numpy as np
+from docx.oxml.ns import qn
+
+from report_tables import build_measurement_table
+
+
+def rows_of(table):
+    return table.findall(qn("w:tr"))
+
+
+def test_every_row_has_cells():
+    frequency = np.linspace(1e9, 2e9, 11)
+    table = build_measurement_table(frequency, {"S11": np.full(11, 0.5 + 0j)}, max_rows=5)
+
+    rows = rows_of(table)
+    assert len(rows) == 1 + 5
+    assert all(len(row.findall(qn("w:tc"))) == 2 for row in rows)
+
+
+def test_zero_rows_gives_the_header_only():
+    table = build_measurement_table(np.empty(0), {"S11": np.empty(0, dtype=complex)})
+
+    rows = rows_of(table)
+    assert len(rows) == 1
+    assert len(rows[0].findall(qn("w:tc"))) == 2
@@ -0,0 +1,24 @@
+import os
+import time
+
+from shared_folder import PENDING_SUFFIX, WriteBackQueue
+
+
+def touch(path, age_s):
+    path.write_bytes(b"x")
+    then = time.time() - age_s
+    os.utime(path, (then, then))
+
+
+def test_prune_removes_only_old_delivered_reports(tmp_path):
+    day = 24 * 3600
+    touch(tmp_path / "Report_1.docx", 10 * day)
+    touch(tmp_path / "Report_1.docx.manifest.json", 10 * day)
+    touch(tmp_path / "Report_2.docx", 10 * day)
+    touch(tmp_path / ("Report_2.docx" + PENDING_SUFFIX), 10 * day)
+    touch(tmp_path / "Report_3.docx", 1 * day)
+
+    removed = WriteBackQueue(str(tmp_path)).prune(max_age=7 * day)
+
+    assert removed == 2
+    assert sorted(os.listdir(tmp_path)) == ["Report_2.docx", "Report_2.docx" + PENDING_SUFFIX, "Report_3.docx"]
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import touchstone
+from touchstone import TouchstoneData, load_touchstone, save_touchstone
+
+
+def save(path, nports, points=50):
+    frequency = np.linspace(1e9, 2e9, points)
+    parameters = {f"S{i}{j}": (i + 0.1 * j) * np.exp(1j * frequency / 1e9)
+                  for i in range(1, nports + 1) for j in range(1, nports + 1)}
+    save_touchstone(TouchstoneData("source", nports, frequency, parameters, 50.0, "RI"), path)
+    return frequency, parameters
+
+
+@pytest.mark.parametrize("nports", [1, 2, 4])
+def test_round_trip_across_chunks(tmp_path, monkeypatch, nports):
+    monkeypatch.setattr(touchstone, "PARSE_CHUNK_BYTES", 100)
+    path = str(tmp_path / f"a.s{nports}p")
+    frequency, parameters = save(path, nports)
+
+    data = load_touchstone(path)
+
+    np.testing.assert_allclose(data.frequency, frequency)
+    for name, values in parameters.items():
+        np.testing.assert_allclose(data[name], values, rtol=1e-8)
+
+
+def test_comments_in_the_data_are_skipped(tmp_path):
+    path = str(tmp_path / "a.s2p")
+    save(path, 2, points=3)
+    lines = open(path).read().splitlines()
+    lines[3] += " ! end of first row"
+    lines.insert(4, "! a whole comment line")
+    open(path, "w").write("\n".join(lines) + "\n\n")
+
+    assert len(load_touchstone(path).frequency) == 3
+
+
+def test_malformed_number_is_an_error(tmp_path):
+    path = str(tmp_path / "a.s2p")
+    save(path, 2, points=3)
+    lines = open(path).read().splitlines()
+    lines[-1] = lines[-1].replace(" ", " 0.5x ", 1)
+    open(path, "w").write("\n".join(lines) + "\n")
+
+    with pytest.raises(ValueError, match="malformed"):
+        load_touchstone(path)
+
+
+def test_truncated_row_is_an_error(tmp_path):
+    path = str(tmp_path / "a.s2p")
+    save(path, 2, points=3)
+    lines = open(path).read().splitlines()
+    lines[-1] = lines[-1].rsplit(" ", 1)[0]
+    open(path, "w").write("\n".join(lines) + "\n")
+
+    with pytest.raises(ValueError, match="do not form rows"):
+        load_touchstone(path)
@@ -0,0 +1,191 @@
+"""Touchstone (.s1p/.s2p/.snp) reader and writer for VNA exports.
+
+The file is memory-mapped and the numeric block is parsed by NumPy a few MB of
+whole lines at a time, so the cost is proportional to the file size, no Python
+object is created per point and only one chunk of text is held besides the
+values. A malformed number is an error, not a shortened table. Only the
+S-parameters the user ticked in the wizard are materialised.
+"""
+import mmap
+import os
+import re
+
+import numpy as np
+
+FREQUENCY_UNITS = {"HZ": 1.0, "KHZ": 1e3, "MHZ": 1e6, "GHZ": 1e9}
+DATA_FORMATS = ("RI", "MA", "DB")
+COMMENT_PATTERN = re.compile(rb"![^\r\n]*")
+# Bytes of the mapped numeric block parsed per call to NumPy (extended to the end of a line)
+PARSE_CHUNK_BYTES = 4 << 20
+
+
+class TouchstoneData:
+    """Frequency axis in Hz plus one complex128 array per materialised S-parameter."""
+
+    __slots__ = ("path", "nports", "frequency", "parameters", "reference_impedance", "data_format")
+
+    def __init__(self, path, nports, frequency, parameters, reference_impedance, data_format):
+        self.path = path
+        self.nports = nports
+        self.frequency = frequency
+        self.parameters = parameters
+        self.reference_impedance = reference_impedance
+        self.data_format = data_format
+
+    def __getitem__(self, name):
+        return self.parameters[name]
+
+    def __repr__(self):
+        return (f"TouchstoneData({os.path.basename(self.path)!r}, {self.nports} ports, "
+                f"{len(self.frequency)} points, {sorted(self.parameters)})")
+
+
+def nports_from_path(path):
+    """Return the port count from a .sNp extension."""
+    match = re.search(r"\.s(\d+)p$", path, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Not a Touchstone file extension: {path}")
+    return int(match.group(1))
+
+
+def parse_option_line(line):
+    """Parse '# <unit> <parameter> <format> R <impedance>' into (scale, format, impedance)."""
+    scale, data_format, impedance = FREQUENCY_UNITS["GHZ"], "MA", 50.0
+    tokens = line.lstrip("#").upper().split()
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in FREQUENCY_UNITS:
+            scale = FREQUENCY_UNITS[token]
+        elif token in DATA_FORMATS:
+            data_format = token
+        elif token == "R" and i + 1 < len(tokens):
+            impedance = float(tokens[i + 1])
+            i += 1
+        elif token != "S":
+            raise ValueError(f"Unsupported Touchstone option '{token}' (only S-parameters are read)")
+        i += 1
+    return scale, data_format, impedance
+
+
+def column_of(parameter, nports):
+    """Return the index of the first (real/magnitude) column of Sij after the frequency.
+
+    Two-port files store S11 S21 S12 S22; every other port count is row-major.
+    """
+    i, j = int(parameter[1]) - 1, int(parameter[2]) - 1
+    if i >= nports or j >= nports:
+        raise ValueError(f"{parameter} does not exist in a {nports}-port file")
+    pair = j * nports + i if nports == 2 else i * nports + j
+    return 1 + 2 * pair
+
+
+def to_complex(a, b, data_format):
+    """Convert a pair of column arrays to complex values according to the data format."""
+    if data_format == "RI":
+        return a + 1j * b
+    if data_format == "DB":
+        a = np.power(10.0, a / 20.0)
+    return a * np.exp(1j * np.deg2rad(b))
+
+
+def load_touchstone(path, selected_options=None):
+    """Read a Touchstone v1 file, keeping only the S-parameters in selected_options.
+
+    selected_options is the wizard's set of ticked options (e.g. {"S11", "S21"});
+    None keeps every S-parameter in the file. Options that are not S-parameters
+    (T11/T22 are time-domain views computed on the VNA) are ignored.
+    """
+    nports = nports_from_path(path)
+    every_parameter = [f"S{i}{j}" for i in range(1, nports + 1) for j in range(1, nports + 1)]
+    if selected_options is None:
+        wanted = every_parameter
+    else:
+        wanted = [name for name in every_parameter if name in selected_options]
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Empty Touchstone file: {path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # The header is a handful of comment lines and the option line
+            option_line = "#"
+            data_start = 0
+            while True:
+                line = mm.readline()
+                if not line:
+                    break
+                stripped = line.strip()
+                if stripped and not stripped.startswith((b"!", b"#")):
+                    break
+                if stripped.startswith(b"#"):
+                    option_line = stripped.decode("ascii", "replace")
+                data_start = mm.tell()
+
+            chunks = []
+            start = data_start
+            while start < len(mm):
+                end = mm.find(b"\n", min(start + PARSE_CHUNK_BYTES, len(mm)) - 1)
+                end = len(mm) if end < 0 else end + 1
+                body = mm[start:end]
+                start = end
+                if b"!" in body:
+                    body = COMMENT_PATTERN.sub(b"", body)
+                # fromstring reads blank text as [-1.0]
+                if body.isspace():
+                    continue
+                try:
+                    chunks.append(np.fromstring(body, sep=" "))
+                except ValueError:
+                    raise ValueError(f"{path}: malformed number in the data") from None
+    values = np.concatenate(chunks) if chunks else np.empty(0)
+
+    scale, data_format, impedance = parse_option_line(option_line)
+    columns = 1 + 2 * nports * nports
+    rows = values.size // columns
+    if rows * columns != values.size:
+        raise ValueError(f"{path}: {values.size} values do not form rows of {columns} columns "
+                         "(noise data and Touchstone 2.0 keywords are not supported)")
+    table = values.reshape(rows, columns)
+
+    parameters = {}
+    for name in wanted:
+        column = column_of(name, nports)
+        parameters[name] = to_complex(table[:, column], table[:, column + 1], data_format)
+    return TouchstoneData(path, nports, table[:, 0] * scale, parameters, impedance, data_format)
+
+
+def save_touchstone(data, path):
+    """Write data as a Touchstone v1 file in Hz/RI, replacing path in one rename.
+
+    S-parameters that were not measured are written as zeros. The file is written
+    under a temporary name that is not a .sNp extension first, so the export
+    watcher never sees it half-written.
+    """
+    nports = data.nports
+    every_parameter = [f"S{i}{j}" for i in range(1, nports + 1) for j in range(1, nports + 1)]
+    table = np.zeros((len(data.frequency), 1 + 2 * nports * nports))
+    table[:, 0] = data.frequency
+    for name in every_parameter:
+        if name in data.parameters:
+            column = column_of(name, nports)
+            values = np.asarray(data.parameters[name])
+            table[:, column] = values.real
+            table[:, column + 1] = values.imag
+    # Beyond two ports each frequency is continued with one line per matrix row
+    if nports > 2:
+        row_format = " ".join(["%.12g"] + ["%.9g"] * (2 * nports)) + "\n" + "\n".join(
+            [" ".join(["%.9g"] * (2 * nports))] * (nports - 1))
+    else:
+        row_format = " ".join(["%.12g"] + ["%.9g"] * (table.shape[1] - 1))
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="ascii", newline="\n") as f:
+            f.write(f"! Saved from {data.path}\n")
+            f.write(f"# HZ S RI R {data.reference_impedance:g}\n")
+            np.savetxt(f, table, fmt=row_format)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,205 @@
+"""Levelled logging and timing spans for report generation.
+
+Every module logs through logging.getLogger(__name__); configure_logging() sets
+the level once for the GUI or the batch engine (REPORT_LOG_LEVEL, default INFO).
+
+span(name, **attrs) times a block of work. Tracing is off unless a trace file is
+given (REPORT_TRACE or enable_tracing), and while it is off span() hands back one
+shared do-nothing object, so instrumented code costs a global lookup per span.
+When on, each finished span is appended to the trace file as one JSON line:
+
+    {"name": "save", "ts": <start, epoch us>, "dur": <us>, "pid": ..., "tid": ...,
+     "thread": "report_0", "parent": "generate_report", "report": "<job card>", "args": {...}}
+
+"report" is the job_card of the nearest enclosing span that was given one, so the
+timings of one report can be picked out of a batch. Lines are written with a
+single append, so worker processes can share the file (the setting travels to
+them through the environment). export_chrome_trace() turns the file into the
+Chrome trace format for chrome://tracing or Perfetto:
+
+    python tracing.py trace.jsonl trace.json
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+LOG_FORMAT = "[%(levelname)s] %(message)s"
+LOG_LEVEL_VARIABLE = "REPORT_LOG_LEVEL"
+TRACE_VARIABLE = "REPORT_TRACE"
+# Libraries that are chatty at DEBUG; they only get to say warnings and errors
+QUIET_LOGGERS = ("matplotlib", "PIL", "watchdog")
+
+log = logging.getLogger(__name__)
+
+
+def configure_logging(level=None):
+    """Send log records to stderr at level (a name such as "DEBUG"), else REPORT_LOG_LEVEL or INFO."""
+    level = (level or os.environ.get(LOG_LEVEL_VARIABLE) or "INFO").upper()
+    os.environ[LOG_LEVEL_VARIABLE] = level
+    logging.basicConfig(format=LOG_FORMAT, level=level, force=True)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(logging.getLogger().level, logging.WARNING))
+
+
+class _NullSpan:
+    """Stand-in returned by span() while tracing is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "attrs", "parent", "report", "start_ns", "wall_us")
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        stack = self.tracer.stack()
+        self.parent = stack[-1] if stack else None
+        self.report = self.attrs.get("job_card", self.parent.report if self.parent else None)
+        stack.append(self)
+        self.wall_us = time.time_ns() // 1000
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_us = (time.perf_counter_ns() - self.start_ns) / 1000
+        self.tracer.stack().pop()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self, duration_us)
+        return False
+
+    def set(self, **attrs):
+        """Attach values only known once the work is under way (counts, sizes)."""
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """Appends finished spans to a JSON-lines file."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o644)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def record(self, span, duration_us):
+        event = {
+            "name": span.name,
+            "ts": span.wall_us,
+            "dur": round(duration_us, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "thread": threading.current_thread().name,
+            "parent": span.parent.name if span.parent else None,
+            "report": span.report,
+            "args": span.attrs,
+        }
+        line = (json.dumps(event, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            if self._fd is not None:
+                os.write(self._fd, line)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+_tracer = None
+
+
+def span(name, **attrs):
+    """Return a context manager timing the block under name (a no-op while tracing is off)."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(_tracer, name, attrs)
+
+
+def tracing_enabled():
+    return _tracer is not None
+
+
+def enable_tracing(path):
+    """Start appending spans to path, here and in worker processes started from now on."""
+    global _tracer
+    disable_tracing()
+    _tracer = Tracer(path)
+    os.environ[TRACE_VARIABLE] = os.path.abspath(path)
+    log.info("Tracing report timings to %s", path)
+
+
+def disable_tracing():
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+    os.environ.pop(TRACE_VARIABLE, None)
+
+
+def read_trace(path):
+    """Return the span events recorded in a JSON-lines trace, skipping a torn last line."""
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    return events
+
+
+def export_chrome_trace(jsonl_path, output_path):
+    """Convert a JSON-lines trace to the Chrome trace event format; returns the event count."""
+    events = []
+    names = {}
+    for event in read_trace(jsonl_path):
+        args = dict(event["args"])
+        if event.get("report") is not None:
+            args["report"] = event["report"]
+        events.append({"name": event["name"], "cat": "report", "ph": "X", "ts": event["ts"],
+                       "dur": event["dur"], "pid": event["pid"], "tid": event["tid"], "args": args})
+        names[(event["pid"], event["tid"])] = event.get("thread")
+    for (pid, tid), thread_name in names.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(events)
+
+
+# Worker processes inherit the trace file through the environment
+if os.environ.get(TRACE_VARIABLE):
+    _tracer = Tracer(os.environ[TRACE_VARIABLE])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python tracing.py <trace.jsonl> <chrome trace.json>")
+    print(f"Wrote {export_chrome_trace(sys.argv[1], sys.argv[2])} events to {sys.argv[2]}")
@@ -0,0 +1,266 @@
+"""asyncio SCPI client for the Keysight P5004B (raw socket, port 5025).
+
+Traces are transferred as IEEE 488.2 definite-length blocks of little-endian
+float64 (FORM:DATA REAL,64 with FORM:BORD SWAP), which is several times smaller
+and faster to parse than ASCII. Measurements are addressed by number
+(CALC<ch>:MEAS<n>:...), so one query does not depend on the one before it. That
+lets every trace query for the ticked S-parameters be written to the socket in
+one go, with the replies read back in order: a single round trip instead of
+one per trace.
+
+The VNA software must have its SCPI socket server enabled. vna_simulator.py
+answers the same commands for offline testing.
+
+Usage:
+    python vna_scpi.py recall "C:/Setups/SMA 18GHz.sta"
+    python vna_scpi.py capture GUK12345 --options S11 S21 --state "C:/Setups/SMA 18GHz.sta"
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sys
+
+import numpy as np
+
+from touchstone import TouchstoneData, save_touchstone
+from tracing import configure_logging, span
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5025
+DEFAULT_TIMEOUT = 30.0
+# ASCII replies of long sweeps are one very long line
+READ_LIMIT = 1 << 28
+S_PARAMETER_PATTERN = re.compile(r"^S(\d)(\d)$")
+
+log = logging.getLogger(__name__)
+
+
+class ScpiError(Exception):
+    """The instrument reported an error or replied with something unexpected."""
+
+
+class VnaClient:
+    """One SCPI connection. Use `async with await VnaClient.connect(...)` or call close()."""
+
+    def __init__(self, reader, writer, timeout=DEFAULT_TIMEOUT):
+        self._reader = reader
+        self._writer = writer
+        self.timeout = timeout
+        # Replies are matched to queries by order, so a query and its reads must not interleave
+        self._lock = asyncio.Lock()
+        self.binary = False
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, limit=READ_LIMIT), timeout)
+        return cls(reader, writer, timeout)
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def write(self, *commands):
+        """Send commands, one per line, in a single socket write."""
+        self._writer.write(("\n".join(commands) + "\n").encode("ascii"))
+        await self._writer.drain()
+
+    async def _read_line(self):
+        line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+        if not line:
+            raise ScpiError("Connection closed by the instrument")
+        return line.decode("ascii").strip()
+
+    async def _read_block(self):
+        """Read one definite-length block (#<digits><length><data>) and its line terminator."""
+        head = await asyncio.wait_for(self._reader.readexactly(2), self.timeout)
+        if head[:1] != b"#" or not head[1:2].isdigit() or head[1:2] == b"0":
+            rest = await self._read_line()
+            raise ScpiError(f"Expected a binary block, got {(head.decode('ascii', 'replace') + rest)[:80]!r}")
+        length = int(await asyncio.wait_for(self._reader.readexactly(int(head[1:2])), self.timeout))
+        data = await asyncio.wait_for(self._reader.readexactly(length), self.timeout)
+        await asyncio.wait_for(self._reader.readline(), self.timeout)
+        return data
+
+    async def query(self, command):
+        """Send one query and return its ASCII reply."""
+        async with self._lock:
+            await self.write(command)
+            return await self._read_line()
+
+    async def query_values(self, commands):
+        """Send several queries for numeric data at once and return one float64 array per query."""
+        async with self._lock:
+            await self.write(*commands)
+            replies = []
+            for _ in commands:
+                if self.binary:
+                    replies.append(np.frombuffer(await self._read_block(), dtype="<f8"))
+                else:
+                    replies.append(np.array((await self._read_line()).split(","), dtype=np.float64))
+            return replies
+
+    async def check_errors(self):
+        """Drain the error queue, raising ScpiError if it held anything."""
+        errors = []
+        while True:
+            reply = await self.query("SYST:ERR?")
+            code, _, message = reply.partition(",")
+            if int(code) == 0:
+                break
+            errors.append(f"{int(code)} {message.strip(chr(34))}")
+        if errors:
+            raise ScpiError("; ".join(errors))
+
+    async def identify(self):
+        return await self.query("*IDN?")
+
+    async def set_binary(self, binary=True):
+        """Switch trace transfers to little-endian REAL,64 blocks (or back to ASCII)."""
+        if binary:
+            await self.write("FORM:DATA REAL,64", "FORM:BORD SWAP")
+        else:
+            await self.write("FORM:DATA ASC,0")
+        self.binary = binary
+
+    async def recall_state(self, path):
+        """Load a setup (.sta) stored on the VNA PC and wait for it to be applied."""
+        with span("vna_recall", path=os.path.basename(path)):
+            await self.write(f'MMEM:LOAD "{path}"')
+            await self.query("*OPC?")
+            await self.check_errors()
+        log.info("Recalled VNA setup %s", path)
+
+    async def measurements(self, channel=1):
+        """Return {parameter: measurement number} for the measurements on a channel."""
+        catalog = (await self.query(f"SYST:MEAS:CAT? {channel}")).strip('"')
+        numbers = [int(n) for n in catalog.split(",") if n.strip()]
+        async with self._lock:
+            await self.write(*(f"CALC{channel}:MEAS{n}:PAR?" for n in numbers))
+            parameters = [(await self._read_line()).strip('"').upper() for _ in numbers]
+        return dict(zip(parameters, numbers))
+
+    async def acquire(self, parameters, channel=1, sweep=True, pipelined=True):
+        """Take a sweep and return TouchstoneData with one complex trace per S-parameter.
+
+        Parameters without a measurement in the recalled setup are added to the
+        channel. Names that are not S-parameters (T11/T22 time-domain views) are
+        skipped. pipelined=False queries the traces one round trip at a time,
+        which is only useful for comparison.
+        """
+        wanted = sorted(p for p in parameters if S_PARAMETER_PATTERN.match(p))
+        if not wanted:
+            raise ValueError("No S-parameters to acquire")
+        with span("vna_acquire", parameters=len(wanted)) as acquisition:
+            numbers = await self.measurements(channel)
+            missing = [p for p in wanted if p not in numbers]
+            if missing:
+                next_number = max(numbers.values(), default=0) + 1
+                for offset, parameter in enumerate(missing):
+                    numbers[parameter] = next_number + offset
+                    await self.write(f'CALC{channel}:MEAS{numbers[parameter]}:DEF "{parameter}"')
+                await self.check_errors()
+            if sweep:
+                await self.write(f"SENS{channel}:SWE:MODE SING")
+                await self.query("*OPC?")
+
+            queries = [f"CALC{channel}:MEAS{numbers[wanted[0]]}:X?"]
+            queries += [f"CALC{channel}:MEAS{numbers[p]}:DATA:SDATA?" for p in wanted]
+            if pipelined:
+                replies = await self.query_values(queries)
+            else:
+                replies = [(await self.query_values([query]))[0] for query in queries]
+            frequency = replies[0]
+            traces = {}
+            for parameter, values in zip(wanted, replies[1:]):
+                traces[parameter] = values[0::2] + 1j * values[1::2]
+            acquisition.set(points=len(frequency))
+        nports = max(max(int(p[1]), int(p[2])) for p in wanted)
+        return TouchstoneData(f"{self._peer()}/CH{channel}", nports, frequency, traces, 50.0, "RI")
+
+    def _peer(self):
+        host, port = self._writer.get_extra_info("peername")[:2]
+        return f"scpi://{host}:{port}"
+
+
+def _run(coroutine):
+    """Run a coroutine to completion, reporting a timeout as ScpiError."""
+    try:
+        return asyncio.run(coroutine)
+    except asyncio.TimeoutError:
+        raise ScpiError("The instrument did not answer in time") from None
+
+
+async def _recall(path, host, port, timeout):
+    async with await VnaClient.connect(host, port, timeout) as client:
+        await client.recall_state(path)
+
+
+def recall_state_file(path, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT):
+    """Blocking wrapper around VnaClient.recall_state for the Tk thread and scripts."""
+    _run(_recall(path, host, port, timeout))
+
+
+async def _capture(serial, options, directory, state, host, port, timeout):
+    async with await VnaClient.connect(host, port, timeout) as client:
+        log.info("Connected to %s", await client.identify())
+        if state:
+            await client.recall_state(state)
+        await client.set_binary()
+        data = await client.acquire(options)
+    path = os.path.join(directory, f"{serial}.s{data.nports}p")
+    save_touchstone(data, path)
+    return path
+
+
+def capture_to_export_folder(serial, options, directory=None, state=None, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                             timeout=DEFAULT_TIMEOUT):
+    """Sweep, pull the ticked S-parameters and save them as <serial>.sNp in the export folder.
+
+    The export watcher picks the file up like any export saved on the VNA.
+    """
+    if directory is None:
+        from vna_watcher import EXPORT_DIRECTORY
+        directory = EXPORT_DIRECTORY
+    os.makedirs(directory, exist_ok=True)
+    return _run(_capture(serial, options, directory, state, host, port, timeout))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive the VNA over SCPI.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    commands = parser.add_subparsers(dest="command", required=True)
+    recall = commands.add_parser("recall", help="load a setup (.sta) on the VNA")
+    recall.add_argument("state")
+    capture = commands.add_parser("capture", help="sweep and save the traces as <serial>.sNp")
+    capture.add_argument("serial")
+    capture.add_argument("--options", nargs="+", default=["S11", "S21", "S12", "S22"])
+    capture.add_argument("--state", default=None, help="setup to recall first")
+    capture.add_argument("--directory", default=None, help="where to save (default: the VNA export folder)")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    try:
+        if args.command == "recall":
+            recall_state_file(args.state, args.host, args.port, args.timeout)
+        else:
+            path = capture_to_export_folder(args.serial, args.options, args.directory, args.state, args.host,
+                                            args.port, args.timeout)
+            print(f"Saved {path}")
+    except (OSError, ScpiError) as e:
+        log.error("%s", e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
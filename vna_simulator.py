@@ -0,0 +1,230 @@
+"""Local stand-in for the VNA's SCPI socket server, for offline testing and benchmarks.
+
+Answers the subset of commands vna_scpi.py sends, in short or long form, with
+smooth synthetic traces. Commands may be sent several per line (separated by
+';') and several lines at a time; replies go out in order, as on the
+instrument. Unknown commands queue -113 "Undefined header" on SYST:ERR?.
+
+Usage:
+    python vna_simulator.py --port 5025 --points 1601
+    python vna_simulator.py --port 0    # prints the port it picked
+"""
+import argparse
+import asyncio
+import logging
+import re
+import sys
+
+import numpy as np
+
+from tracing import configure_logging
+from vna_scpi import DEFAULT_PORT
+
+DEFAULT_POINTS = 1601
+START_HZ = 10e6
+STOP_HZ = 18e9
+
+log = logging.getLogger(__name__)
+
+
+def _pattern(command):
+    """Turn 'CALC<n>:MEAS<n>:PAR?' style notation into a regex accepting short and long forms."""
+    forms = {
+        "CALC": "CALC(?:ULATE)?", "MEAS": "MEAS(?:URE)?", "PAR": "PAR(?:AMETER)?", "DEF": "DEF(?:INE)?",
+        "SYST": "SYST(?:EM)?", "ERR": "ERR(?:OR)?(?::NEXT)?", "CAT": "CAT(?:ALOG)?", "MMEM": "MMEM(?:ORY)?",
+        "LOAD": "LOAD(?::(?:STAT|STATE|CSAR|CSARCHIVE))?", "FORM": "FORM(?:AT)?", "BORD": "BORD(?:ER)?",
+        "SENS": "SENS(?:E)?", "SWE": "SWE(?:EP)?", "POIN": "POIN(?:TS)?", "MODE": "MODE",
+        "DATA": "DATA", "SDATA": "SDATA", "X": "X(?::VAL(?:UES)?)?",
+    }
+    parts = []
+    for part in command.rstrip("?").split(":"):
+        name, numbered = part.replace("<n>", ""), "<n>" in part
+        parts.append(forms.get(name, re.escape(name)) + (r"(\d*)" if numbered else ""))
+    return re.compile("^" + ":".join(parts) + (r"\?" if command.endswith("?") else "") + r"(?:\s+(.*))?$",
+                      re.IGNORECASE)
+
+
+class SimulatedVna:
+    """Instrument state shared by every connection."""
+
+    def __init__(self, points=DEFAULT_POINTS, sweep_seconds_per_point=0.0):
+        self.points = points
+        self.sweep_seconds_per_point = sweep_seconds_per_point
+        self.measurements = {1: "S11", 2: "S21"}
+        self.binary = False
+        self.swapped = False
+        self.errors = []
+        self.state_file = None
+        self._traces = {}
+        self.handlers = [(_pattern(command), handler) for command, handler in (
+            ("*IDN?", self.identify), ("*OPC?", self.operation_complete), ("*CLS", self.clear), ("*RST", self.reset),
+            ("SYST:ERR?", self.next_error), ("MMEM:LOAD", self.load_state),
+            ("FORM:DATA", self.set_format), ("FORM:BORD", self.set_byte_order),
+            ("SENS<n>:SWE:MODE", self.sweep), ("SENS<n>:SWE:POIN", self.set_points),
+            ("SENS<n>:SWE:POIN?", self.get_points), ("SYST:MEAS:CAT?", self.catalog),
+            ("CALC<n>:MEAS<n>:PAR?", self.parameter), ("CALC<n>:MEAS<n>:DEF", self.define),
+            ("CALC<n>:MEAS<n>:X?", self.x_values), ("CALC<n>:MEAS<n>:DATA:SDATA?", self.sdata),
+        )]
+
+    def frequency(self):
+        return np.linspace(START_HZ, STOP_HZ, self.points)
+
+    def trace(self, parameter):
+        """Synthetic response: matched reflections, lossy transmission with a linear phase."""
+        key = (parameter, self.points)
+        if key not in self._traces:
+            f = self.frequency() / 1e9
+            if parameter[1] == parameter[2]:
+                magnitude = 0.02 + 0.01 * f + 0.01 * np.sin(f * 3.0 + int(parameter[1]))
+            else:
+                magnitude = 10 ** (-(0.05 + 0.04 * np.sqrt(f)) / 20)
+            self._traces[key] = magnitude * np.exp(-1j * 2 * np.pi * f * 0.35)
+        return self._traces[key]
+
+    def error(self, code, message):
+        self.errors.append(f'{code},"{message}"')
+
+    def encode(self, values):
+        """Format an array as the current FORM:DATA would."""
+        values = np.asarray(values, dtype=np.float64)
+        if not self.binary:
+            return (",".join(f"{v:.12g}" for v in values) + "\n").encode("ascii")
+        data = values.astype("<f8" if self.swapped else ">f8").tobytes()
+        length = str(len(data))
+        return f"#{len(length)}{length}".encode("ascii") + data + b"\n"
+
+    # Handlers take the numeric suffixes and the argument and return reply bytes or None
+
+    def identify(self, argument):
+        return b"Keysight Technologies,P5004B,SIMULATOR,A.15.00\n"
+
+    def operation_complete(self, argument):
+        return b"1\n"
+
+    def clear(self, argument):
+        self.errors.clear()
+
+    def reset(self, argument):
+        self.measurements = {1: "S11"}
+        self.binary = self.swapped = False
+
+    def next_error(self, argument):
+        return ((self.errors.pop(0) if self.errors else '+0,"No error"') + "\n").encode("ascii")
+
+    def load_state(self, argument):
+        if not argument:
+            self.error(-109, "Missing parameter")
+            return
+        self.state_file = argument.strip('"')
+        self.measurements = {1: "S11", 2: "S21", 3: "S12", 4: "S22"}
+        log.info("Recalled %s", self.state_file)
+
+    def set_format(self, argument):
+        kind = (argument or "").split(",")[0].strip().upper()
+        if kind not in ("ASC", "ASCII", "REAL"):
+            self.error(-224, "Illegal parameter value")
+            return
+        self.binary = kind == "REAL"
+
+    def set_byte_order(self, argument):
+        self.swapped = (argument or "").strip().upper() in ("SWAP", "SWAPPED")
+
+    async def sweep(self, channel, argument):
+        if self.sweep_seconds_per_point:
+            await asyncio.sleep(self.sweep_seconds_per_point * self.points)
+
+    def set_points(self, channel, argument):
+        self.points = int(argument)
+
+    def get_points(self, channel, argument):
+        return f"{self.points}\n".encode("ascii")
+
+    def catalog(self, argument):
+        return f'"{",".join(str(n) for n in sorted(self.measurements))}"\n'.encode("ascii")
+
+    def _measurement(self, number):
+        parameter = self.measurements.get(int(number or 1))
+        if parameter is None:
+            self.error(-114, "Header suffix out of range")
+        return parameter
+
+    def parameter(self, channel, number, argument):
+        parameter = self._measurement(number)
+        return f'"{parameter or ""}"\n'.encode("ascii")
+
+    def define(self, channel, number, argument):
+        self.measurements[int(number or 1)] = (argument or "S11").strip('"').upper()
+
+    def x_values(self, channel, number, argument):
+        return self.encode(self.frequency())
+
+    def sdata(self, channel, number, argument):
+        parameter = self._measurement(number)
+        trace = self.trace(parameter) if parameter else np.zeros(self.points, dtype=complex)
+        interleaved = np.empty(2 * len(trace))
+        interleaved[0::2], interleaved[1::2] = trace.real, trace.imag
+        return self.encode(interleaved)
+
+    async def execute(self, command):
+        """Run one command and return its reply bytes (or None)."""
+        command = command.strip().lstrip(":")
+        if not command:
+            return None
+        for pattern, handler in self.handlers:
+            match = pattern.match(command)
+            if match:
+                reply = handler(*match.groups())
+                if asyncio.iscoroutine(reply):
+                    reply = await reply
+                return reply
+        self.error(-113, "Undefined header")
+        return None
+
+    async def serve(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for command in line.decode("ascii", "replace").split(";"):
+                    reply = await self.execute(command)
+                    if reply is not None:
+                        writer.write(reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def start_simulator(host="127.0.0.1", port=DEFAULT_PORT, **kwargs):
+    """Start a simulator and return (asyncio server, SimulatedVna). Port 0 picks a free port."""
+    vna = SimulatedVna(**kwargs)
+    server = await asyncio.start_server(vna.serve, host, port)
+    return server, vna
+
+
+async def _serve_forever(host, port, points, sweep_seconds_per_point):
+    server, _ = await start_simulator(host, port, points=points, sweep_seconds_per_point=sweep_seconds_per_point)
+    print(server.sockets[0].getsockname()[1], flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the VNA's SCPI socket server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 picks a free port and prints it")
+    parser.add_argument("--points", type=int, default=DEFAULT_POINTS)
+    parser.add_argument("--sweep-time-per-point", type=float, default=0.0, help="seconds a sweep takes per point")
+    args = parser.parse_args(argv)
+    configure_logging()
+    try:
+        asyncio.run(_serve_forever(args.host, args.port, args.points, args.sweep_time_per_point))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Watch the VNA export folder and feed each new Touchstone file into the active job card.
+
+Uses watchdog (inotify on Linux, ReadDirectoryChangesW on Windows) when it is
+installed and falls back to polling the folder otherwise. A file is only picked
+up once its size and mtime have stopped changing for the debounce period, so
+half-written exports are never parsed. Parsing runs on a small thread pool; when
+the pool and its queue are full the watcher waits instead of buffering without
+limit, which keeps a burst of exports from eating memory or the GUI thread.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from report_engine import TEMPLATE_DIRECTORY
+from touchstone import load_touchstone
+from tracing import span
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+EXPORT_DIRECTORY = os.path.join(TEMPLATE_DIRECTORY, "VNA Exports")
+EXPORT_EXTENSIONS = (".s1p", ".s2p", ".s3p", ".s4p")
+
+log = logging.getLogger(__name__)
+
+
+def serial_from_path(path):
+    """Return the GUK serial number an export was saved under (its file name without extension)."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class _EventHandler(FileSystemEventHandler):
+    """Forward watchdog events for export files to the watcher."""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.touch(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.touch(event.dest_path)
+
+
+class VnaExportWatcher:
+    """Long-running watcher that hands each settled export to on_measurement.
+
+    on_measurement(job_card, serial, path, data) is called from a worker thread
+    with the parsed TouchstoneData; GUI callers must marshal it back to Tk.
+    The job card is read from stored_values when the file first appears, so it
+    always belongs to the job card that was active while it was being saved.
+    """
+
+    def __init__(self, stored_values, on_measurement, directory=EXPORT_DIRECTORY, workers=2, max_pending=16,
+                 debounce=1.0, poll_interval=0.5):
+        self.stored_values = stored_values
+        self.on_measurement = on_measurement
+        self.directory = directory
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vna-export")
+        # One slot per file being parsed or waiting to be parsed
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._candidates = {}  # path -> [(size, mtime), last change time, job card]
+        self._seen = {}  # path -> (size, mtime) of files already handed on
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._observer = None
+
+    def start(self):
+        """Start watching. Files already in the folder are ignored."""
+        os.makedirs(self.directory, exist_ok=True)
+        for path, stat in self._scan():
+            self._seen[path] = stat
+
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), self.directory, recursive=False)
+            self._observer.start()
+            log.info("Watching %s for VNA exports (file system events)", self.directory)
+        else:
+            self._threads.append(threading.Thread(target=self._poll_loop, name="vna-export-poll", daemon=True))
+            log.info("Watching %s for VNA exports (polling)", self.directory)
+        self._threads.append(threading.Thread(target=self._settle_loop, name="vna-export-settle", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, wait=True):
+        """Stop watching; with wait, let files already queued finish parsing."""
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        for thread in self._threads:
+            thread.join()
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def touch(self, path):
+        """Note that an export file was created or changed."""
+        if not path.lower().endswith(EXPORT_EXTENSIONS):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._candidates.pop(path, None)
+            return
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if self._seen.get(path) == key:
+                return
+            candidate = self._candidates.get(path)
+            if candidate is None:
+                self._candidates[path] = [key, time.monotonic(), self.stored_values.get("job_card")]
+            elif candidate[0] != key:
+                candidate[0] = key
+                candidate[1] = time.monotonic()
+
+    def _scan(self):
+        """Yield (path, (size, mtime)) for every export file in the folder."""
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(EXPORT_EXTENSIONS):
+                stat = entry.stat()
+                yield entry.path, (stat.st_size, stat.st_mtime_ns)
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            for path, _ in self._scan():
+                self.touch(path)
+
+    def _settle_loop(self):
+        """Hand on files whose size and mtime have not changed for the debounce period."""
+        while not self._stop.wait(min(self.debounce / 4, 0.25)):
+            now = time.monotonic()
+            with self._lock:
+                ready = [(path, candidate) for path, candidate in self._candidates.items()
+                         if now - candidate[1] >= self.debounce]
+            for path, (key, _, job_card) in ready:
+                self.touch(path)  # re-stat: a writer may have appended since the last event
+                with self._lock:
+                    candidate = self._candidates.get(path)
+                    if candidate is None or candidate[0] != key or key[0] == 0:
+                        continue
+                    del self._candidates[path]
+                    self._seen[path] = key
+                # Blocks when the pool and queue are full; this is the backpressure
+                while not self._slots.acquire(timeout=0.5):
+                    if self._stop.is_set():
+                        return
+                future = self._executor.submit(self._process, path, job_card)
+                future.add_done_callback(lambda _: self._slots.release())
+
+    def _process(self, path, job_card):
+        serial = serial_from_path(path)
+        selected_options = self.stored_values.get("selected_options") or None
+        try:
+            with span("touchstone_load", job_card=job_card, serial=serial):
+                data = load_touchstone(path, selected_options)
+        except Exception as e:
+            log.error("Could not read VNA export %s: %s", path, e)
+            return
+        if len(data.frequency) == 0:
+            # Header written but no data yet; the next change to the file brings it back
+            return
+        log.debug("Parsed %s for job card %s: %s", serial, job_card, data)
+        try:
+            self.on_measurement(job_card, serial, path, data)
+        except Exception as e:
+            log.error("Could not add %s to job card %s: %s", serial, job_card, e)